@@ -1,12 +1,34 @@
-﻿from fastapi import Depends
+﻿from fastapi import Depends, Request
 
 from app.core.config import Settings, get_settings
 from app.core.security import AuthenticatedUser, get_current_user, require_role
+from app.services.answer_jobs import AnswerJobQueue
+from app.services.ingest_jobs import IngestJobManager
+from app.services.rag import RAGService
 from app.services.supabase import SupabaseService
 
 
-def get_supabase_service(settings: Settings = Depends(get_settings)) -> SupabaseService:
-    return SupabaseService(settings)
+def get_supabase_service(request: Request, settings: Settings = Depends(get_settings)) -> SupabaseService:
+    return SupabaseService(
+        settings,
+        client=request.app.state.supabase_http,
+        question_cache=request.app.state.question_cache,
+    )
+
+
+def get_rag_service(request: Request) -> RAGService:
+    """Return the RAG engine created once by the application lifespan."""
+    return request.app.state.rag_service
+
+
+def get_answer_jobs(request: Request) -> AnswerJobQueue:
+    """Return the background AI answer queue started by the application lifespan."""
+    return request.app.state.answer_jobs
+
+
+def get_ingest_jobs(request: Request) -> IngestJobManager:
+    """Return the background ingestion job manager started by the application lifespan."""
+    return request.app.state.ingest_jobs
 
 
 CurrentUser = AuthenticatedUser
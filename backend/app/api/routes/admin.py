@@ -1,12 +1,19 @@
 ﻿from __future__ import annotations
 
-from fastapi import APIRouter, Depends, Path, UploadFile, status
+import json
+from collections.abc import AsyncIterator
+
+from fastapi import APIRouter, Depends, Path, Query, Request, UploadFile, status
+from fastapi.responses import StreamingResponse
 
 from app.api import deps
-from app.core.config import Settings, get_settings
 from app.core.security import AuthenticatedUser
 from app.schemas.document import DocumentCreate, DocumentResponse
-from app.schemas.lawyer import LawyerProfileResponse, LawyerStatusUpdate
+from app.schemas.ingest_job import IngestJobResponse
+from app.schemas.lawyer import LawyerProfileResponse, LawyerStatusBulkUpdate, LawyerStatusUpdate
+from app.services.backfill import AnswerBackfill
+from app.services.ingest_jobs import IngestJobManager
+from app.services.ingestion import IngestMode
 from app.services.rag import RAGService
 from app.services.supabase import SupabaseService
 
@@ -38,42 +45,118 @@ async def update_lawyer_status(
     return LawyerProfileResponse.model_validate(updated)
 
 
-@router.post("/documents/ingest", status_code=status.HTTP_202_ACCEPTED)
+@router.put("/lawyers/status", response_model=list[LawyerProfileResponse])
+async def update_lawyer_statuses(
+    payload: LawyerStatusBulkUpdate,
+    admin: AuthenticatedUser = Depends(deps.admin_user),  # noqa: ARG001 ensures admin auth
+    supabase: SupabaseService = Depends(deps.get_supabase_service),
+) -> list[LawyerProfileResponse]:
+    """Approve/reject many lawyers at once; unknown user ids are skipped."""
+    updated = await supabase.update_lawyer_statuses(
+        [str(user_id) for user_id in payload.user_ids],
+        status_value=payload.status,
+        balance_override=payload.reset_balance,
+    )
+    return [LawyerProfileResponse.model_validate(profile) for profile in updated]
+
+
+@router.get("/answer-cache/stats")
+async def get_answer_cache_stats(
+    admin: AuthenticatedUser = Depends(deps.admin_user),  # noqa: ARG001 ensures admin auth
+    rag_service: RAGService = Depends(deps.get_rag_service),
+) -> dict[str, int | float]:
+    cache = rag_service.answer_cache
+    return {**cache.stats.as_dict(), "entries": len(cache)}
+
+
+@router.get("/answer-coalescing/stats")
+async def get_answer_coalescing_stats(
+    admin: AuthenticatedUser = Depends(deps.admin_user),  # noqa: ARG001 ensures admin auth
+    rag_service: RAGService = Depends(deps.get_rag_service),
+) -> dict[str, int | float]:
+    flights = rag_service.answer_flights
+    return {**flights.stats.as_dict(), "in_flight": len(flights)}
+
+
+@router.get("/openai/stats")
+async def get_openai_governor_stats(
+    admin: AuthenticatedUser = Depends(deps.admin_user),  # noqa: ARG001 ensures admin auth
+    rag_service: RAGService = Depends(deps.get_rag_service),
+) -> dict[str, int | float | dict[str, int]]:
+    governor = rag_service.openai_governor
+    return {**governor.stats.as_dict(), "queue_depths": governor.queue_depths()}
+
+
+@router.post("/documents/ingest", response_model=IngestJobResponse, status_code=status.HTTP_202_ACCEPTED)
 async def ingest_document_pdf(
     file: UploadFile,
     document_id: str,
+    mode: IngestMode = Query(
+        "full",
+        description="`incremental` re-embeds only chunks whose content changed since the last ingest",
+    ),
+    admin: AuthenticatedUser = Depends(deps.dev_admin_user),  # 🧪 개발용: 인증 생략
+    ingest_jobs: IngestJobManager = Depends(deps.get_ingest_jobs),
+) -> IngestJobResponse:
+    """
+    Queue a PDF document for ingestion into the vector store for RAG.
+
+    The upload is spooled to disk and a background job parses, splits, embeds and stores it.
+    Poll ``GET /admin/ingest-jobs/{job_id}`` for progress.
+    """
+    job = await ingest_jobs.submit(file, document_id, admin.id, mode=mode)
+    return IngestJobResponse.model_validate(job)
+
+
+@router.get("/ingest-jobs/{job_id}", response_model=IngestJobResponse)
+async def get_ingest_job(
+    job_id: str = Path(..., description="Ingest job identifier"),
+    admin: AuthenticatedUser = Depends(deps.dev_admin_user),  # 🧪 개발용: 인증 생략
+    supabase: SupabaseService = Depends(deps.get_supabase_service),
+) -> IngestJobResponse:
+    job = await supabase.fetch_ingest_job(job_id)
+    return IngestJobResponse.model_validate(job)
+
+
+@router.post("/ingest-jobs/{job_id}/resume", response_model=IngestJobResponse, status_code=status.HTTP_202_ACCEPTED)
+async def resume_ingest_job(
+    job_id: str = Path(..., description="Ingest job identifier"),
     admin: AuthenticatedUser = Depends(deps.dev_admin_user),  # 🧪 개발용: 인증 생략
-    settings: Settings = Depends(get_settings),
-) -> dict[str, str | int]:
+    ingest_jobs: IngestJobManager = Depends(deps.get_ingest_jobs),
+) -> IngestJobResponse:
+    job = await ingest_jobs.resume(job_id)
+    return IngestJobResponse.model_validate(job)
+
+
+@router.post("/ai-answers/backfill")
+async def backfill_ai_answers(
+    request: Request,
+    admin: AuthenticatedUser = Depends(deps.admin_user),  # noqa: ARG001 ensures admin auth
+    rag_service: RAGService = Depends(deps.get_rag_service),
+    supabase: SupabaseService = Depends(deps.get_supabase_service),
+) -> StreamingResponse:
     """
-    Ingest a PDF document into the vector store for RAG.
-    
-    This endpoint:
-    1. Saves the uploaded PDF temporarily
-    2. Splits it into chunks
-    3. Generates embeddings
-    4. Stores embeddings in Supabase vector store
+    Regenerate ``ai_answer`` for the question ids streamed in the request body.
+
+    The body holds one question id per line and is consumed as it arrives; the response is
+    NDJSON with a progress snapshot after every bulk write, the last line being the total.
     """
-    import tempfile
-    from pathlib import Path as FilePath
-    
-    # Save uploaded file temporarily
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp_file:
-        content = await file.read()
-        tmp_file.write(content)
-        tmp_path = tmp_file.name
-    
-    try:
-        # Ingest PDF into vector store
-        rag_service = RAGService(settings)
-        chunk_count = await rag_service.ingest_pdf(tmp_path, document_id)
-        
-        return {
-            "status": "success",
-            "document_id": document_id,
-            "chunks_created": chunk_count,
-            "message": f"Successfully ingested {chunk_count} chunks",
-        }
-    finally:
-        # Clean up temporary file
-        FilePath(tmp_path).unlink(missing_ok=True)
+    backfill = AnswerBackfill(rag_service.settings, rag_service, supabase)
+
+    async def progress_lines() -> AsyncIterator[str]:
+        async for progress in backfill.run(_iter_lines(request)):
+            yield json.dumps(progress.as_dict()) + "\n"
+
+    return StreamingResponse(progress_lines(), media_type="application/x-ndjson")
+
+
+async def _iter_lines(request: Request) -> AsyncIterator[str]:
+    buffer = ""
+    async for block in request.stream():
+        buffer += block.decode()
+        *lines, buffer = buffer.split("\n")
+        for line in lines:
+            if line.strip():
+                yield line.strip()
+    if buffer.strip():
+        yield buffer.strip()
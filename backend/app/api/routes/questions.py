@@ -1,58 +1,169 @@
 ﻿from __future__ import annotations
 
-from fastapi import APIRouter, Depends, HTTPException, Path, status
+import base64
+import binascii
+import json
+import uuid
+from collections.abc import AsyncIterator
+from datetime import datetime
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Path, Query, Response, status
+from fastapi.responses import StreamingResponse
 
 from app.api import deps
-from app.core.config import Settings, get_settings
 from app.core.security import AuthenticatedUser
 from app.schemas.answer import AnswerCreate, AnswerResponse
 from app.schemas.question import QuestionCreate, QuestionResponse
-from app.services.rag import RAGService
-from app.services.supabase import SupabaseService
+from app.services.answer_jobs import AnswerJobQueue, failed_ai_answer, pending_ai_answer
+from app.services.question_cache import etag_matches
+from app.services.supabase import JsonDict, SupabaseService
 
 router = APIRouter(prefix="/questions", tags=["questions"])
 
+# Fields selectable through ``GET /questions?fields=``, mapped to their PostgREST select
+QUESTION_LIST_FIELDS = {
+    "id": "id",
+    "user_id": "user_id",
+    "title": "title",
+    "category": "category",
+    "created_at": "created_at",
+    "body": "body",
+    "ai_answer": "ai_answer",
+    "ai_answer_status": "ai_answer_status:ai_answer->>status",
+}
+DEFAULT_QUESTION_LIST_FIELDS = "id,user_id,title,category,created_at,ai_answer_status"
+
 
 @router.post("", response_model=QuestionResponse, status_code=status.HTTP_201_CREATED)
 async def create_question(
     payload: QuestionCreate,
     user: AuthenticatedUser = Depends(deps.dev_user),  # 🧪 개발용: 인증 생략
     supabase: SupabaseService = Depends(deps.get_supabase_service),
-    settings: Settings = Depends(get_settings),
+    answer_jobs: AnswerJobQueue = Depends(deps.get_answer_jobs),
 ) -> QuestionResponse:
-    # Create question in database
-    record = await supabase.create_question(user.id, payload.model_dump())
+    # 503 with Retry-After when the answer queue or the OpenAI interactive lane is saturated
+    answer_jobs.ensure_capacity()
+
+    # Create question with a pending AI answer; a background worker fills it in
+    record = await supabase.create_question(user.id, {**payload.model_dump(), "ai_answer": pending_ai_answer()})
     question_id = str(record.get("id"))
-    
-    # Generate AI answer using RAG
-    try:
-        rag_service = RAGService(settings)
-        ai_answer = await rag_service.answer_question(payload.title)
-        
-        # Update question with AI answer
-        await supabase.update_question_ai_answer(question_id, ai_answer)
-    except Exception as e:
-        # Log error but don't fail the request
-        print(f"Failed to generate AI answer: {e}")
-        ai_answer = {
-            "content": "AI 답변 생성에 실패했습니다. 변호사 답변을 기다려주세요.",
-            "sources": [],
-            "error": str(e),
-        }
-    
-    # Fetch complete question with AI answer
-    question = await supabase.fetch_question(question_id)
-    return QuestionResponse.model_validate(question)
+
+    if not answer_jobs.submit(question_id, payload.title, payload.category):
+        record = await supabase.update_question_ai_answer(question_id, failed_ai_answer("AI answer queue is full"))
+
+    return QuestionResponse.model_validate(record)
+
+
+@router.get("")
+async def list_questions(
+    limit: int = Query(20, ge=1, le=100),
+    cursor: str | None = Query(None, description="`next_cursor` of the previous page"),
+    category: str | None = Query(None),
+    mine: bool = Query(False, description="Only the caller's own questions"),
+    fields: str = Query(
+        DEFAULT_QUESTION_LIST_FIELDS,
+        description=f"Comma-separated subset of {', '.join(QUESTION_LIST_FIELDS)}",
+    ),
+    user: AuthenticatedUser = Depends(deps.dev_user),  # 🧪 개발용: 인증 생략
+    supabase: SupabaseService = Depends(deps.get_supabase_service),
+) -> StreamingResponse:
+    """
+    Page through questions, newest first.
+
+    Pagination is keyset-based on ``(created_at, id)``: pass the returned ``next_cursor`` to
+    get the following page (``null`` on the last page). ``id`` and ``created_at`` are always
+    included. The JSON body ``{"items": [...], "next_cursor": ...}`` is streamed row by row.
+    """
+    requested = [field.strip() for field in fields.split(",") if field.strip()]
+    unknown = [field for field in requested if field not in QUESTION_LIST_FIELDS]
+    if unknown:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Unknown fields: {', '.join(unknown)}")
+    selected = dict.fromkeys(["id", "created_at", *requested])
+
+    rows = await supabase.list_questions(
+        select=",".join(QUESTION_LIST_FIELDS[field] for field in selected),
+        limit=limit + 1,
+        after=_decode_cursor(cursor) if cursor else None,
+        category=category,
+        user_id=user.id if mine else None,
+    )
+    next_cursor = _encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return StreamingResponse(_encode_page(rows[:limit], next_cursor), media_type="application/json")
 
 
 @router.get("/{question_id}", response_model=QuestionResponse)
 async def get_question(
+    response: Response,
     question_id: str = Path(..., description="Supabase UUID for the question"),
+    wait: float = Query(
+        0,
+        ge=0,
+        le=30,
+        description="Seconds to wait for a pending AI answer before responding (long polling)",
+    ),
+    if_none_match: str | None = Header(None),
     user: AuthenticatedUser = Depends(deps.dev_user),  # 🧪 개발용: 인증 생략
     supabase: SupabaseService = Depends(deps.get_supabase_service),
-) -> QuestionResponse:
+    answer_jobs: AnswerJobQueue = Depends(deps.get_answer_jobs),
+) -> QuestionResponse | Response:
+    """Question with its AI and lawyer answers; answers ``304`` when ``If-None-Match`` is current."""
+    entry = await supabase.fetch_question_entry(question_id)
+    ai_answer = entry.record.get("ai_answer") or {}
+    if wait and ai_answer.get("status") == "pending" and await answer_jobs.wait_for(question_id, timeout=wait):
+        entry = await supabase.fetch_question_entry(question_id)
+
+    headers = {"ETag": entry.etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(if_none_match, entry.etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    response.headers.update(headers)
+    return QuestionResponse.model_validate(entry.record)
+
+
+@router.get("/{question_id}/ai-answer/stream")
+async def stream_ai_answer(
+    question_id: str = Path(..., description="Supabase UUID for the question"),
+    user: AuthenticatedUser = Depends(deps.dev_user),  # 🧪 개발용: 인증 생략
+    supabase: SupabaseService = Depends(deps.get_supabase_service),
+    answer_jobs: AnswerJobQueue = Depends(deps.get_answer_jobs),
+) -> StreamingResponse:
+    """
+    Stream the AI answer as server-sent events.
+
+    Emits ``sources`` first, then ``token`` events as the LLM produces them, and finishes with
+    ``answer`` (or ``error``) carrying the payload stored in ``questions.ai_answer``. Settled
+    answers are replayed immediately as ``sources`` + ``answer``.
+    """
     question = await supabase.fetch_question(question_id)
-    return QuestionResponse.model_validate(question)
+    ai_answer = question.get("ai_answer") or {}
+    answer_status = ai_answer.get("status", "ready" if ai_answer.get("content") else "pending")
+
+    if answer_status == "pending":
+        if not answer_jobs.is_tracked(question_id):
+            answer_jobs.ensure_capacity()
+            if not answer_jobs.submit(question_id, question["title"], question.get("category")):
+                raise answer_jobs.overloaded()
+        events = answer_jobs.subscribe(question_id)
+    else:
+        events = _settled_events(ai_answer, final_event="answer" if answer_status == "ready" else "error")
+
+    return StreamingResponse(
+        _encode_sse(events),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+async def _settled_events(ai_answer: JsonDict, *, final_event: str) -> AsyncIterator[JsonDict]:
+    yield {"event": "sources", "data": ai_answer.get("sources", [])}
+    yield {"event": final_event, "data": ai_answer}
+
+
+async def _encode_sse(events: AsyncIterator[JsonDict]) -> AsyncIterator[str]:
+    async for event in events:
+        if event["event"] == "ping":
+            yield ": ping\n\n"
+            continue
+        yield f"event: {event['event']}\ndata: {json.dumps(event['data'], ensure_ascii=False)}\n\n"
 
 
 @router.post("/{question_id}/answers", response_model=AnswerResponse, status_code=status.HTTP_201_CREATED)
@@ -62,18 +173,29 @@ async def create_answer(
     user: AuthenticatedUser = Depends(deps.lawyer_user),
     supabase: SupabaseService = Depends(deps.get_supabase_service),
 ) -> AnswerResponse:
-    profile = await supabase.get_lawyer_profile(user.id)
-    if profile is None:
-        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Lawyer profile not found")
+    # Approval check, balance debit and insert run in one transaction (create_paid_answer)
+    answer = await supabase.create_answer(question_id, user.id, payload.content)
+    return AnswerResponse.model_validate(answer)
 
-    if profile.get("verification_status") != "approved":
-        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Lawyer is not approved")
 
-    balance = int(profile.get("balance") or 0)
-    if balance < 1000:
-        raise HTTPException(status_code=status.HTTP_402_PAYMENT_REQUIRED, detail="Insufficient balance (1000 required)")
+def _encode_cursor(row: JsonDict) -> str:
+    raw = json.dumps([row["created_at"], str(row["id"])], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
 
-    # Deduct credits and create answer (two operations; Supabase function recommended for production)
-    await supabase.deduct_lawyer_balance(user.id, balance - 1000)
-    answer = await supabase.create_answer(question_id, user.id, payload.content)
-    return AnswerResponse.model_validate(answer)
+
+def _decode_cursor(cursor: str) -> tuple[str, str]:
+    try:
+        created_at, last_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        # Both values end up in a PostgREST filter, so only accept well-formed ones
+        datetime.fromisoformat(created_at)
+        uuid.UUID(last_id)
+    except (binascii.Error, ValueError, TypeError) as exc:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor") from exc
+    return created_at, last_id
+
+
+async def _encode_page(rows: list[JsonDict], next_cursor: str | None) -> AsyncIterator[str]:
+    yield '{"items":['
+    for index, row in enumerate(rows):
+        yield ("," if index else "") + json.dumps(row, ensure_ascii=False, default=str)
+    yield f"],\"next_cursor\":{json.dumps(next_cursor)}}}"
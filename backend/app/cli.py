@@ -0,0 +1,166 @@
+"""Maintenance commands for the backend (``python -m app.cli --help``)."""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import math
+import sys
+from collections.abc import AsyncIterator
+from dataclasses import dataclass
+
+from app.core.config import get_settings
+from app.core.observability import configure_logging
+from app.services.backfill import AnswerBackfill
+from app.services.rag import RAGService
+from app.services.supabase import SupabaseService
+
+VECTOR_TABLES = ("document_embeddings", "legal_documents")
+
+
+@dataclass(slots=True)
+class IndexParameters:
+    method: str
+    m: int = 16
+    ef_construction: int = 64
+    lists: int = 100
+    ef_search: int = 40
+    probes: int = 10
+
+
+def size_index(method: str, rows: int) -> IndexParameters:
+    """
+    Pick build and query parameters for ``rows`` vectors following the pgvector guidance.
+
+    HNSW: larger graphs need more links per node and a wider build-time candidate list to keep
+    recall. ivfflat: ``rows / 1000`` lists up to 1M rows and ``sqrt(rows)`` beyond, probed at
+    roughly ``sqrt(lists)``.
+    """
+    if method in ("hnsw", "binary"):
+        if rows < 100_000:
+            return IndexParameters(method, m=16, ef_construction=64, ef_search=40)
+        if rows < 1_000_000:
+            return IndexParameters(method, m=16, ef_construction=128, ef_search=80)
+        return IndexParameters(method, m=24, ef_construction=200, ef_search=100)
+
+    lists = max(rows // 1000, 10) if rows <= 1_000_000 else int(math.sqrt(rows))
+    return IndexParameters(method, lists=lists, probes=max(int(math.sqrt(lists)), 1))
+
+
+async def reindex(table: str, method: str, *, dry_run: bool) -> None:
+    settings = get_settings()
+    supabase = SupabaseService(settings)
+    try:
+        rows = await supabase.count_rows(f"/{table}")
+        params = size_index(method, rows)
+        print(f"{table}: {rows} rows")
+        if method in ("hnsw", "binary"):
+            print(f"  build: m={params.m}, ef_construction={params.ef_construction}")
+            print(f"  query: RAG_HNSW_EF_SEARCH={params.ef_search}")
+        else:
+            print(f"  build: lists={params.lists}")
+            print(f"  query: RAG_IVFFLAT_PROBES={params.probes}")
+        if dry_run:
+            return
+
+        result = await supabase.rpc(
+            "rebuild_vector_index",
+            {
+                "p_table": table,
+                "p_method": method,
+                "p_m": params.m,
+                "p_ef_construction": params.ef_construction,
+                "p_lists": params.lists,
+            },
+        )
+        print(f"Rebuilt {result[0]['index_name']}")
+    finally:
+        await supabase.aclose()
+
+
+async def migrate_embeddings(table: str, storage: str, dimensions: int | None) -> None:
+    settings = get_settings()
+    supabase = SupabaseService(settings)
+    try:
+        result = await supabase.rpc(
+            "migrate_embedding_storage",
+            {"p_table": table, "p_storage": storage, "p_dimensions": dimensions},
+        )
+        print(f"{table}.embedding is now {result[0]['column_type']}")
+        if dimensions and settings.openai_embedding_dimensions != dimensions:
+            print(f"  set OPENAI_EMBEDDING_DIMENSIONS={dimensions} so queries match the column")
+        print(f"  run `reindex --table {table}` to size the rebuilt index")
+    finally:
+        await supabase.aclose()
+
+
+async def backfill_answers(ids_file: str | None) -> None:
+    settings = get_settings()
+    supabase = SupabaseService(settings)
+    rag_service = RAGService(settings, supabase=supabase)
+    try:
+        question_ids = read_ids(ids_file) if ids_file else supabase.iter_question_ids()
+        async for progress in AnswerBackfill(settings, rag_service, supabase).run(question_ids):
+            print(json.dumps(progress.as_dict()), flush=True)
+    finally:
+        await rag_service.aclose()
+        await supabase.aclose()
+
+
+async def read_ids(path: str) -> AsyncIterator[str]:
+    """Question ids, one per line, from ``path`` (``-`` for stdin) read lazily."""
+    stream = sys.stdin if path == "-" else open(path, encoding="utf-8")  # noqa: SIM115
+    try:
+        while line := await asyncio.to_thread(stream.readline):
+            if line.strip():
+                yield line.strip()
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(prog="budongsan-admin")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    reindex_parser = commands.add_parser("reindex", help="Rebuild a vector index sized for the current row count")
+    reindex_parser.add_argument("--table", choices=VECTOR_TABLES, default="document_embeddings")
+    reindex_parser.add_argument(
+        "--method",
+        choices=("hnsw", "ivfflat", "binary"),
+        default="hnsw",
+        help="`binary` adds the binary-quantized index used by RAG_QUANTIZED_SEARCH",
+    )
+    reindex_parser.add_argument("--dry-run", action="store_true", help="Only print the recommended parameters")
+
+    migrate_parser = commands.add_parser(
+        "migrate-embeddings",
+        help="Convert an embedding column to halfvec storage and/or fewer dimensions",
+    )
+    migrate_parser.add_argument("--table", choices=VECTOR_TABLES, default="document_embeddings")
+    migrate_parser.add_argument("--storage", choices=("vector", "halfvec"), default="halfvec")
+    migrate_parser.add_argument(
+        "--dimensions",
+        type=int,
+        help="Keep only the first N dimensions (text-embedding-3 embeddings only)",
+    )
+
+    backfill_parser = commands.add_parser("backfill-answers", help="Regenerate questions.ai_answer in bulk")
+    backfill_parser.add_argument(
+        "--ids-file",
+        help="File with one question id per line (`-` for stdin); every question when omitted",
+    )
+
+    args = parser.parse_args(argv)
+    configure_logging(get_settings())
+    if args.command == "reindex":
+        asyncio.run(reindex(args.table, args.method, dry_run=args.dry_run))
+    elif args.command == "migrate-embeddings":
+        asyncio.run(migrate_embeddings(args.table, args.storage, args.dimensions))
+    elif args.command == "backfill-answers":
+        asyncio.run(backfill_answers(args.ids_file))
+
+
+if __name__ == "__main__":
+    main()
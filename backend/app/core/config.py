@@ -1,21 +1,90 @@
 from functools import lru_cache
+from typing import Literal
 
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
 class Settings(BaseSettings):
     environment: str = "local"
+    log_level: str = "INFO"
+    log_format: Literal["json", "text"] = "json"
     supabase_url: str
     supabase_service_role_key: str
     supabase_jwt_secret: str
+    supabase_jwks_enabled: bool = False
+    supabase_jwks_cache_seconds: int = 300
+    auth_token_cache_size: int = 10_000
+    auth_token_cache_ttl_seconds: float = 300.0
     supabase_storage_bucket: str | None = None
     openai_api_key: str
     openai_chat_model: str = "gpt-4o-mini"
     openai_embedding_model: str = "text-embedding-ada-002"
+    openai_embedding_dimensions: int | None = None
+    openai_requests_per_minute: int = 500
+    openai_tokens_per_minute: int = 200_000
+    openai_max_concurrency: int = 16
+    openai_queue_depth_interactive: int = 200
+    openai_queue_depth_ingestion: int = 1000
+    openai_queue_depth_backfill: int = 1000
+    openai_max_retries: int = 4
+    openai_retry_base_delay: float = 1.0
+    openai_completion_tokens_estimate: int = 800
     supabase_vector_table: str = "document_embeddings"
     supabase_vector_query_name: str = "match_document_chunks"
+    rag_retriever: Literal["hybrid", "vector", "memory"] = "hybrid"
+    rag_match_count: int = 4
+    rag_match_threshold: float = 0.7
+    rag_hnsw_ef_search: int = 40
+    rag_ivfflat_probes: int = 10
+    rag_hybrid_candidates: int = 20
+    rag_rrf_k: int = 60
+    rag_quantized_search: bool = False
+    rag_quantized_oversample: int = 4
+    rag_context_token_budget: int = 2500
+    rag_memory_index_refresh_seconds: float = 60.0
+    rag_memory_index_path: str | None = None
     rag_chunk_size: int = 1000
     rag_chunk_overlap: int = 200
+    rag_chunker: Literal["statute", "recursive"] = "statute"
+    rag_statute_chunk_overlap: int = 50
+    rag_embedding_batch_size: int = 100
+    rag_ingest_concurrency: int = 4
+    rag_ingest_parse_workers: int = 2
+    rag_ingest_page_batch_size: int = 8
+    ingest_spool_dir: str = ".cache/ingest"
+    ingest_max_concurrent_jobs: int = 1
+    ingest_job_timeout_seconds: float = 3600.0
+    ingest_progress_interval_seconds: float = 2.0
+    ingest_job_claim_lease_seconds: float = 120.0
+    supabase_http2: bool = True
+    supabase_timeout: float = 10.0
+    supabase_pool_max_connections: int = 50
+    supabase_pool_max_keepalive: int = 20
+    supabase_pool_keepalive_expiry: float = 30.0
+    supabase_pipeline_requests: bool = True
+    supabase_bulk_chunk_size: int = 500
+    ai_answer_concurrency: int = 4
+    ai_answer_queue_size: int = 1000
+    ai_answer_max_retries: int = 3
+    ai_answer_retry_base_delay: float = 2.0
+    ai_answer_claim_lease_seconds: float = 120.0
+    ai_backfill_batch_size: int = 100
+    ai_backfill_concurrency: int = 8
+    question_cache_enabled: bool = True
+    question_cache_ttl_seconds: float = 30.0
+    question_cache_max_entries: int = 5000
+    question_cache_shared_path: str | None = None
+    question_cache_shared_ttl_seconds: float = 300.0
+    rag_single_flight_enabled: bool = True
+    rag_single_flight_max_keys: int = 1000
+    rag_answer_cache_enabled: bool = True
+    rag_answer_cache_threshold: float = 0.95
+    rag_answer_cache_ttl_seconds: float = 86400.0
+    rag_answer_cache_max_entries: int = 2000
+    rag_answer_cache_corpus_check_seconds: float = 60.0
+    rag_embedding_cache_enabled: bool = True
+    rag_embedding_cache_path: str = ".cache/embeddings.sqlite3"
+    rag_embedding_cache_max_entries: int = 200_000
 
     model_config = SettingsConfigDict(
         env_file=(".env", "../.env"),
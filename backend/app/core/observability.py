@@ -0,0 +1,253 @@
+"""Request ids, structured logging, stage timings and Prometheus metrics."""
+
+from __future__ import annotations
+
+import functools
+import inspect
+import json
+import logging
+import time
+import uuid
+from collections.abc import Callable, Iterator, Mapping
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, TypeVar
+
+import httpx
+from prometheus_client import Counter, Histogram
+from prometheus_client.core import GaugeMetricFamily
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core.config import Settings
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+logger = logging.getLogger("app.observability")
+
+request_id_var: ContextVar[str | None] = ContextVar("request_id", default=None)
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "budongsan_http_request_duration_seconds",
+    "HTTP requests handled by the API, by route template",
+    ["method", "route", "status"],
+)
+STAGE_SECONDS = Histogram(
+    "budongsan_stage_duration_seconds",
+    "Duration of one stage of the request path (Supabase call, embedding, search, generation, ...)",
+    ["component", "stage", "outcome"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0),
+)
+OPENAI_TOKENS = Counter(
+    "budongsan_openai_tokens",
+    "Tokens sent to and received from OpenAI",
+    ["model", "kind"],
+)
+
+# LogRecord attributes that are not user-supplied ``extra`` fields
+_RECORD_ATTRIBUTES = frozenset(logging.makeLogRecord({}).__dict__) | {"message", "asctime", "request_id"}
+
+
+class RequestIdFilter(logging.Filter):
+    """Stamps every record with the id of the request being served (``None`` outside one)."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message, request id and ``extra`` fields."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload: dict[str, Any] = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "request_id": getattr(record, "request_id", None),
+        }
+        payload.update({key: value for key, value in record.__dict__.items() if key not in _RECORD_ATTRIBUTES})
+        if record.exc_info:
+            payload["exception"] = self.formatException(record.exc_info)
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+def configure_logging(settings: Settings) -> None:
+    """Send application logs to stderr as JSON lines (or plain text) tagged with the request id."""
+    handler = logging.StreamHandler()
+    handler.addFilter(RequestIdFilter())
+    if settings.log_format == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s"))
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(settings.log_level.upper())
+
+
+@contextmanager
+def span(component: str, stage: str) -> Iterator[None]:
+    """Time a stage into ``budongsan_stage_duration_seconds`` and log it at debug level."""
+    started = time.perf_counter()
+    outcome = "ok"
+    try:
+        yield
+    except BaseException:
+        outcome = "error"
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.labels(component, stage, outcome).observe(elapsed)
+        logger.debug(
+            "%s.%s took %.1f ms",
+            component,
+            stage,
+            elapsed * 1000,
+            extra={"component": component, "stage": stage, "outcome": outcome, "duration_ms": round(elapsed * 1000, 1)},
+        )
+
+
+def timed(component: str, stage: str | None = None) -> Callable[[F], F]:
+    """Decorator form of :func:`span` for coroutine and async generator functions."""
+
+    def decorate(function: F) -> F:
+        name = stage or function.__name__
+
+        if inspect.isasyncgenfunction(function):
+
+            @functools.wraps(function)
+            async def generator_wrapper(*args: Any, **kwargs: Any) -> Any:
+                with span(component, name):
+                    async for item in function(*args, **kwargs):
+                        yield item
+
+            return generator_wrapper  # type: ignore[return-value]
+
+        @functools.wraps(function)
+        async def wrapper(*args: Any, **kwargs: Any) -> Any:
+            with span(component, name):
+                return await function(*args, **kwargs)
+
+        return wrapper  # type: ignore[return-value]
+
+    return decorate
+
+
+def record_tokens(model: str, kind: str, count: int | None) -> None:
+    if count:
+        OPENAI_TOKENS.labels(model, kind).inc(count)
+
+
+def cache_stats(hits: int, misses: int) -> dict[str, int | float]:
+    lookups = hits + misses
+    return {"hits": hits, "misses": misses, "hit_rate": hits / lookups if lookups else 0.0}
+
+
+async def _start_http_span(request: httpx.Request) -> None:
+    request.extensions["started_at"] = time.perf_counter()
+
+
+async def _end_http_span(response: httpx.Response) -> None:
+    request = response.request
+    elapsed = time.perf_counter() - request.extensions.get("started_at", time.perf_counter())
+    # "/rest/v1/questions" -> "GET questions", "/rest/v1/rpc/match_document_chunks" -> "POST rpc/match_document_chunks"
+    resource = request.url.path.rsplit("/rest/v1/", 1)[-1]
+    stage = f"{request.method} {resource}"
+    outcome = "ok" if response.status_code < 400 else "error"
+    STAGE_SECONDS.labels("supabase", stage, outcome).observe(elapsed)
+    log = logger.warning if response.status_code >= 500 else logger.debug
+    log(
+        "supabase %s -> %d in %.1f ms",
+        stage,
+        response.status_code,
+        elapsed * 1000,
+        extra={"component": "supabase", "stage": stage, "status": response.status_code, "duration_ms": round(elapsed * 1000, 1)},
+    )
+
+
+# Event hooks timing every PostgREST call made through a client
+HTTP_SPAN_HOOKS = {"request": [_start_http_span], "response": [_end_http_span]}
+
+
+class StatsCollector:
+    """
+    Exports service counters as gauges, read when Prometheus scrapes.
+
+    ``sources`` maps a prefix to a callable returning ``as_dict``-style stats; nested mappings
+    (e.g. queue depth per lane) become one gauge with a ``key`` label.
+    """
+
+    def __init__(self, sources: Mapping[str, Callable[[], Mapping[str, Any]]]):
+        self._sources = sources
+
+    def describe(self) -> list[GaugeMetricFamily]:
+        return []
+
+    def collect(self) -> Iterator[GaugeMetricFamily]:
+        for source, read in self._sources.items():
+            try:
+                stats = read()
+            except Exception:  # noqa: BLE001 one broken source must not fail the scrape
+                logger.exception("Could not read %s stats", source)
+                continue
+            for key, value in stats.items():
+                name = f"budongsan_{source}_{key}"
+                if isinstance(value, Mapping):
+                    family = GaugeMetricFamily(name, f"{source} {key}", labels=["key"])
+                    for label, item in value.items():
+                        family.add_metric([str(label)], float(item))
+                else:
+                    family = GaugeMetricFamily(name, f"{source} {key}", value=float(value))
+                yield family
+
+
+class RequestContextMiddleware:
+    """
+    Assigns each HTTP request an id, times it and logs one line when it finishes.
+
+    The id comes from an incoming ``X-Request-ID`` header or is generated, is returned in the
+    response header and is attached to every log record written while serving the request.
+    Pure ASGI so streamed responses are timed to their last byte.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        incoming = dict(scope["headers"]).get(b"x-request-id", b"").decode("latin-1")[:64]
+        request_id = incoming or uuid.uuid4().hex
+        token = request_id_var.set(request_id)
+        started = time.perf_counter()
+        status_code = 500
+
+        async def send_with_request_id(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                message["headers"] = [*message.get("headers", []), (b"x-request-id", request_id.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        finally:
+            elapsed = time.perf_counter() - started
+            route = getattr(scope.get("route"), "path", "unmatched")
+            HTTP_REQUEST_SECONDS.labels(scope["method"], route, str(status_code)).observe(elapsed)
+            logger.info(
+                "%s %s -> %d in %.1f ms",
+                scope["method"],
+                scope["path"],
+                status_code,
+                elapsed * 1000,
+                extra={
+                    "method": scope["method"],
+                    "route": route,
+                    "status": status_code,
+                    "duration_ms": round(elapsed * 1000, 1),
+                },
+            )
+            request_id_var.reset(token)
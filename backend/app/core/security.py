@@ -1,7 +1,12 @@
 ﻿from __future__ import annotations
 
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
 from dataclasses import dataclass
-from typing import Awaitable, Callable, Literal
+from functools import lru_cache
+from typing import Any, Awaitable, Callable, Literal
 
 import jwt
 from fastapi import Depends, HTTPException, status
@@ -11,6 +16,9 @@ from app.core.config import Settings, get_settings
 
 http_bearer = HTTPBearer(auto_error=False)
 
+SYMMETRIC_ALGORITHMS = ["HS256"]
+ASYMMETRIC_ALGORITHMS = ["RS256", "ES256"]
+
 
 @dataclass(slots=True)
 class AuthenticatedUser:
@@ -20,33 +28,111 @@ class AuthenticatedUser:
 
 
 class TokenVerifier:
+    """
+    Verifies Supabase access tokens and remembers the claims of tokens it has already seen.
+
+    Verified claims are kept in an LRU of ``auth_token_cache_size`` entries keyed by the
+    SHA-256 of the token, each for at most ``auth_token_cache_ttl_seconds`` and never past the
+    token's ``exp``. HS256 tokens are checked against ``supabase_jwt_secret``; with
+    ``supabase_jwks_enabled`` asymmetric tokens are checked against the project's JWKS, whose
+    keys ``PyJWKClient`` caches locally.
+    """
+
     def __init__(self, settings: Settings):
         self._secret = settings.supabase_jwt_secret
+        self._ttl = settings.auth_token_cache_ttl_seconds
+        self._max_entries = settings.auth_token_cache_size
+        self._claims: OrderedDict[bytes, tuple[dict[str, Any], float]] = OrderedDict()
+        self._jwks: jwt.PyJWKClient | None = None
+        if settings.supabase_jwks_enabled:
+            self._jwks = jwt.PyJWKClient(
+                settings.supabase_url.rstrip("/") + "/auth/v1/.well-known/jwks.json",
+                cache_keys=True,
+                lifespan=settings.supabase_jwks_cache_seconds,
+            )
+
+    async def verify(self, token: str) -> dict[str, Any]:
+        key = hashlib.sha256(token.encode()).digest()
+        cached = self._claims.get(key)
+        if cached is not None:
+            claims, expires_at = cached
+            if time.monotonic() < expires_at:
+                self._claims.move_to_end(key)
+                return claims
+            del self._claims[key]
+
+        if self._jwks is not None and self._algorithm(token) in ASYMMETRIC_ALGORITHMS:
+            # May fetch the key set on a cache miss, so keep it off the event loop
+            claims = await asyncio.to_thread(self._decode_with_jwks, token)
+        else:
+            claims = self.decode(token)
+        self._remember(key, claims)
+        return claims
 
     def decode(self, token: str) -> dict:
         try:
             return jwt.decode(
                 token,
                 self._secret,
-                algorithms=["HS256"],
+                algorithms=SYMMETRIC_ALGORITHMS,
+                options={"verify_aud": False},
+            )
+        except jwt.InvalidTokenError as exc:  # type: ignore[attr-defined]
+            raise self._invalid_token() from exc
+
+    def _decode_with_jwks(self, token: str) -> dict:
+        assert self._jwks is not None
+        try:
+            signing_key = self._jwks.get_signing_key_from_jwt(token)
+            return jwt.decode(
+                token,
+                signing_key.key,
+                algorithms=ASYMMETRIC_ALGORITHMS,
                 options={"verify_aud": False},
             )
+        except (jwt.InvalidTokenError, jwt.PyJWKClientError) as exc:  # type: ignore[attr-defined]
+            raise self._invalid_token() from exc
+
+    def _remember(self, key: bytes, claims: dict[str, Any]) -> None:
+        lifetime = self._ttl
+        if isinstance(claims.get("exp"), (int, float)):
+            lifetime = min(lifetime, claims["exp"] - time.time())
+        if lifetime <= 0:
+            return
+        self._claims[key] = (claims, time.monotonic() + lifetime)
+        self._claims.move_to_end(key)
+        while len(self._claims) > self._max_entries:
+            self._claims.popitem(last=False)
+
+    @staticmethod
+    def _algorithm(token: str) -> str | None:
+        try:
+            return jwt.get_unverified_header(token).get("alg")
         except jwt.InvalidTokenError as exc:  # type: ignore[attr-defined]
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Invalid or expired access token",
-            ) from exc
+            raise TokenVerifier._invalid_token() from exc
+
+    @staticmethod
+    def _invalid_token() -> HTTPException:
+        return HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid or expired access token",
+        )
+
+
+@lru_cache
+def get_token_verifier() -> TokenVerifier:
+    """One verifier (and claims cache) per process."""
+    return TokenVerifier(get_settings())
 
 
 async def get_current_user(
     credentials: HTTPAuthorizationCredentials | None = Depends(http_bearer),
-    settings: Settings = Depends(get_settings),
+    verifier: TokenVerifier = Depends(get_token_verifier),
 ) -> AuthenticatedUser:
     if credentials is None:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Missing Authorization header")
 
-    verifier = TokenVerifier(settings)
-    payload = verifier.decode(credentials.credentials)
+    payload = await verifier.verify(credentials.credentials)
 
     role = payload.get("role") or payload.get("app_metadata", {}).get("role")
     if role not in {"user", "lawyer", "admin"}:
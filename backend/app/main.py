@@ -1,12 +1,98 @@
-﻿from fastapi import FastAPI
+﻿import math
+from collections.abc import AsyncIterator, Callable, Mapping
+from contextlib import asynccontextmanager
+from typing import Any
+
+from fastapi import FastAPI, Request, Response, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, generate_latest
 
 from app.api.routes import admin, lawyers, questions
 from app.core.config import get_settings
+from app.core.observability import RequestContextMiddleware, StatsCollector, cache_stats, configure_logging
+from app.services.answer_jobs import AnswerJobQueue
+from app.services.ingest_jobs import IngestJobManager
+from app.services.openai_governor import OpenAIOverloadedError
+from app.services.question_cache import QuestionCache, SharedQuestionStore
+from app.services.rag import RAGService
+from app.services.supabase import SupabaseService, create_http_client
 
 settings = get_settings()
+configure_logging(settings)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    """Create process-wide services on startup and release them on shutdown."""
+    supabase_http = create_http_client(settings)
+    question_cache = (
+        QuestionCache(
+            ttl_seconds=settings.question_cache_ttl_seconds,
+            max_entries=settings.question_cache_max_entries,
+            shared=SharedQuestionStore(settings.question_cache_shared_path)
+            if settings.question_cache_shared_path
+            else None,
+            shared_ttl_seconds=settings.question_cache_shared_ttl_seconds,
+        )
+        if settings.question_cache_enabled
+        else None
+    )
+    supabase = SupabaseService(settings, client=supabase_http, question_cache=question_cache)
+    rag_service = RAGService(settings, supabase=supabase)
+    await rag_service.warm_up()
+    answer_jobs = AnswerJobQueue(settings, rag_service, supabase)
+    await answer_jobs.start()
+    ingest_jobs = IngestJobManager(settings, rag_service, supabase)
+    await ingest_jobs.start()
+    app.state.supabase_http = supabase_http
+    app.state.question_cache = question_cache
+    app.state.rag_service = rag_service
+    app.state.answer_jobs = answer_jobs
+    app.state.ingest_jobs = ingest_jobs
+    stats_collector = StatsCollector(_stats_sources(rag_service, question_cache))
+    REGISTRY.register(stats_collector)
+    try:
+        yield
+    finally:
+        REGISTRY.unregister(stats_collector)
+        await ingest_jobs.stop()
+        await answer_jobs.stop()
+        await rag_service.aclose()
+        await supabase_http.aclose()
+        if question_cache is not None:
+            question_cache.close()
+
+
+def _stats_sources(
+    rag_service: RAGService,
+    question_cache: QuestionCache | None,
+) -> dict[str, Callable[[], Mapping[str, Any]]]:
+    """Counters exported on ``/metrics``, read at scrape time."""
+    sources: dict[str, Callable[[], Mapping[str, Any]]] = {
+        "answer_cache": lambda: rag_service.answer_cache.stats.as_dict(),
+        "answer_coalescing": lambda: {
+            **rag_service.answer_flights.stats.as_dict(),
+            "in_flight": len(rag_service.answer_flights),
+        },
+        "openai_governor": lambda: {
+            **rag_service.openai_governor.stats.as_dict(),
+            "queue_depth": rag_service.openai_governor.queue_depths(),
+        },
+    }
+    if settings.rag_embedding_cache_enabled:
+        sources["embedding_cache"] = lambda: cache_stats(
+            rag_service.embedding_cache.hits, rag_service.embedding_cache.misses
+        )
+    if question_cache is not None:
+        sources["question_cache"] = lambda: {
+            **cache_stats(question_cache.hits, question_cache.misses),
+            "entries": len(question_cache),
+        }
+    return sources
+
 
-app = FastAPI(title="부동산법률Q API", version="0.1.0")
+app = FastAPI(title="부동산법률Q API", version="0.1.0", lifespan=lifespan)
 
 # CORS 설정: Next.js 프론트엔드와 통신
 app.add_middleware(
@@ -19,7 +105,21 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Request-ID"],
 )
+# Added last so it wraps everything, CORS included
+app.add_middleware(RequestContextMiddleware)
+
+
+@app.exception_handler(OpenAIOverloadedError)
+async def openai_overloaded_handler(request: Request, exc: OpenAIOverloadedError) -> JSONResponse:
+    """Shed load while OpenAI capacity is exhausted; clients retry after the estimated wait."""
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(max(math.ceil(exc.retry_after), 1))},
+    )
+
 
 app.include_router(questions.router)
 app.include_router(lawyers.router)
@@ -30,3 +130,9 @@ app.include_router(admin.router)
 def health_check() -> dict[str, str]:
     """Return simple service heartbeat."""
     return {"status": "ok"}
+
+
+@app.get("/metrics", tags=["system"], include_in_schema=False)
+def metrics() -> Response:
+    """Prometheus exposition of request/stage latencies, OpenAI tokens and cache counters."""
+    return Response(generate_latest(REGISTRY), media_type=CONTENT_TYPE_LATEST)
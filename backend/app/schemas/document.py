@@ -10,6 +10,7 @@ class DocumentCreate(BaseModel):
     storage_url: str
     version: int = Field(default=1, ge=1)
     is_active: bool = True
+    category: str | None = None
 
 
 class DocumentResponse(DocumentCreate):
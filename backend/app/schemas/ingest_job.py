@@ -0,0 +1,29 @@
+from __future__ import annotations
+
+from datetime import datetime
+from typing import Literal
+from uuid import UUID
+
+from pydantic import BaseModel
+
+
+class IngestJobResponse(BaseModel):
+    id: UUID
+    document_id: UUID
+    status: Literal["queued", "running", "succeeded", "failed"]
+    mode: Literal["full", "incremental"] = "full"
+    file_name: str | None = None
+    pages_total: int = 0
+    pages_parsed: int = 0
+    chunks_created: int = 0
+    chunks_embedded: int = 0
+    chunks_stored: int = 0
+    chunks_reused: int = 0
+    chunks_deleted: int = 0
+    attempts: int = 0
+    error: str | None = None
+    created_at: datetime | None = None
+    updated_at: datetime | None = None
+
+    class Config:
+        from_attributes = True
@@ -26,3 +26,7 @@ class LawyerProfileResponse(BaseModel):
 class LawyerStatusUpdate(BaseModel):
     status: Literal["approved", "pending", "rejected"]
     reset_balance: int | None = Field(default=None, ge=0)
+
+
+class LawyerStatusBulkUpdate(LawyerStatusUpdate):
+    user_ids: list[UUID] = Field(min_length=1, max_length=1000)
@@ -0,0 +1,127 @@
+"""Semantic cache that reuses AI answers for near-duplicate questions."""
+
+from __future__ import annotations
+
+import time
+from collections import OrderedDict
+from collections.abc import Hashable
+from dataclasses import dataclass
+from typing import Any
+
+import numpy as np
+
+JsonDict = dict[str, Any]
+
+
+@dataclass(slots=True)
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    expirations: int = 0
+    invalidations: int = 0
+
+    def as_dict(self) -> dict[str, int | float]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+        }
+
+
+class SemanticAnswerCache:
+    """
+    In-memory answer cache keyed by question embedding.
+
+    Normalised embeddings live in a preallocated float32 matrix so a lookup is a single
+    matrix-vector product. A stored answer is reused when the cosine similarity of its
+    question to the new one reaches ``threshold`` and both were answered in the same ``scope``
+    (e.g. the retrieval filters). Entries expire after ``ttl_seconds`` and the least recently
+    used entry is evicted once ``max_entries`` is reached. The whole cache is dropped when the
+    corpus fingerprint changes (see :meth:`sync_corpus`).
+    """
+
+    def __init__(self, *, threshold: float, ttl_seconds: float, max_entries: int):
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.stats = CacheStats()
+        self._matrix: np.ndarray | None = None
+        self._answers: list[JsonDict | None] = [None] * max_entries
+        self._stored_at = np.zeros(max_entries, dtype=np.float64)
+        self._valid = np.zeros(max_entries, dtype=bool)
+        self._scopes = np.zeros(max_entries, dtype=np.int64)
+        self._scope_ids: dict[Hashable, int] = {}
+        self._lru: OrderedDict[int, None] = OrderedDict()
+        self._corpus_fingerprint: str | None = None
+
+    def __len__(self) -> int:
+        return len(self._lru)
+
+    def lookup(self, embedding: list[float], scope: Hashable = None) -> JsonDict | None:
+        if self._matrix is None or not self._lru or scope not in self._scope_ids:
+            self.stats.misses += 1
+            return None
+
+        similarities = self._matrix @ self._normalise(embedding)
+        similarities[~self._valid | (self._scopes != self._scope_ids[scope])] = -1.0
+        slot = int(np.argmax(similarities))
+        if similarities[slot] < self.threshold:
+            self.stats.misses += 1
+            return None
+
+        if time.monotonic() - self._stored_at[slot] > self.ttl_seconds:
+            self._release(slot)
+            self.stats.expirations += 1
+            self.stats.misses += 1
+            return None
+
+        self._lru.move_to_end(slot)
+        self.stats.hits += 1
+        return self._answers[slot]
+
+    def store(self, embedding: list[float], answer: JsonDict, scope: Hashable = None) -> None:
+        vector = self._normalise(embedding)
+        if self._matrix is None:
+            self._matrix = np.zeros((self.max_entries, vector.shape[0]), dtype=np.float32)
+
+        if len(self._lru) >= self.max_entries:
+            oldest, _ = self._lru.popitem(last=False)
+            self._release(oldest)
+            self.stats.evictions += 1
+        slot = int(np.argmin(self._valid))
+
+        self._matrix[slot] = vector
+        self._answers[slot] = answer
+        self._scopes[slot] = self._scope_ids.setdefault(scope, len(self._scope_ids))
+        self._stored_at[slot] = time.monotonic()
+        self._valid[slot] = True
+        self._lru[slot] = None
+
+    def invalidate(self) -> None:
+        """Drop every cached answer, e.g. after the document corpus changed."""
+        self._valid[:] = False
+        self._answers = [None] * self.max_entries
+        self._lru.clear()
+        self.stats.invalidations += 1
+
+    def sync_corpus(self, fingerprint: str) -> None:
+        """Invalidate the cache when the active documents (ids and versions) changed."""
+        if self._corpus_fingerprint is not None and fingerprint != self._corpus_fingerprint:
+            self.invalidate()
+        self._corpus_fingerprint = fingerprint
+
+    def _release(self, slot: int) -> None:
+        self._valid[slot] = False
+        self._answers[slot] = None
+        self._lru.pop(slot, None)
+
+    @staticmethod
+    def _normalise(embedding: list[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = float(np.linalg.norm(vector))
+        return vector / norm if norm else vector
@@ -0,0 +1,342 @@
+"""Background job queue that generates AI answers outside the request path."""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import random
+from collections.abc import AsyncIterator
+from dataclasses import dataclass, field
+
+from app.core.config import Settings
+from app.services.openai_governor import OpenAIOverloadedError, provider_retry_after
+from app.services.rag import RAGService
+from app.services.retrieval import RetrievalFilters
+from app.services.supabase import JsonDict, SupabaseService
+
+logger = logging.getLogger(__name__)
+
+AI_ANSWER_FAILED_MESSAGE = "AI 답변 생성에 실패했습니다. 변호사 답변을 기다려주세요."
+
+# How often a process relaying another process's job checks whether it has settled
+FOLLOW_INTERVAL_SECONDS = 1.0
+
+
+def pending_ai_answer() -> JsonDict:
+    """Placeholder stored in ``questions.ai_answer`` until a worker finishes."""
+    return {"status": "pending", "content": None, "sources": []}
+
+
+def failed_ai_answer(error: str) -> JsonDict:
+    return {"status": "failed", "content": AI_ANSWER_FAILED_MESSAGE, "sources": [], "error": error}
+
+
+@dataclass(slots=True)
+class AnswerJob:
+    question_id: str
+    question: str
+    category: str | None = None
+    attempt: int = 0
+
+
+@dataclass(slots=True)
+class AnswerStream:
+    """Events produced so far for one in-flight job, replayed to late subscribers."""
+
+    events: list[JsonDict] = field(default_factory=list)
+    listeners: set[asyncio.Queue[JsonDict]] = field(default_factory=set)
+    done: asyncio.Event = field(default_factory=asyncio.Event)
+
+    def publish(self, event: JsonDict) -> None:
+        self.events.append(event)
+        for listener in self.listeners:
+            listener.put_nowait(event)
+
+
+class AnswerJobQueue:
+    """
+    In-process queue with a fixed worker pool for AI answer generation.
+
+    The worker count bounds how many RAG calls run against OpenAI at once. Workers stream the
+    generation and publish its events (see :meth:`RAGService.astream_answer`) to subscribers;
+    the answer is persisted once the stream completes. Failed jobs are retried with exponential
+    backoff, waiting at least as long as OpenAI's ``Retry-After`` asks; the final state is
+    written to ``questions.ai_answer`` as ``ready`` or ``failed``.
+
+    Several processes may run a queue against the same database, so a job only runs once this
+    process holds its lease (``claim_ai_answer``), renewed while it runs so governor waits and
+    retry sleeps cannot outlast it. Every ``ai_answer_claim_lease_seconds`` the queue enqueues
+    the pending questions it can claim, which picks up questions left by a stopped or crashed
+    process. A job submitted here whose lease another process holds is not
+    generated again: its subscribers get that process's answer once it is stored.
+    """
+
+    def __init__(self, settings: Settings, rag_service: RAGService, supabase: SupabaseService):
+        self.settings = settings
+        self._rag_service = rag_service
+        self._supabase = supabase
+        self._queue: asyncio.Queue[AnswerJob] = asyncio.Queue(maxsize=settings.ai_answer_queue_size)
+        self._workers: list[asyncio.Task[None]] = []
+        self._retries: set[asyncio.Task[None]] = set()
+        self._followers: set[asyncio.Task[None]] = set()
+        self._sweeper: asyncio.Task[None] | None = None
+        self._streams: dict[str, AnswerStream] = {}
+
+    @property
+    def is_full(self) -> bool:
+        return self._queue.full()
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+    def ensure_capacity(self) -> None:
+        """
+        Admission check for a new answer job.
+
+        Raises :class:`OpenAIOverloadedError` (served as 503 with ``Retry-After``) when the queue
+        is full or the queued jobs would push the interactive OpenAI lane past its depth limit.
+        """
+        if self.is_full:
+            raise self.overloaded()
+        self._rag_service.openai_governor.admit("interactive", backlog=self.depth)
+
+    def overloaded(self) -> OpenAIOverloadedError:
+        """The 503 error for a rejected submit, with the interactive lane's estimated wait."""
+        governor = self._rag_service.openai_governor
+        return OpenAIOverloadedError("interactive", governor.estimated_wait("interactive", backlog=self.depth))
+
+    async def start(self) -> None:
+        self._workers = [
+            asyncio.create_task(self._worker(), name=f"ai-answer-worker-{index}")
+            for index in range(self.settings.ai_answer_concurrency)
+        ]
+        self._sweeper = asyncio.create_task(self._sweep(), name="ai-answer-sweeper")
+
+    async def stop(self) -> None:
+        tasks = [*self._workers, *self._retries, *self._followers]
+        if self._sweeper is not None:
+            tasks.append(self._sweeper)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._workers.clear()
+        self._retries.clear()
+        self._followers.clear()
+        self._sweeper = None
+        try:
+            await self._supabase.release_ai_answer_claims()
+        except Exception:  # noqa: BLE001 unreleased leases expire on their own
+            logger.exception("Could not release AI answer leases")
+
+    def submit(self, question_id: str, question: str, category: str | None = None) -> bool:
+        """Enqueue a question; returns ``False`` when the queue is at capacity."""
+        try:
+            self._queue.put_nowait(AnswerJob(question_id=question_id, question=question, category=category))
+        except asyncio.QueueFull:
+            return False
+        self._streams.setdefault(question_id, AnswerStream())
+        return True
+
+    def is_tracked(self, question_id: str) -> bool:
+        """Whether this process has an unsettled job for ``question_id``."""
+        return question_id in self._streams
+
+    async def wait_for(self, question_id: str, timeout: float) -> bool:
+        """Wait until the job for ``question_id`` settles; ``False`` on timeout or unknown job."""
+        stream = self._streams.get(question_id)
+        if stream is None:
+            return False
+        try:
+            await asyncio.wait_for(stream.done.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    async def subscribe(self, question_id: str, *, heartbeat: float = 15.0) -> AsyncIterator[JsonDict]:
+        """
+        Yield the job's events from the beginning until it settles.
+
+        Ends with an ``answer`` or ``error`` event. A ``reset`` event means a retry started and
+        tokens received so far must be discarded; ``ping`` is emitted after ``heartbeat`` seconds
+        of silence so proxies keep the connection open.
+        """
+        stream = self._streams.get(question_id)
+        if stream is None:
+            return
+        listener: asyncio.Queue[JsonDict] = asyncio.Queue()
+        for event in stream.events:
+            listener.put_nowait(event)
+        stream.listeners.add(listener)
+        try:
+            while True:
+                try:
+                    event = await asyncio.wait_for(listener.get(), timeout=heartbeat)
+                except asyncio.TimeoutError:
+                    yield {"event": "ping", "data": None}
+                    continue
+                yield event
+                if event["event"] in {"answer", "error"}:
+                    return
+        finally:
+            stream.listeners.discard(listener)
+
+    async def _worker(self) -> None:
+        while True:
+            job = await self._queue.get()
+            try:
+                await self._run(job)
+            except Exception as exc:  # noqa: BLE001 keep the worker alive
+                logger.exception("AI answer job crashed for question %s", job.question_id)
+                self._settle(job.question_id, {"event": "error", "data": failed_ai_answer(str(exc))})
+            finally:
+                self._queue.task_done()
+
+    @property
+    def _lease(self) -> float:
+        return self.settings.ai_answer_claim_lease_seconds
+
+    async def _sweep(self) -> None:
+        """Enqueue the pending questions this process can claim, now and every lease period."""
+        while True:
+            try:
+                await self._claim_pending()
+            except Exception:  # noqa: BLE001 the next sweep tries again
+                logger.exception("Could not load pending AI answer jobs")
+            await asyncio.sleep(self._lease)
+
+    async def _claim_pending(self) -> None:
+        for record in await self._supabase.fetch_pending_ai_questions():
+            if self.is_full:
+                return
+            question_id = str(record["id"])
+            if self.is_tracked(question_id):
+                continue
+            claimed, _ = await self._supabase.claim_ai_answer(question_id, lease_seconds=self._lease)
+            if claimed:
+                self.submit(question_id, record["title"], record.get("category"))
+
+    async def _run(self, job: AnswerJob) -> None:
+        claimed, current = await self._supabase.claim_ai_answer(job.question_id, lease_seconds=self._lease)
+        if not claimed:
+            if current is not None and current.get("status") == "pending":
+                self._follow(job)
+            else:
+                self._relay(job.question_id, current)
+            return
+
+        generation = asyncio.create_task(self._generate(job), name=f"ai-answer-{job.question_id}")
+        lease = asyncio.create_task(
+            self._hold_lease(job.question_id, generation), name=f"ai-answer-lease-{job.question_id}"
+        )
+        try:
+            await generation
+        except asyncio.CancelledError:
+            if asyncio.current_task().cancelling():
+                raise
+            # Another process took the lease over; relay its answer instead of writing ours
+            self._follow(job)
+        finally:
+            lease.cancel()
+            generation.cancel()
+
+    async def _hold_lease(self, question_id: str, generation: asyncio.Task[None]) -> None:
+        """Renew the job's lease while it runs; stop the run once the lease is no longer held."""
+        while True:
+            await asyncio.sleep(self._lease / 3)
+            try:
+                claimed, _ = await self._supabase.claim_ai_answer(question_id, lease_seconds=self._lease)
+            except Exception:  # noqa: BLE001 renewed on the next tick, well within the lease
+                logger.exception("Could not renew the AI answer lease of question %s", question_id)
+                continue
+            if not claimed:
+                logger.warning("AI answer lease for question %s is no longer held by this process", question_id)
+                generation.cancel()
+                return
+
+    async def _generate(self, job: AnswerJob) -> None:
+        stream = self._streams.setdefault(job.question_id, AnswerStream())
+        if stream.events:
+            stream.events.clear()
+            stream.publish({"event": "reset", "data": {"attempt": job.attempt}})
+
+        ai_answer: JsonDict | None = None
+        filters = RetrievalFilters.for_category(job.category)
+        try:
+            async for event in self._rag_service.astream_answer(job.question, filters=filters):
+                if event["event"] == "answer":
+                    ai_answer = event["data"]
+                else:
+                    stream.publish(event)
+        except Exception as exc:  # noqa: BLE001 every provider error is retried
+            if job.attempt < self.settings.ai_answer_max_retries:
+                job.attempt += 1
+                delay = self.settings.ai_answer_retry_base_delay * 2 ** (job.attempt - 1)
+                delay = max(delay, provider_retry_after(exc) or 0.0)
+                logger.warning(
+                    "AI answer attempt %d failed for question %s, retrying in %.1fs: %s",
+                    job.attempt,
+                    job.question_id,
+                    delay,
+                    exc,
+                )
+                self._schedule_retry(job, delay + random.uniform(0, delay / 2))
+                return
+            logger.error("AI answer failed for question %s: %s", job.question_id, exc)
+            failed = failed_ai_answer(str(exc))
+            await self._supabase.update_question_ai_answer(job.question_id, failed)
+            self._settle(job.question_id, {"event": "error", "data": failed})
+            return
+
+        ready = {**(ai_answer or {}), "status": "ready"}
+        await self._supabase.update_question_ai_answer(job.question_id, ready)
+        self._settle(job.question_id, {"event": "answer", "data": ready})
+
+    def _schedule_retry(self, job: AnswerJob, delay: float) -> None:
+        async def requeue() -> None:
+            await asyncio.sleep(delay)
+            await self._queue.put(job)
+
+        task = asyncio.create_task(requeue())
+        self._retries.add(task)
+        task.add_done_callback(self._retries.discard)
+
+    def _follow(self, job: AnswerJob) -> None:
+        """Wait for the process holding the job's lease and relay its answer to local subscribers."""
+
+        async def follow() -> None:
+            while True:
+                await asyncio.sleep(FOLLOW_INTERVAL_SECONDS)
+                try:
+                    claimed, current = await self._supabase.claim_ai_answer(job.question_id, lease_seconds=self._lease)
+                except Exception:  # noqa: BLE001 checked again on the next tick
+                    logger.exception("Could not check AI answer job for question %s", job.question_id)
+                    continue
+                if claimed:
+                    # The holder's lease expired without an answer; generate it here
+                    await self._queue.put(job)
+                    return
+                if current is None or current.get("status") != "pending":
+                    self._relay(job.question_id, current)
+                    return
+
+        task = asyncio.create_task(follow())
+        self._followers.add(task)
+        task.add_done_callback(self._followers.discard)
+
+    def _relay(self, question_id: str, ai_answer: JsonDict | None) -> None:
+        """Settle a local job with the answer another process stored."""
+        if ai_answer is None:
+            self._settle(question_id, {"event": "error", "data": failed_ai_answer("Question not found")})
+            return
+        stream = self._streams.get(question_id)
+        if stream is not None:
+            stream.publish({"event": "sources", "data": ai_answer.get("sources", [])})
+        final_event = "answer" if ai_answer.get("status") == "ready" else "error"
+        self._settle(question_id, {"event": final_event, "data": ai_answer})
+
+    def _settle(self, question_id: str, final_event: JsonDict) -> None:
+        stream = self._streams.pop(question_id, None)
+        if stream is not None:
+            stream.publish(final_event)
+            stream.done.set()
@@ -0,0 +1,161 @@
+"""Bulk regeneration of ``questions.ai_answer`` after a model or corpus change."""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import uuid
+from collections.abc import AsyncIterable, AsyncIterator
+from dataclasses import asdict, dataclass
+
+import openai
+from langchain_core.documents import Document
+
+from app.core.config import Settings
+from app.services.openai_governor import openai_lane
+from app.services.rag import RAGService
+from app.services.retrieval import RetrievalFilters
+from app.services.supabase import JsonDict, SupabaseService
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(slots=True)
+class BackfillProgress:
+    received: int = 0
+    missing: int = 0
+    answered: int = 0
+    failed: int = 0
+    written: int = 0
+    rate_limited: int = 0
+
+    def as_dict(self) -> dict[str, int]:
+        return asdict(self)
+
+
+@dataclass(slots=True)
+class RetrievedQuestion:
+    question_id: str
+    question: str
+    documents: list[Document]
+
+
+def is_uuid(value: str) -> bool:
+    try:
+        uuid.UUID(value)
+    except ValueError:
+        return False
+    return True
+
+
+class AnswerBackfill:
+    """
+    Regenerates AI answers for a stream of question ids.
+
+    Ids are read in batches of ``ai_backfill_batch_size``: each batch fetches its titles in one
+    request, embeds them in one embeddings call and retrieves context for all of them
+    concurrently. ``ai_backfill_concurrency`` workers generate answers from the retrieved
+    batches, and results are written back in bulk through ``set_questions_ai_answers``. Every
+    OpenAI call runs in the governor's ``backfill`` lane, behind interactive questions and
+    ingestion, and shares its rate-limit pauses and retries. The semantic answer cache is
+    bypassed so every answer reflects the current model and corpus. A question whose generation
+    fails is only counted in ``failed``; its stored answer is left untouched.
+    """
+
+    def __init__(self, settings: Settings, rag_service: RAGService, supabase: SupabaseService):
+        self.settings = settings
+        self._rag_service = rag_service
+        self._supabase = supabase
+
+    async def run(self, question_ids: AsyncIterable[str]) -> AsyncIterator[BackfillProgress]:
+        """Process ``question_ids``, yielding progress after every bulk write and once at the end."""
+        progress = BackfillProgress()
+        batch_size = self.settings.ai_backfill_batch_size
+        retrieved: asyncio.Queue[RetrievedQuestion | None] = asyncio.Queue(maxsize=batch_size * 2)
+        results: asyncio.Queue[tuple[str, JsonDict] | None] = asyncio.Queue()
+        concurrency = self.settings.ai_backfill_concurrency
+
+        async def produce() -> None:
+            try:
+                batch: list[str] = []
+                async for question_id in question_ids:
+                    progress.received += 1
+                    if not is_uuid(question_id):
+                        progress.missing += 1
+                        continue
+                    batch.append(question_id)
+                    if len(batch) == batch_size:
+                        await self._retrieve_batch(batch, retrieved, progress)
+                        batch = []
+                if batch:
+                    await self._retrieve_batch(batch, retrieved, progress)
+            finally:
+                for _ in range(concurrency):
+                    await retrieved.put(None)
+
+        async def generate() -> None:
+            while (item := await retrieved.get()) is not None:
+                answer = await self._generate(item, progress)
+                if answer is not None:
+                    await results.put((item.question_id, answer))
+
+        async def generate_all() -> None:
+            try:
+                await asyncio.gather(*(generate() for _ in range(concurrency)))
+            finally:
+                await results.put(None)
+
+        with openai_lane("backfill"):
+            tasks = [asyncio.create_task(produce()), asyncio.create_task(generate_all())]
+        try:
+            pending: dict[str, JsonDict] = {}
+            while (result := await results.get()) is not None:
+                question_id, answer = result
+                pending[question_id] = answer
+                if len(pending) >= batch_size:
+                    await self._write(pending, progress)
+                    yield progress
+            await self._write(pending, progress)
+            await asyncio.gather(*tasks)
+            yield progress
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _retrieve_batch(
+        self,
+        question_ids: list[str],
+        retrieved: asyncio.Queue[RetrievedQuestion | None],
+        progress: BackfillProgress,
+    ) -> None:
+        rows = await self._supabase.fetch_question_titles(question_ids)
+        progress.missing += len(question_ids) - len(rows)
+        if not rows:
+            return
+        titles = [row["title"] for row in rows]
+        embeddings = await self._rag_service.embeddings.aembed_documents(titles)
+        filters = [RetrievalFilters.for_category(row.get("category")) for row in rows]
+        documents = await self._rag_service.retrieve_many(titles, embeddings, filters)
+        for row, docs in zip(rows, documents):
+            await retrieved.put(RetrievedQuestion(str(row["id"]), row["title"], docs))
+
+    async def _generate(self, item: RetrievedQuestion, progress: BackfillProgress) -> JsonDict | None:
+        """Return the regenerated answer, or ``None`` to keep the stored one after a failure."""
+        try:
+            answer = await self._rag_service.generate(item.question, item.documents)
+        except Exception as exc:  # noqa: BLE001 counted in progress, the stored answer is kept
+            if isinstance(exc, openai.RateLimitError):
+                progress.rate_limited += 1
+            logger.warning("Backfill failed for question %s: %s", item.question_id, exc)
+            progress.failed += 1
+            return None
+        progress.answered += 1
+        return {**answer, "status": "ready"}
+
+    async def _write(self, pending: dict[str, JsonDict], progress: BackfillProgress) -> None:
+        if not pending:
+            return
+        await self._supabase.update_questions_ai_answers(pending)
+        progress.written += len(pending)
+        pending.clear()
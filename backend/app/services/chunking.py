@@ -0,0 +1,202 @@
+"""Chunkers that turn a stream of PDF pages into embedding-sized pieces of text."""
+
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass, field
+from pathlib import PurePath
+from typing import Any, Protocol
+
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+# "제3조(대항력 등)", "제3조의2(보증금의 회수)", or a repealed "제5조 삭제 <2010. 5. 17.>"
+ARTICLE_RE = re.compile(r"^제\s*(\d+)\s*조(?:\s*의\s*(\d+))?\s*(?:\(([^)]*)\)|(?=삭제))")
+CHAPTER_RE = re.compile(r"^제\s*\d+\s*(?:편|장|절|관)(?:\s|$)")
+SUPPLEMENTARY_RE = re.compile(r"^부\s*칙(?:\s|<|$)")
+REPEALED_RE = re.compile(r"^제\s*\d+\s*조(?:\s*의\s*\d+)?\s*삭제\s*(?:<[^>]*>)?$")
+LAW_TITLE_RE = re.compile(r"^\S.*(?:법|법률|령|규칙)$")
+# Running footer of 국가법령정보센터 PDFs, e.g. "법제처 3 국가법령정보센터"
+PAGE_FOOTER_RE = re.compile(r"^법제처\s+\d+\s+국가법령정보센터$")
+# Download suffixes of 국가법령정보센터 file names, e.g. "(법률)(제19356호)(20230719)"
+FILE_NAME_SUFFIX_RE = re.compile(r"\s*[(\[].*$")
+PARAGRAPH_START_RE = re.compile(r"(?m)^(?=[①-⑳])")  # ① … ⑳ (항)
+ITEM_START_RE = re.compile(r"(?m)^(?=\d+\.\s)")  # 1. 2. … (호)
+
+
+def law_name_from_file_name(file_name: str | None) -> str | None:
+    """Statute name in an upload's file name, without 국가법령정보센터's ``(법률)(제…호)(날짜)`` suffix."""
+    if not file_name:
+        return None
+    stem = FILE_NAME_SUFFIX_RE.sub("", PurePath(file_name).stem).replace("_", " ").strip()
+    return stem or None
+
+
+@dataclass(slots=True)
+class TextChunk:
+    content: str
+    metadata: dict[str, Any] = field(default_factory=dict)
+
+
+class PageChunker(Protocol):
+    def feed(self, page_number: int, text: str) -> list[TextChunk]: ...
+
+    def finish(self) -> list[TextChunk]: ...
+
+
+class RecursivePageChunker:
+    """Generic character splitter applied page by page."""
+
+    def __init__(self, *, chunk_size: int, chunk_overlap: int):
+        self._splitter = RecursiveCharacterTextSplitter(
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap,
+            length_function=len,
+        )
+
+    def feed(self, page_number: int, text: str) -> list[TextChunk]:
+        return [TextChunk(content, {"page": page_number}) for content in self._splitter.split_text(text)]
+
+    def finish(self) -> list[TextChunk]:
+        return []
+
+
+class StatuteChunker:
+    """
+    Splits Korean statutes on article (조) boundaries.
+
+    Each article becomes one chunk whose metadata records the law name, article number and
+    title, so answers can cite them directly. Articles may span pages, so the current article is
+    buffered until the next heading. Articles longer than ``chunk_size`` are packed by paragraph
+    (항), then by item (호), and only then cut by characters with ``chunk_overlap``;
+    continuation parts repeat the article heading so they stay self-describing.
+
+    The law name is the title line before the first article; ``default_law_name`` (e.g. from
+    the file name) is used only when the text has none. Repeats of the title inside articles
+    are running page headers and are dropped.
+    """
+
+    def __init__(self, *, default_law_name: str | None, chunk_size: int, chunk_overlap: int):
+        self.default_law_name = default_law_name
+        self.detected_law_name: str | None = None
+        self._chunk_size = chunk_size
+        self._fallback = RecursiveCharacterTextSplitter(
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap,
+            separators=["\n", ". ", " ", ""],
+        )
+        self._lines: list[str] = []
+        self._page: int | None = None
+        self._article: str | None = None
+        self._article_title: str | None = None
+        self._chapter: str | None = None
+        self._section = "본칙"
+
+    def feed(self, page_number: int, text: str) -> list[TextChunk]:
+        chunks: list[TextChunk] = []
+        for raw_line in text.splitlines():
+            line = raw_line.strip()
+            if not line or PAGE_FOOTER_RE.match(line) or (self._article and line == self.law_name):
+                continue
+
+            if self.detected_law_name is None and self._article is None and LAW_TITLE_RE.match(line):
+                self.detected_law_name = line
+
+            if CHAPTER_RE.match(line):
+                chunks += self._flush()
+                self._chapter = line
+                continue
+
+            if SUPPLEMENTARY_RE.match(line):
+                chunks += self._flush()
+                self._section = "부칙"
+                self._article = self._article_title = self._chapter = None
+
+            article = ARTICLE_RE.match(line)
+            if article:
+                chunks += self._flush()
+                number, branch, title = article.groups()
+                self._article = f"제{number}조" + (f"의{branch}" if branch else "")
+                self._article_title = title.strip() if title else None
+
+            if not self._lines:
+                self._page = page_number
+            self._lines.append(line)
+        return chunks
+
+    def finish(self) -> list[TextChunk]:
+        return self._flush()
+
+    @property
+    def law_name(self) -> str | None:
+        return self.detected_law_name or self.default_law_name
+
+    def _flush(self) -> list[TextChunk]:
+        if not self._lines:
+            return []
+        text = "\n".join(self._lines)
+        self._lines = []
+        if REPEALED_RE.match(text):
+            return []
+
+        metadata: dict[str, Any] = {
+            "page": self._page,
+            "law_name": self.law_name,
+            "article": self._article,
+            "article_title": self._article_title,
+            "chapter": self._chapter,
+            "section": self._section,
+        }
+        metadata = {key: value for key, value in metadata.items() if value is not None}
+
+        parts = self._split_article(text)
+        if len(parts) == 1:
+            return [TextChunk(parts[0], metadata)]
+
+        heading = self.heading(metadata)
+        return [
+            TextChunk(
+                part if index == 0 or not heading else f"{heading}\n{part}",
+                {**metadata, "article_part": index + 1},
+            )
+            for index, part in enumerate(parts)
+        ]
+
+    def _split_article(self, text: str) -> list[str]:
+        if len(text) <= self._chunk_size:
+            return [text]
+
+        units: list[str] = []
+        for paragraph in PARAGRAPH_START_RE.split(text):
+            if len(paragraph) <= self._chunk_size:
+                units.append(paragraph)
+                continue
+            for item in ITEM_START_RE.split(paragraph):
+                if len(item) <= self._chunk_size:
+                    units.append(item)
+                else:
+                    units += self._fallback.split_text(item)
+
+        parts: list[str] = []
+        current = ""
+        for unit in (unit.strip("\n") for unit in units):
+            if not unit:
+                continue
+            if current and len(current) + 1 + len(unit) > self._chunk_size:
+                parts.append(current)
+                current = unit
+            else:
+                current = f"{current}\n{unit}" if current else unit
+        if current:
+            parts.append(current)
+        return parts
+
+    @staticmethod
+    def heading(metadata: dict[str, Any]) -> str:
+        """Citation label such as ``주택임대차보호법 제3조(대항력 등)``."""
+        article = metadata.get("article")
+        if not article:
+            return ""
+        title = metadata.get("article_title")
+        label = f"{article}({title})" if title else article
+        law_name = metadata.get("law_name")
+        return f"{law_name} {label}" if law_name else label
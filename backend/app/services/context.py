@@ -0,0 +1,142 @@
+"""Token-budgeted assembly of retrieved chunks into the prompt context."""
+
+from __future__ import annotations
+
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from typing import Any
+
+import tiktoken
+from langchain_core.documents import Document
+
+# Overlap looked for between neighbouring chunks; the maximum is above both chunk overlap
+# settings, the minimum avoids gluing chunks on a shared punctuation mark
+MAX_OVERLAP_CHARS = 400
+MIN_OVERLAP_CHARS = 10
+
+
+@dataclass(slots=True)
+class Passage:
+    """One or more adjacent chunks of the same document, merged into a single text."""
+
+    content: str
+    metadata: dict[str, Any]
+    score: float
+    chunk_indexes: list[int] = field(default_factory=list)
+
+
+def token_encoding(model: str) -> tiktoken.Encoding:
+    """Tokenizer of ``model``, or the current OpenAI default for models tiktoken does not know."""
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("o200k_base")
+
+
+class ContextBuilder:
+    """
+    Turns ranked chunks into prompt context that fits ``token_budget``.
+
+    Exact duplicates are dropped, chunks with consecutive ``chunk_index`` in the same document
+    are merged with the splitter overlap (or a repeated article heading) removed, and the
+    resulting passages are added best score first while they fit the budget. Tokens are
+    counted on the text as ``format_passage`` renders it, so labels count against the budget.
+    """
+
+    def __init__(
+        self,
+        *,
+        token_budget: int,
+        model: str,
+        format_passage: Callable[[Document], str],
+        separator: str = "\n\n",
+    ):
+        self.token_budget = token_budget
+        self._format = format_passage
+        self._separator = separator
+        self._encoding = token_encoding(model)
+        self._separator_tokens = len(self._encoding.encode(separator))
+
+    def count_tokens(self, text: str) -> int:
+        return len(self._encoding.encode(text))
+
+    def build(self, documents: list[Document]) -> list[Document]:
+        """Select and merge ``documents`` (ordered best first) into budget-sized passages."""
+        passages = sorted(self._merge(documents), key=lambda passage: passage.score, reverse=True)
+        selected: list[Document] = []
+        used = 0
+        for passage in passages:
+            document = Document(
+                page_content=passage.content,
+                metadata={**passage.metadata, "chunk_indexes": passage.chunk_indexes},
+            )
+            cost = self.count_tokens(self._format(document)) + (self._separator_tokens if selected else 0)
+            if used + cost > self.token_budget:
+                continue
+            selected.append(document)
+            used += cost
+        return selected
+
+    def _merge(self, documents: list[Document]) -> list[Passage]:
+        seen: set[str] = set()
+        by_document: dict[object, list[tuple[int, Document, float]]] = {}
+        for rank, doc in enumerate(documents):
+            text = doc.page_content.strip()
+            if not text or text in seen:
+                continue
+            seen.add(text)
+            by_document.setdefault(doc.metadata.get("document_id"), []).append(
+                (doc.metadata.get("chunk_index", -1), doc, self._score(doc, rank))
+            )
+
+        passages: list[Passage] = []
+        for chunks in by_document.values():
+            chunks.sort(key=lambda item: item[0])
+            current: Passage | None = None
+            for chunk_index, doc, score in chunks:
+                if current is not None and chunk_index == current.chunk_indexes[-1] + 1:
+                    current.content = join_overlapping(current.content, self._strip_heading(doc, current))
+                    current.chunk_indexes.append(chunk_index)
+                    current.score = max(current.score, score)
+                    continue
+                if current is not None:
+                    passages.append(current)
+                current = Passage(doc.page_content, dict(doc.metadata), score, [chunk_index])
+            if current is not None:
+                passages.append(current)
+
+        return [passage for passage in passages if not self._contained(passage, passages)]
+
+    @staticmethod
+    def _score(doc: Document, rank: int) -> float:
+        metadata = doc.metadata
+        for key in ("rrf_score", "similarity"):
+            if metadata.get(key) is not None:
+                return float(metadata[key])
+        return 1.0 / (rank + 1)
+
+    @staticmethod
+    def _strip_heading(doc: Document, current: Passage) -> str:
+        """Continuation parts of a long article repeat its heading line; drop it when merging."""
+        text = doc.page_content
+        same_article = doc.metadata.get("article") and doc.metadata.get("article") == current.metadata.get("article")
+        if same_article and doc.metadata.get("article_part", 1) > 1 and "\n" in text:
+            return text.split("\n", 1)[1]
+        return text
+
+    @staticmethod
+    def _contained(passage: Passage, passages: list[Passage]) -> bool:
+        return any(
+            other is not passage
+            and len(other.content) > len(passage.content)
+            and passage.content in other.content
+            for other in passages
+        )
+
+
+def join_overlapping(left: str, right: str) -> str:
+    """Concatenate two neighbouring chunks, keeping the text they share only once."""
+    for size in range(min(len(left), len(right), MAX_OVERLAP_CHARS), MIN_OVERLAP_CHARS - 1, -1):
+        if left.endswith(right[:size]):
+            return left + right[size:]
+    return f"{left}\n{right}"
@@ -0,0 +1,144 @@
+"""Persistent, content-addressed cache for OpenAI embeddings."""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+# Stay below SQLITE_MAX_VARIABLE_NUMBER on older SQLite builds
+_SQLITE_BATCH = 500
+
+
+class EmbeddingCache:
+    """
+    SQLite-backed store of embedding vectors keyed by ``sha256(model, text)``.
+
+    Vectors are stored as float32 blobs (6 KiB for a 1536-dimension embedding). Reads refresh
+    an access timestamp and writes evict the least recently used rows beyond ``max_entries``.
+    """
+
+    def __init__(self, path: str | Path, *, max_entries: int):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(path), check_same_thread=False)
+        self._conn.execute("pragma journal_mode=wal")
+        self._conn.execute(
+            "create table if not exists embeddings ("
+            " key text primary key,"
+            " vector blob not null,"
+            " accessed_at real not null)"
+        )
+        self._conn.execute("create index if not exists idx_embeddings_accessed_at on embeddings (accessed_at)")
+        self._conn.commit()
+        (self._approx_rows,) = self._conn.execute("select count(*) from embeddings").fetchone()
+
+    @staticmethod
+    def key(model: str, text: str) -> str:
+        return hashlib.sha256(f"{model}\0{text}".encode()).hexdigest()
+
+    def get_many(self, keys: list[str]) -> dict[str, list[float]]:
+        rows: list[tuple[str, bytes]] = []
+        with self._lock:
+            for start in range(0, len(keys), _SQLITE_BATCH):
+                batch = keys[start : start + _SQLITE_BATCH]
+                placeholders = ",".join("?" * len(batch))
+                rows += self._conn.execute(
+                    f"select key, vector from embeddings where key in ({placeholders})",  # noqa: S608
+                    batch,
+                ).fetchall()
+            if rows:
+                self._conn.executemany(
+                    "update embeddings set accessed_at = ? where key = ?",
+                    [(time.time(), key) for key, _ in rows],
+                )
+                self._conn.commit()
+        found = {key: np.frombuffer(blob, dtype=np.float32).tolist() for key, blob in rows}
+        self.hits += len(found)
+        self.misses += len(set(keys)) - len(found)
+        return found
+
+    def put_many(self, items: dict[str, list[float]]) -> None:
+        if not items:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "insert or replace into embeddings (key, vector, accessed_at) values (?, ?, ?)",
+                [(key, np.asarray(vector, dtype=np.float32).tobytes(), now) for key, vector in items.items()],
+            )
+            self._approx_rows += len(items)
+            # Evict in bulk once the table overshoots by 5% instead of scanning on every write
+            if self._approx_rows > self.max_entries * 1.05:
+                self._conn.execute(
+                    "delete from embeddings where key in ("
+                    " select key from embeddings order by accessed_at desc limit -1 offset ?)",
+                    (self.max_entries,),
+                )
+                (self._approx_rows,) = self._conn.execute("select count(*) from embeddings").fetchone()
+            self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class CachedEmbeddings(Embeddings):
+    """Read-through wrapper that only sends cache misses to the underlying embeddings model."""
+
+    def __init__(self, underlying: Embeddings, cache: EmbeddingCache, *, model: str):
+        self.underlying = underlying
+        self.cache = cache
+        self.model = model
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        keys = [EmbeddingCache.key(self.model, text) for text in texts]
+        found = self.cache.get_many(keys)
+        missing = self._missing(texts, keys, found)
+        if missing:
+            vectors = self.underlying.embed_documents(list(missing.values()))
+            computed = dict(zip(missing, vectors))
+            self.cache.put_many(computed)
+            found.update(computed)
+        return [found[key] for key in keys]
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        keys = [EmbeddingCache.key(self.model, text) for text in texts]
+        found = await asyncio.to_thread(self.cache.get_many, keys)
+        missing = self._missing(texts, keys, found)
+        if missing:
+            vectors = await self.underlying.aembed_documents(list(missing.values()))
+            computed = dict(zip(missing, vectors))
+            await asyncio.to_thread(self.cache.put_many, computed)
+            found.update(computed)
+        return [found[key] for key in keys]
+
+    def embed_query(self, text: str) -> list[float]:
+        key = EmbeddingCache.key(self.model, text)
+        found = self.cache.get_many([key])
+        if key not in found:
+            found[key] = self.underlying.embed_query(text)
+            self.cache.put_many(found)
+        return found[key]
+
+    async def aembed_query(self, text: str) -> list[float]:
+        key = EmbeddingCache.key(self.model, text)
+        found = await asyncio.to_thread(self.cache.get_many, [key])
+        if key not in found:
+            found[key] = await self.underlying.aembed_query(text)
+            await asyncio.to_thread(self.cache.put_many, found)
+        return found[key]
+
+    @staticmethod
+    def _missing(texts: list[str], keys: list[str], found: dict[str, list[float]]) -> dict[str, str]:
+        """Map each uncached key to its text, de-duplicating repeated texts."""
+        return {key: text for key, text in zip(keys, texts) if key not in found}
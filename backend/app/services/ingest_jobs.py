@@ -0,0 +1,224 @@
+"""Background PDF ingestion jobs with persisted progress and resume support."""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+import uuid
+from pathlib import Path
+
+from fastapi import HTTPException, UploadFile, status
+
+from app.core.config import Settings
+from app.services.chunking import law_name_from_file_name
+from app.services.ingestion import IngestMode, IngestProgress
+from app.services.openai_governor import openai_lane
+from app.services.rag import RAGService
+from app.services.supabase import JsonDict, SupabaseService
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_READ_SIZE = 1024 * 1024
+
+# Clears a job's lease once it has finished, so a resume is not held back until it expires
+RELEASED_LEASE: JsonDict = {"claimed_by": None, "claimed_until": None}
+
+
+class IngestJobManager:
+    """
+    Runs ``RAGService.ingest_pdf`` outside the request and records progress in ``ingest_jobs``.
+
+    Uploads are spooled to ``ingest_spool_dir`` and kept until the job succeeds. A full run
+    first deletes the document's previous chunks and records ``chunks_cleared`` on the job;
+    from then on the stored chunk indexes are its own checkpoints, so a failed, timed-out or
+    interrupted job resumes where it stopped. An incremental run is resumable by design since
+    it re-diffs against the stored rows.
+
+    A job only runs in the process holding its lease (``claim_ingest_job``), renewed while it
+    runs, so several processes never ingest the same job. Every ``ingest_job_claim_lease_seconds``
+    the manager claims the unfinished jobs whose upload is in its spool directory, which resumes
+    jobs left ``queued``/``running`` by a stopped or crashed process.
+    """
+
+    def __init__(self, settings: Settings, rag_service: RAGService, supabase: SupabaseService):
+        self.settings = settings
+        self._rag_service = rag_service
+        self._supabase = supabase
+        self._spool_dir = Path(settings.ingest_spool_dir)
+        self._slots = asyncio.Semaphore(settings.ingest_max_concurrent_jobs)
+        self._tasks: dict[str, asyncio.Task[None]] = {}
+        self._sweeper: asyncio.Task[None] | None = None
+
+    async def start(self) -> None:
+        self._spool_dir.mkdir(parents=True, exist_ok=True)
+        self._sweeper = asyncio.create_task(self._sweep(), name="ingest-job-sweeper")
+
+    async def stop(self) -> None:
+        tasks = list(self._tasks.values())
+        if self._sweeper is not None:
+            tasks.append(self._sweeper)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks.clear()
+        self._sweeper = None
+        try:
+            await self._supabase.release_ingest_job_claims()
+        except Exception:  # noqa: BLE001 unreleased leases expire on their own
+            logger.exception("Could not release ingest job leases")
+
+    async def submit(self, file: UploadFile, document_id: str, user_id: str, *, mode: IngestMode = "full") -> JsonDict:
+        """Spool the upload to disk, record a queued job and start it in the background."""
+        spool_path = self._spool_dir / f"{uuid.uuid4()}.pdf"
+        with spool_path.open("wb") as spool_file:
+            while block := await file.read(UPLOAD_READ_SIZE):
+                spool_file.write(block)
+
+        job = await self._supabase.create_ingest_job(
+            {
+                "document_id": document_id,
+                "file_name": file.filename,
+                "mode": mode,
+                "spool_path": str(spool_path),
+                "created_by": user_id,
+            }
+        )
+        claimed = await self._supabase.claim_ingest_job(str(job["id"]), lease_seconds=self._lease)
+        if claimed is not None:
+            self._schedule(claimed)
+        return claimed or job
+
+    async def resume(self, job_id: str) -> JsonDict:
+        """Re-run a failed job from its last checkpoint."""
+        job = await self._supabase.fetch_ingest_job(job_id)
+        if job["status"] == "succeeded" or job_id in self._tasks:
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"Ingest job is {job['status']}")
+        if not job.get("spool_path") or not Path(job["spool_path"]).exists():
+            raise HTTPException(status_code=status.HTTP_410_GONE, detail="Uploaded file is no longer available")
+
+        if job["status"] == "failed":
+            await self._supabase.update_ingest_job(job_id, {"status": "queued", "error": None})
+        claimed = await self._supabase.claim_ingest_job(job_id, lease_seconds=self._lease)
+        if claimed is None:
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Ingest job is running in another process")
+        self._schedule(claimed)
+        return claimed
+
+    @property
+    def _lease(self) -> float:
+        return self.settings.ingest_job_claim_lease_seconds
+
+    async def _sweep(self) -> None:
+        """Claim and run unfinished jobs whose upload is spooled here, now and every lease period."""
+        while True:
+            try:
+                for job in await self._supabase.fetch_unfinished_ingest_jobs():
+                    job_id = str(job["id"])
+                    if job_id in self._tasks or not Path(job.get("spool_path") or "").is_file():
+                        continue
+                    claimed = await self._supabase.claim_ingest_job(job_id, lease_seconds=self._lease)
+                    if claimed is not None:
+                        self._schedule(claimed)
+            except Exception:  # noqa: BLE001 the next sweep tries again
+                logger.exception("Could not load unfinished ingest jobs")
+            await asyncio.sleep(self._lease)
+
+    async def _hold_lease(self, job_id: str, run: asyncio.Task[None]) -> None:
+        """Renew the job's lease while it runs; stop the run if another process took it over."""
+        while True:
+            await asyncio.sleep(self._lease / 3)
+            try:
+                claimed = await self._supabase.claim_ingest_job(job_id, lease_seconds=self._lease)
+            except Exception:  # noqa: BLE001 renewed on the next tick, well within the lease
+                logger.exception("Could not renew the lease of ingest job %s", job_id)
+                continue
+            if claimed is None:
+                logger.warning("Ingest job %s was taken over by another process", job_id)
+                run.cancel()
+                return
+
+    def _schedule(self, job: JsonDict) -> None:
+        job_id = str(job["id"])
+        if job_id in self._tasks:
+            return
+        task = asyncio.create_task(self._run(job), name=f"ingest-job-{job_id}")
+        lease = asyncio.create_task(self._hold_lease(job_id, task), name=f"ingest-lease-{job_id}")
+        self._tasks[job_id] = task
+
+        def finished(_: asyncio.Task[None]) -> None:
+            lease.cancel()
+            self._tasks.pop(job_id, None)
+
+        task.add_done_callback(finished)
+
+    async def _run(self, job: JsonDict) -> None:
+        job_id = str(job["id"])
+        document_id = str(job["document_id"])
+        spool_path = Path(job.get("spool_path") or "")
+        if not spool_path.is_file():
+            await self._supabase.update_ingest_job(
+                job_id, {"status": "failed", "error": "Uploaded file is no longer available", **RELEASED_LEASE}
+            )
+            return
+
+        async with self._slots:
+            progress = IngestProgress()
+            last_report = 0.0
+            report_task: asyncio.Task[JsonDict] | None = None
+
+            def on_progress(snapshot: IngestProgress) -> None:
+                # One progress PATCH in flight at a time so updates land in order
+                nonlocal progress, last_report, report_task
+                progress = snapshot
+                now = time.monotonic()
+                if now - last_report < self.settings.ingest_progress_interval_seconds:
+                    return
+                if report_task is None or report_task.done():
+                    last_report = now
+                    report_task = asyncio.create_task(self._supabase.update_ingest_job(job_id, snapshot.as_dict()))
+
+            try:
+                await self._supabase.update_ingest_job(
+                    job_id, {"status": "running", "attempts": int(job.get("attempts") or 0) + 1}
+                )
+                mode: IngestMode = job.get("mode") or "full"
+                stored_chunks = await self._checkpoints(job) if mode == "full" else None
+                with openai_lane("ingestion"):
+                    await asyncio.wait_for(
+                        self._rag_service.ingest_pdf(
+                            str(spool_path),
+                            document_id,
+                            mode=mode,
+                            law_name=law_name_from_file_name(job.get("file_name")),
+                            on_progress=on_progress,
+                            stored_chunks=stored_chunks,
+                        ),
+                        timeout=self.settings.ingest_job_timeout_seconds,
+                    )
+                outcome: JsonDict = {"status": "succeeded", "error": None}
+            except asyncio.CancelledError:
+                # Left as "running" on purpose: once the lease is released or expires, a sweep
+                # in this or another process resumes it.
+                raise
+            except Exception as exc:  # noqa: BLE001 recorded on the job for the admin
+                logger.exception("Ingest job %s failed", job_id)
+                outcome = {"status": "failed", "error": "Timed out" if isinstance(exc, asyncio.TimeoutError) else str(exc)}
+            finally:
+                if report_task is not None:
+                    await asyncio.gather(report_task, return_exceptions=True)
+
+        await self._supabase.update_ingest_job(job_id, {**progress.as_dict(), **outcome, **RELEASED_LEASE})
+        if outcome["status"] == "succeeded":
+            spool_path.unlink(missing_ok=True)
+
+    async def _checkpoints(self, job: JsonDict) -> set[int]:
+        """Chunks a full run may skip: those this job already stored before it was interrupted."""
+        document_id = str(job["document_id"])
+        if job.get("chunks_cleared"):
+            return await self._supabase.fetch_document_chunk_indexes(document_id)
+        # A fresh run: rows of the previous upload would otherwise be skipped as done and
+        # trailing chunks of a longer previous version would never be deleted.
+        await self._supabase.delete_document_chunks(document_id)
+        await self._supabase.update_ingest_job(str(job["id"]), {"chunks_cleared": True})
+        return set()
@@ -0,0 +1,117 @@
+"""Building blocks for the streaming PDF ingestion pipeline."""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+from collections import defaultdict, deque
+from collections.abc import AsyncIterator, Callable
+from concurrent.futures import Executor
+from dataclasses import asdict, dataclass
+from typing import Any, Literal
+
+from pypdf import PdfReader
+
+IngestMode = Literal["full", "incremental"]
+
+
+@dataclass(slots=True)
+class IngestProgress:
+    pages_total: int = 0
+    pages_parsed: int = 0
+    chunks_created: int = 0
+    chunks_embedded: int = 0
+    chunks_stored: int = 0
+    chunks_reused: int = 0
+    chunks_deleted: int = 0
+
+    def as_dict(self) -> dict[str, int]:
+        return asdict(self)
+
+
+ProgressCallback = Callable[[IngestProgress], None]
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def temporary_chunk_index(chunk_index: int) -> int:
+    """Negative slot used for a chunk until ``apply_document_chunk_diff`` moves it into place."""
+    return -chunk_index - 1
+
+
+class ChunkDiff:
+    """
+    Matches the chunks of a new document version against the rows already stored for it.
+
+    A new chunk whose content hash matches a stored row reuses that row (and its embedding);
+    the row only changes position when its ``chunk_index`` differs. Stored rows that no new
+    chunk claimed are reported as removed.
+    """
+
+    def __init__(self, stored_rows: list[dict[str, Any]]):
+        self._stored_ids = [str(row["id"]) for row in stored_rows]
+        self._by_hash: dict[str, list[dict[str, Any]]] = defaultdict(list)
+        for row in stored_rows:
+            if row.get("content_hash"):
+                self._by_hash[row["content_hash"]].append(row)
+        self._claimed: set[str] = set()
+        self.moves: list[dict[str, Any]] = []
+
+    def claim(self, chunk_index: int, digest: str) -> bool:
+        """Reuse a stored row for the chunk; ``False`` means it must be embedded and inserted."""
+        candidates = self._by_hash.get(digest)
+        if not candidates:
+            return False
+        row = next((row for row in candidates if row["chunk_index"] == chunk_index), candidates[0])
+        candidates.remove(row)
+        self._claimed.add(str(row["id"]))
+        if row["chunk_index"] != chunk_index:
+            self.moves.append({"id": row["id"], "chunk_index": chunk_index})
+        return True
+
+    @property
+    def removed_ids(self) -> list[str]:
+        return [row_id for row_id in self._stored_ids if row_id not in self._claimed]
+
+
+def count_pdf_pages(pdf_path: str) -> int:
+    return len(PdfReader(pdf_path).pages)
+
+
+def extract_pdf_pages(pdf_path: str, start: int, stop: int) -> list[str]:
+    """Extract the text of pages ``[start, stop)``; runs inside a worker process."""
+    reader = PdfReader(pdf_path)
+    return [reader.pages[index].extract_text() or "" for index in range(start, stop)]
+
+
+async def iter_pdf_pages(
+    pdf_path: str,
+    executor: Executor,
+    *,
+    batch_size: int,
+    prefetch: int,
+    progress: IngestProgress,
+) -> AsyncIterator[tuple[int, str]]:
+    """
+    Yield ``(page_number, text)`` in page order while later pages are parsed in the background.
+
+    Pages are extracted in batches of ``batch_size`` on ``executor``; at most ``prefetch``
+    batches are in flight, which bounds memory regardless of the document size.
+    """
+    loop = asyncio.get_running_loop()
+    progress.pages_total = await loop.run_in_executor(executor, count_pdf_pages, pdf_path)
+
+    starts = deque(range(0, progress.pages_total, batch_size))
+    in_flight: deque[tuple[int, asyncio.Future[list[str]]]] = deque()
+    while starts or in_flight:
+        while starts and len(in_flight) < prefetch:
+            start = starts.popleft()
+            stop = min(start + batch_size, progress.pages_total)
+            in_flight.append((start, loop.run_in_executor(executor, extract_pdf_pages, pdf_path, start, stop)))
+
+        start, future = in_flight.popleft()
+        for offset, text in enumerate(await future):
+            progress.pages_parsed += 1
+            yield start + offset, text
@@ -0,0 +1,364 @@
+"""Shared admission control and rate limiting for every call to the OpenAI API."""
+
+from __future__ import annotations
+
+import asyncio
+import heapq
+import itertools
+import math
+import time
+from collections import Counter
+from collections.abc import AsyncIterator, Awaitable, Callable, Iterator
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Literal, TypeVar
+
+import httpx
+import openai
+from langchain_core.embeddings import Embeddings
+
+from app.core.config import Settings
+from app.core.observability import record_tokens
+
+T = TypeVar("T")
+
+Lane = Literal["interactive", "ingestion", "backfill"]
+# Lower runs first: waiting interactive calls are always granted before ingestion or backfills
+LANE_PRIORITY: dict[Lane, int] = {"interactive": 0, "ingestion": 1, "backfill": 2}
+
+# Errors worth retrying; only 429 pauses every lane
+RETRYABLE_ERRORS = (openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError)
+
+current_lane: ContextVar[Lane] = ContextVar("openai_lane", default="interactive")
+
+
+@contextmanager
+def openai_lane(lane: Lane) -> Iterator[None]:
+    """Run OpenAI calls made in this context (and tasks created in it) in ``lane``."""
+    token = current_lane.set(lane)
+    try:
+        yield
+    finally:
+        current_lane.reset(token)
+
+
+class OpenAIOverloadedError(Exception):
+    """A lane's queue is full; answered as 503 with ``Retry-After``."""
+
+    def __init__(self, lane: Lane, retry_after: float):
+        super().__init__(f"OpenAI {lane} queue is full, please retry shortly")
+        self.lane = lane
+        self.retry_after = retry_after
+
+
+def retry_after_seconds(headers: httpx.Headers) -> float | None:
+    """Delay requested by a rate-limited OpenAI response, if any."""
+    for name, scale in (("retry-after-ms", 0.001), ("retry-after", 1.0)):
+        value = headers.get(name)
+        if value:
+            try:
+                return float(value) * scale
+            except ValueError:
+                continue
+    return None
+
+
+def provider_retry_after(exc: BaseException) -> float | None:
+    """Delay an OpenAI failure asks for before the call is tried again, if it says."""
+    if isinstance(exc, OpenAIOverloadedError):
+        return exc.retry_after
+    if isinstance(exc, openai.RateLimitError):
+        return retry_after_seconds(exc.response.headers)
+    return None
+
+
+class TokenBucket:
+    """Refills continuously at ``per_minute / 60`` units per second, holding at most a minute's worth."""
+
+    def __init__(self, per_minute: int):
+        self.rate = per_minute / 60.0
+        self.capacity = float(per_minute)
+        self._level = self.capacity
+        self._updated = time.monotonic()
+
+    def delay(self, amount: float, now: float) -> float:
+        """Seconds until ``amount`` can be taken; requests above the capacity wait for a full bucket."""
+        self._refill(now)
+        missing = min(amount, self.capacity) - self._level
+        return max(missing / self.rate, 0.0)
+
+    def take(self, amount: float, now: float) -> None:
+        self._refill(now)
+        self._level -= min(amount, self.capacity)
+
+    def adjust(self, amount: float) -> None:
+        """Charge (or refund) the difference between an estimate and the actual usage."""
+        self._level = min(self._level - amount, self.capacity)
+
+    def _refill(self, now: float) -> None:
+        self._level = min(self._level + (now - self._updated) * self.rate, self.capacity)
+        self._updated = now
+
+
+@dataclass(slots=True)
+class GovernorStats:
+    granted: int = 0
+    rejected: int = 0
+    rate_limited: int = 0
+    retried: int = 0
+    wait_seconds: float = 0.0
+
+    def as_dict(self) -> dict[str, int | float]:
+        return {
+            "granted": self.granted,
+            "rejected": self.rejected,
+            "rate_limited": self.rate_limited,
+            "retried": self.retried,
+            "average_wait_seconds": self.wait_seconds / self.granted if self.granted else 0.0,
+        }
+
+
+@dataclass(slots=True, order=True)
+class _Waiter:
+    priority: int
+    sequence: int
+    lane: Lane = field(compare=False)
+    tokens: int = field(compare=False)
+
+
+@dataclass(slots=True)
+class Grant:
+    """Permission for one request; set ``used_tokens`` once the actual usage is known."""
+
+    tokens: int
+    used_tokens: int | None = None
+
+
+class OpenAIGovernor:
+    """
+    Process-wide gate in front of OpenAI that keeps throughput at the account limits.
+
+    Each call first takes a slot: a request from the requests-per-minute bucket, its estimated
+    tokens from the tokens-per-minute bucket and one of ``max_concurrency`` in-flight places.
+    Waiting calls are granted strictly by lane priority, then in arrival order, so interactive
+    questions never queue behind an ingestion or a backfill. A lane already holding
+    ``max_queue_depth[lane]`` waiters rejects new calls with :class:`OpenAIOverloadedError`
+    instead of growing the queue.
+
+    A 429 pauses every lane for the response's ``Retry-After`` (or an exponential backoff when
+    absent), so callers wait out the limit together instead of retrying into it. :meth:`call`
+    and :meth:`stream` retry 429s, connection errors and 5xx up to ``max_retries`` times.
+    """
+
+    def __init__(
+        self,
+        *,
+        requests_per_minute: int,
+        tokens_per_minute: int,
+        max_concurrency: int,
+        max_queue_depth: dict[Lane, int],
+        max_retries: int,
+        retry_base_delay: float,
+    ):
+        self.max_concurrency = max_concurrency
+        self.max_queue_depth = max_queue_depth
+        self.max_retries = max_retries
+        self.retry_base_delay = retry_base_delay
+        self.stats = GovernorStats()
+        self._requests = TokenBucket(requests_per_minute)
+        self._tokens = TokenBucket(tokens_per_minute)
+        self._waiters: list[_Waiter] = []
+        self._depth: Counter[Lane] = Counter()
+        self._sequence = itertools.count()
+        self._in_flight = 0
+        self._paused_until = 0.0
+        self._backoff = retry_base_delay
+        self._changed = asyncio.Condition()
+
+    @classmethod
+    def from_settings(cls, settings: Settings) -> OpenAIGovernor:
+        return cls(
+            requests_per_minute=settings.openai_requests_per_minute,
+            tokens_per_minute=settings.openai_tokens_per_minute,
+            max_concurrency=settings.openai_max_concurrency,
+            max_queue_depth={
+                "interactive": settings.openai_queue_depth_interactive,
+                "ingestion": settings.openai_queue_depth_ingestion,
+                "backfill": settings.openai_queue_depth_backfill,
+            },
+            max_retries=settings.openai_max_retries,
+            retry_base_delay=settings.openai_retry_base_delay,
+        )
+
+    def queue_depths(self) -> dict[Lane, int]:
+        return {lane: self._depth[lane] for lane in LANE_PRIORITY}
+
+    def estimated_wait(self, lane: Lane, *, backlog: int = 0) -> float:
+        """Seconds until a new ``lane`` call would start, counting ``backlog`` extra calls ahead of it."""
+        ahead = backlog + sum(
+            depth for other, depth in self._depth.items() if LANE_PRIORITY[other] <= LANE_PRIORITY[lane]
+        )
+        paused = max(self._paused_until - time.monotonic(), 0.0)
+        return paused + ahead / self._requests.rate
+
+    def admit(self, lane: Lane | None = None, *, backlog: int = 0) -> None:
+        """Raise :class:`OpenAIOverloadedError` when ``lane`` cannot take another call."""
+        lane = lane or current_lane.get()
+        if self._depth[lane] + backlog >= self.max_queue_depth[lane]:
+            self.stats.rejected += 1
+            raise OpenAIOverloadedError(lane, self.estimated_wait(lane, backlog=backlog))
+
+    @asynccontextmanager
+    async def slot(self, tokens: int, *, lane: Lane | None = None) -> AsyncIterator[Grant]:
+        """Hold one request slot for ``tokens`` estimated tokens while the body runs."""
+        lane = lane or current_lane.get()
+        self.admit(lane)
+        waiter = _Waiter(LANE_PRIORITY[lane], next(self._sequence), lane, tokens)
+        started = time.monotonic()
+        async with self._changed:
+            heapq.heappush(self._waiters, waiter)
+            self._depth[lane] += 1
+            try:
+                while (delay := self._grant_delay(waiter)) > 0:
+                    try:
+                        await asyncio.wait_for(self._changed.wait(), None if math.isinf(delay) else delay)
+                    except asyncio.TimeoutError:
+                        pass
+            except BaseException:
+                self._waiters.remove(waiter)
+                heapq.heapify(self._waiters)
+                self._depth[lane] -= 1
+                self._changed.notify_all()
+                raise
+            heapq.heappop(self._waiters)
+            self._depth[lane] -= 1
+            now = time.monotonic()
+            self._requests.take(1, now)
+            self._tokens.take(tokens, now)
+            self._in_flight += 1
+            self.stats.granted += 1
+            self.stats.wait_seconds += now - started
+            self._changed.notify_all()
+
+        grant = Grant(tokens)
+        try:
+            yield grant
+        finally:
+            if grant.used_tokens is not None:
+                self._tokens.adjust(grant.used_tokens - tokens)
+            self._in_flight -= 1
+            async with self._changed:
+                self._changed.notify_all()
+
+    async def call(
+        self,
+        tokens: int,
+        request: Callable[[], Awaitable[T]],
+        *,
+        lane: Lane | None = None,
+        usage: Callable[[T], int | None] | None = None,
+    ) -> T:
+        """Run ``request`` in a slot, retrying transient failures; ``usage`` reads the actual tokens."""
+        attempt = 0
+        while True:
+            try:
+                async with self.slot(tokens, lane=lane) as grant:
+                    result = await request()
+                    if usage is not None:
+                        grant.used_tokens = usage(result)
+            except RETRYABLE_ERRORS as exc:
+                delay = self._record_failure(exc)
+                if attempt >= self.max_retries:
+                    raise
+                attempt += 1
+                self.stats.retried += 1
+                await asyncio.sleep(delay)
+                continue
+            self._backoff = self.retry_base_delay
+            return result
+
+    async def stream(
+        self,
+        tokens: int,
+        request: Callable[[], AsyncIterator[T]],
+        *,
+        lane: Lane | None = None,
+    ) -> AsyncIterator[T]:
+        """Iterate ``request`` in a slot; failures are retried only before the first item."""
+        attempt = 0
+        while True:
+            received = False
+            try:
+                async with self.slot(tokens, lane=lane):
+                    async for item in request():
+                        received = True
+                        yield item
+            except RETRYABLE_ERRORS as exc:
+                delay = self._record_failure(exc)
+                if received or attempt >= self.max_retries:
+                    raise
+                attempt += 1
+                self.stats.retried += 1
+                await asyncio.sleep(delay)
+                continue
+            self._backoff = self.retry_base_delay
+            return
+
+    def _grant_delay(self, waiter: _Waiter) -> float:
+        """Seconds until ``waiter`` may run; infinite while it is not next or no place is free."""
+        if self._waiters[0] is not waiter or self._in_flight >= self.max_concurrency:
+            return math.inf
+        now = time.monotonic()
+        return max(
+            self._paused_until - now,
+            self._requests.delay(1, now),
+            self._tokens.delay(waiter.tokens, now),
+            0.0,
+        )
+
+    def _record_failure(self, exc: BaseException) -> float:
+        """Back off after a failed request; returns how long the caller sleeps before retrying."""
+        delay = provider_retry_after(exc) or self._backoff
+        self._backoff = min(self._backoff * 2, 60.0)
+        if isinstance(exc, openai.RateLimitError):
+            self.stats.rate_limited += 1
+            # The pause holds back the next slot of every lane, the retry included
+            self._paused_until = max(self._paused_until, time.monotonic() + delay)
+            return 0.0
+        return delay
+
+
+class GovernedEmbeddings(Embeddings):
+    """Sends every embeddings request through the governor, charged by input tokens."""
+
+    def __init__(
+        self,
+        underlying: Embeddings,
+        governor: OpenAIGovernor,
+        *,
+        model: str,
+        count_tokens: Callable[[str], int],
+    ):
+        self.underlying = underlying
+        self.governor = governor
+        self.model = model
+        self.count_tokens = count_tokens
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return self.underlying.embed_documents(texts)
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        tokens = sum(self.count_tokens(text) for text in texts)
+        vectors = await self.governor.call(tokens, lambda: self.underlying.aembed_documents(texts))
+        record_tokens(self.model, "embedding", tokens)
+        return vectors
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.underlying.embed_query(text)
+
+    async def aembed_query(self, text: str) -> list[float]:
+        tokens = self.count_tokens(text)
+        vector = await self.governor.call(tokens, lambda: self.underlying.aembed_query(text))
+        record_tokens(self.model, "embedding", tokens)
+        return vector
@@ -0,0 +1,161 @@
+"""Read-through cache of question records served by ``GET /questions/{id}``."""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+
+# Expired rows are purged from the shared store every this many writes
+_PURGE_INTERVAL = 500
+
+
+@dataclass(slots=True, frozen=True)
+class CachedQuestion:
+    record: dict[str, Any]
+    etag: str
+
+
+def question_etag(record: dict[str, Any]) -> str:
+    """Strong validator derived from the record's canonical JSON."""
+    digest = hashlib.sha256(json.dumps(record, sort_keys=True, default=str).encode()).hexdigest()
+    return f'"{digest[:32]}"'
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = {candidate.strip().removeprefix("W/") for candidate in if_none_match.split(",")}
+    return "*" in candidates or etag in candidates
+
+
+class SharedQuestionStore:
+    """
+    SQLite file shared by every worker process on the host.
+
+    A local stand-in for a shared cache such as Redis: entries written or invalidated by one
+    process are seen by the others, which only keep them in memory for the short local TTL.
+    """
+
+    def __init__(self, path: str | Path):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._conn = sqlite3.connect(str(path), check_same_thread=False)
+        self._conn.execute("pragma journal_mode=wal")
+        self._conn.execute(
+            "create table if not exists questions ("
+            " id text primary key,"
+            " record text not null,"
+            " etag text not null,"
+            " expires_at real not null)"
+        )
+        self._conn.commit()
+
+    def get(self, question_id: str) -> CachedQuestion | None:
+        with self._lock:
+            row = self._conn.execute(
+                "select record, etag from questions where id = ? and expires_at > ?",
+                (question_id, time.time()),
+            ).fetchone()
+        return CachedQuestion(json.loads(row[0]), row[1]) if row else None
+
+    def put(self, question_id: str, entry: CachedQuestion, ttl_seconds: float) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "insert or replace into questions (id, record, etag, expires_at) values (?, ?, ?, ?)",
+                (question_id, json.dumps(entry.record, default=str), entry.etag, now + ttl_seconds),
+            )
+            self._writes += 1
+            if self._writes % _PURGE_INTERVAL == 0:
+                self._conn.execute("delete from questions where expires_at <= ?", (now,))
+            self._conn.commit()
+
+    def delete(self, question_ids: list[str]) -> None:
+        with self._lock:
+            self._conn.executemany("delete from questions where id = ?", [(question_id,) for question_id in question_ids])
+            self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class QuestionCache:
+    """
+    In-process TTL/LRU cache of question records (with their embedded answers), keyed by id.
+
+    With a :class:`SharedQuestionStore` the in-process layer is checked first and misses fall
+    through to the shared store before PostgREST. Writers invalidate both layers.
+    """
+
+    def __init__(
+        self,
+        *,
+        ttl_seconds: float,
+        max_entries: int,
+        shared: SharedQuestionStore | None = None,
+        shared_ttl_seconds: float | None = None,
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._shared = shared
+        self._shared_ttl = shared_ttl_seconds or ttl_seconds
+        self._entries: OrderedDict[str, tuple[CachedQuestion, float]] = OrderedDict()
+
+    async def get(self, question_id: str) -> CachedQuestion | None:
+        local = self._entries.get(question_id)
+        if local is not None:
+            entry, expires_at = local
+            if time.monotonic() < expires_at:
+                self._entries.move_to_end(question_id)
+                self.hits += 1
+                return entry
+            del self._entries[question_id]
+
+        if self._shared is not None:
+            entry = await asyncio.to_thread(self._shared.get, question_id)
+            if entry is not None:
+                self._remember(question_id, entry)
+                self.hits += 1
+                return entry
+
+        self.misses += 1
+        return None
+
+    async def put(self, question_id: str, record: dict[str, Any]) -> CachedQuestion:
+        entry = CachedQuestion(record, question_etag(record))
+        self._remember(question_id, entry)
+        if self._shared is not None:
+            await asyncio.to_thread(self._shared.put, question_id, entry, self._shared_ttl)
+        return entry
+
+    async def invalidate(self, *question_ids: str) -> None:
+        for question_id in question_ids:
+            self._entries.pop(question_id, None)
+        if self._shared is not None and question_ids:
+            await asyncio.to_thread(self._shared.delete, list(question_ids))
+
+    def close(self) -> None:
+        self._entries.clear()
+        if self._shared is not None:
+            self._shared.close()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _remember(self, question_id: str, entry: CachedQuestion) -> None:
+        self._entries[question_id] = (entry, time.monotonic() + self.ttl_seconds)
+        self._entries.move_to_end(question_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
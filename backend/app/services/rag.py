@@ -2,17 +2,45 @@
 
 from __future__ import annotations
 
+import asyncio
+import hashlib
+import time
+from collections.abc import AsyncIterator
+from concurrent.futures import ProcessPoolExecutor
 from typing import Any
 
-from langchain.chains import RetrievalQA
+import httpx
 from langchain.prompts import PromptTemplate
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.document_loaders import PyPDFLoader
-from langchain_community.vectorstores import SupabaseVectorStore
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
 from langchain_openai import ChatOpenAI, OpenAIEmbeddings
-from supabase import Client, create_client
 
 from app.core.config import Settings
+from app.core.observability import record_tokens, span, timed
+from app.services.answer_cache import SemanticAnswerCache
+from app.services.chunking import PageChunker, RecursivePageChunker, StatuteChunker, TextChunk
+from app.services.context import ContextBuilder, token_encoding
+from app.services.embedding_cache import CachedEmbeddings, EmbeddingCache
+from app.services.ingestion import (
+    ChunkDiff,
+    IngestMode,
+    IngestProgress,
+    ProgressCallback,
+    content_hash,
+    iter_pdf_pages,
+    temporary_chunk_index,
+)
+from app.services.openai_governor import GovernedEmbeddings, OpenAIGovernor
+from app.services.retrieval import (
+    ChunkRetriever,
+    HybridChunkRetriever,
+    RetrievalFilters,
+    RetrievalQuery,
+    SupabaseChunkRetriever,
+)
+from app.services.single_flight import SingleFlight, normalize_question
+from app.services.supabase import SupabaseService
+from app.services.vector_index import InMemoryChunkRetriever
 
 # Prompt template for legal Q&A
 QA_PROMPT_TEMPLATE = """당신은 부동산 법률 전문 AI 어시스턴트입니다.
@@ -33,138 +61,555 @@ QA_PROMPT_TEMPLATE = """당신은 부동산 법률 전문 AI 어시스턴트입
 
 
 class RAGService:
-    """Service for RAG-based Q&A using LangChain and Supabase vector store."""
+    """Service for RAG-based Q&A using LangChain and the Supabase pgvector store."""
 
-    def __init__(self, settings: Settings):
+    def __init__(self, settings: Settings, supabase: SupabaseService | None = None):
         self.settings = settings
-        self._supabase_client: Client | None = None
-        self._embeddings: OpenAIEmbeddings | None = None
+        self._supabase_service = supabase
+        self._owns_supabase_service = supabase is None
+        self._embeddings: Embeddings | None = None
+        self._embedding_cache: EmbeddingCache | None = None
         self._llm: ChatOpenAI | None = None
-        self._vector_store: SupabaseVectorStore | None = None
-        self._qa_chain: RetrievalQA | None = None
+        self._retriever: ChunkRetriever | None = None
+        self._qa_prompt: PromptTemplate | None = None
+        self._context_builder: ContextBuilder | None = None
+        self._ingest_executor: ProcessPoolExecutor | None = None
+        self._openai_http_client: httpx.AsyncClient | None = None
+        self._openai_governor: OpenAIGovernor | None = None
+        self._answer_cache: SemanticAnswerCache | None = None
+        self.answer_flights = SingleFlight(max_keys=settings.rag_single_flight_max_keys)
+        self._corpus_checked_at = float("-inf")
 
     @property
-    def supabase_client(self) -> Client:
-        """Lazy-load Supabase client."""
-        if self._supabase_client is None:
-            self._supabase_client = create_client(
-                self.settings.supabase_url,
-                self.settings.supabase_service_role_key,
+    def supabase_service(self) -> SupabaseService:
+        """Lazy-load the PostgREST data access service."""
+        if self._supabase_service is None:
+            self._supabase_service = SupabaseService(self.settings)
+        return self._supabase_service
+
+    @property
+    def answer_cache(self) -> SemanticAnswerCache:
+        """Lazy-load the semantic answer cache."""
+        if self._answer_cache is None:
+            self._answer_cache = SemanticAnswerCache(
+                threshold=self.settings.rag_answer_cache_threshold,
+                ttl_seconds=self.settings.rag_answer_cache_ttl_seconds,
+                max_entries=self.settings.rag_answer_cache_max_entries,
+            )
+        return self._answer_cache
+
+    @property
+    def openai_http_client(self) -> httpx.AsyncClient:
+        """Lazy-load the HTTP connection pool shared by the OpenAI embeddings and LLM clients."""
+        if self._openai_http_client is None:
+            self._openai_http_client = httpx.AsyncClient(timeout=60.0)
+        return self._openai_http_client
+
+    @property
+    def openai_governor(self) -> OpenAIGovernor:
+        """Lazy-load the rate-limit governor every OpenAI request goes through."""
+        if self._openai_governor is None:
+            self._openai_governor = OpenAIGovernor.from_settings(self.settings)
+        return self._openai_governor
+
+    @property
+    def embedding_cache(self) -> EmbeddingCache:
+        """Lazy-load the persistent embedding cache."""
+        if self._embedding_cache is None:
+            self._embedding_cache = EmbeddingCache(
+                self.settings.rag_embedding_cache_path,
+                max_entries=self.settings.rag_embedding_cache_max_entries,
             )
-        return self._supabase_client
+        return self._embedding_cache
+
+    @property
+    def embedding_model_key(self) -> str:
+        """Model plus output dimension; shortened embeddings must not share cache entries."""
+        dimensions = self.settings.openai_embedding_dimensions
+        model = self.settings.openai_embedding_model
+        return f"{model}:{dimensions}" if dimensions else model
 
     @property
-    def embeddings(self) -> OpenAIEmbeddings:
-        """Lazy-load OpenAI embeddings."""
+    def embeddings(self) -> Embeddings:
+        """
+        Lazy-load OpenAI embeddings, read through the embedding cache when enabled.
+
+        Cache misses go through the governor, which owns retries, so the client does not retry.
+        """
         if self._embeddings is None:
-            self._embeddings = OpenAIEmbeddings(
+            encoding = token_encoding(self.settings.openai_embedding_model)
+            embeddings = GovernedEmbeddings(
+                OpenAIEmbeddings(
+                    model=self.settings.openai_embedding_model,
+                    dimensions=self.settings.openai_embedding_dimensions,
+                    openai_api_key=self.settings.openai_api_key,
+                    http_async_client=self.openai_http_client,
+                    max_retries=0,
+                ),
+                self.openai_governor,
                 model=self.settings.openai_embedding_model,
-                openai_api_key=self.settings.openai_api_key,
+                count_tokens=lambda text: len(encoding.encode(text)),
             )
+            if self.settings.rag_embedding_cache_enabled:
+                embeddings = CachedEmbeddings(
+                    embeddings,
+                    self.embedding_cache,
+                    model=self.embedding_model_key,
+                )
+            self._embeddings = embeddings
         return self._embeddings
 
     @property
     def llm(self) -> ChatOpenAI:
-        """Lazy-load ChatOpenAI LLM."""
+        """Lazy-load ChatOpenAI LLM; calls go through the governor, which owns retries."""
         if self._llm is None:
             self._llm = ChatOpenAI(
                 model=self.settings.openai_chat_model,
                 temperature=0.1,  # Low temperature for factual answers
                 openai_api_key=self.settings.openai_api_key,
+                http_async_client=self.openai_http_client,
+                max_retries=0,
             )
         return self._llm
 
     @property
-    def vector_store(self) -> SupabaseVectorStore:
-        """Lazy-load Supabase vector store."""
-        if self._vector_store is None:
-            self._vector_store = SupabaseVectorStore(
-                client=self.supabase_client,
-                embedding=self.embeddings,
-                table_name=self.settings.supabase_vector_table,
-                query_name=self.settings.supabase_vector_query_name,
-            )
-        return self._vector_store
+    def retriever(self) -> ChunkRetriever:
+        """Lazy-load the chunk retriever."""
+        if self._retriever is None:
+            if self.settings.rag_retriever == "hybrid":
+                self._retriever = HybridChunkRetriever(self.settings, self.supabase_service)
+            elif self.settings.rag_retriever == "memory":
+                self._retriever = InMemoryChunkRetriever(self.settings, self.supabase_service)
+            else:
+                self._retriever = SupabaseChunkRetriever(self.settings, self.supabase_service)
+        return self._retriever
 
     @property
-    def qa_chain(self) -> RetrievalQA:
-        """Lazy-load QA chain."""
-        if self._qa_chain is None:
-            prompt = PromptTemplate(
+    def ingest_executor(self) -> ProcessPoolExecutor:
+        """Lazy-load the process pool used for CPU-bound PDF parsing."""
+        if self._ingest_executor is None:
+            self._ingest_executor = ProcessPoolExecutor(max_workers=self.settings.rag_ingest_parse_workers)
+        return self._ingest_executor
+
+    @property
+    def qa_prompt(self) -> PromptTemplate:
+        """Lazy-load the legal Q&A prompt."""
+        if self._qa_prompt is None:
+            self._qa_prompt = PromptTemplate(
                 template=QA_PROMPT_TEMPLATE,
                 input_variables=["context", "question"],
             )
-            self._qa_chain = RetrievalQA.from_chain_type(
-                llm=self.llm,
-                chain_type="stuff",
-                retriever=self.vector_store.as_retriever(
-                    search_kwargs={"k": 5},  # Retrieve top 5 relevant chunks
-                ),
-                return_source_documents=True,
-                chain_type_kwargs={"prompt": prompt},
+        return self._qa_prompt
+
+    @property
+    def context_builder(self) -> ContextBuilder:
+        """Lazy-load the token-budgeted context builder."""
+        if self._context_builder is None:
+            self._context_builder = ContextBuilder(
+                token_budget=self.settings.rag_context_token_budget,
+                model=self.settings.openai_chat_model,
+                format_passage=self._format_chunk,
             )
-        return self._qa_chain
+        return self._context_builder
+
+    async def warm_up(self) -> None:
+        """Build every lazy component up front so the first request does not pay for it."""
+        _ = self.retriever, self.embeddings, self.llm, self.qa_prompt, self.context_builder
+
+    async def aclose(self) -> None:
+        """Close the pooled HTTP connections and drop every lazily built component."""
+        if self._openai_http_client is not None:
+            await self._openai_http_client.aclose()
+        if self._embedding_cache is not None:
+            self._embedding_cache.close()
+        if self._ingest_executor is not None:
+            self._ingest_executor.shutdown(cancel_futures=True)
+        if self._supabase_service is not None and self._owns_supabase_service:
+            await self._supabase_service.aclose()
+            self._supabase_service = None
 
-    async def answer_question(self, question: str) -> dict[str, Any]:
+        self._openai_http_client = None
+        self._embedding_cache = None
+        self._embeddings = None
+        self._llm = None
+        self._retriever = None
+        self._qa_prompt = None
+        self._context_builder = None
+        self._ingest_executor = None
+
+    @timed("rag")
+    async def retrieve(
+        self,
+        question: str,
+        embedding: list[float],
+        filters: RetrievalFilters | None = None,
+    ) -> list[Document]:
         """
-        Generate AI answer for a question using RAG.
+        Return the active-document chunks most relevant to the embedded question.
 
-        Args:
-            question: User question
+        Overlapping and adjacent chunks are merged and the best passages are kept up to
+        ``rag_context_token_budget`` prompt tokens.
+        """
+        with span("rag", "vector_search"):
+            documents = await self.retriever.search(
+                RetrievalQuery(
+                    text=question,
+                    embedding=embedding,
+                    k=self.settings.rag_match_count,
+                    filters=filters or RetrievalFilters(),
+                )
+            )
+        with span("rag", "build_context"):
+            return self.context_builder.build(documents)
 
-        Returns:
-            Dictionary with 'answer' and 'sources' keys
+    @timed("rag")
+    async def retrieve_many(
+        self,
+        questions: list[str],
+        embeddings: list[list[float]],
+        filters: list[RetrievalFilters | None] | None = None,
+    ) -> list[list[Document]]:
         """
-        result = await self.qa_chain.ainvoke({"query": question})
+        :meth:`retrieve` for many questions; one matrix product with the in-memory retriever.
 
-        # Extract source information
+        Like :meth:`retrieve_scoped`, a question whose ``filters`` match nothing is searched
+        again across the whole corpus.
+        """
+        scopes = filters or [None] * len(questions)
+        queries = [
+            RetrievalQuery(
+                text=question,
+                embedding=embedding,
+                k=self.settings.rag_match_count,
+                filters=scope or RetrievalFilters(),
+            )
+            for question, embedding, scope in zip(questions, embeddings, scopes)
+        ]
+        results = await self._search_many(queries)
+        widened = [index for index, documents in enumerate(results) if not documents and queries[index].filters]
+        if widened:
+            retries = [
+                RetrievalQuery(text=queries[index].text, embedding=queries[index].embedding, k=queries[index].k)
+                for index in widened
+            ]
+            for index, documents in zip(widened, await self._search_many(retries)):
+                results[index] = documents
+        return [self.context_builder.build(documents) for documents in results]
+
+    async def retrieve_scoped(
+        self,
+        question: str,
+        embedding: list[float],
+        filters: RetrievalFilters | None,
+    ) -> list[Document]:
+        """
+        :meth:`retrieve` within ``filters``, widened to the whole corpus when nothing in scope
+        matches (e.g. the question's category has no documents, or they have no category yet).
+        """
+        documents = await self.retrieve(question, embedding, filters)
+        if not documents and filters:
+            documents = await self.retrieve(question, embedding)
+        return documents
+
+    async def _search_many(self, queries: list[RetrievalQuery]) -> list[list[Document]]:
+        if isinstance(self.retriever, InMemoryChunkRetriever):
+            return await self.retriever.search_many(queries)
+        return list(await asyncio.gather(*(self.retriever.search(query) for query in queries)))
+
+    def build_prompt(self, question: str, documents: list[Document]) -> str:
+        """Stuff the retrieved chunks into the Q&A prompt, labelled with their statute article."""
+        context = "\n\n".join(self._format_chunk(doc) for doc in documents)
+        return self.qa_prompt.format(context=context, question=question)
+
+    @timed("rag")
+    async def generate(self, question: str, documents: list[Document]) -> dict[str, Any]:
+        """Answer ``question`` from already retrieved ``documents`` without touching the cache."""
+        prompt = self.build_prompt(question, documents)
+        message = await self.openai_governor.call(
+            self._estimate_tokens(prompt),
+            lambda: self.llm.ainvoke(prompt),
+            usage=lambda result: (result.usage_metadata or {}).get("total_tokens"),
+        )
+        self._record_tokens(prompt, message.content, message.usage_metadata)
+        return self._build_answer(message.content, documents)
+
+    async def astream_answer(
+        self,
+        question: str,
+        *,
+        filters: RetrievalFilters | None = None,
+    ) -> AsyncIterator[dict[str, Any]]:
+        """
+        Generate AI answer for a question, yielding events as they become available.
+
+        Events are dictionaries with ``event`` and ``data`` keys: one ``sources`` event with the
+        retrieved chunks, a ``token`` event per LLM delta and a final ``answer`` event carrying
+        the answer payload (``content``, ``sources`` and ``model``). A semantic cache hit is
+        replayed as a single ``token`` event; cached answers are only reused for the same
+        filters. Concurrent streams of the same normalized question and filters share one
+        embedding, retrieval and LLM call (see :class:`SingleFlight`); callers that join late
+        replay the events from the start.
+        """
+        if not self.settings.rag_single_flight_enabled:
+            async for event in self._astream_answer(question, filters):
+                yield event
+            return
+        async for event in self.answer_flights.stream(
+            self._flight_key(question, filters),
+            lambda: self._astream_answer(question, filters),
+        ):
+            yield event
+
+    async def _astream_answer(
+        self,
+        question: str,
+        filters: RetrievalFilters | None,
+    ) -> AsyncIterator[dict[str, Any]]:
+        with span("rag", "embed_query"):
+            embedding = await self.embeddings.aembed_query(question)
+        cached = await self._lookup_cached_answer(embedding, filters)
+        if cached is not None:
+            yield {"event": "sources", "data": cached["sources"]}
+            yield {"event": "token", "data": cached["content"]}
+            yield {"event": "answer", "data": cached}
+            return
+
+        documents = await self.retrieve_scoped(question, embedding, filters)
+        yield {"event": "sources", "data": self._build_sources(documents)}
+
+        parts: list[str] = []
+        prompt = self.build_prompt(question, documents)
+        with span("rag", "generate_stream"):
+            async for chunk in self.openai_governor.stream(
+                self._estimate_tokens(prompt), lambda: self.llm.astream(prompt)
+            ):
+                if chunk.content:
+                    parts.append(chunk.content)
+                    yield {"event": "token", "data": chunk.content}
+
+        self._record_tokens(prompt, "".join(parts), None)
+        answer = self._build_answer("".join(parts), documents)
+        self._store_cached_answer(embedding, answer, filters)
+        yield {"event": "answer", "data": answer}
+
+    @timed("rag", "answer_cache_lookup")
+    async def _lookup_cached_answer(
+        self,
+        embedding: list[float],
+        filters: RetrievalFilters | None,
+    ) -> dict[str, Any] | None:
+        if not self.settings.rag_answer_cache_enabled:
+            return None
+        now = time.monotonic()
+        if now - self._corpus_checked_at >= self.settings.rag_answer_cache_corpus_check_seconds:
+            self._corpus_checked_at = now
+            documents = await self.supabase_service.fetch_active_document_versions()
+            fingerprint = hashlib.sha256(
+                ",".join(f"{doc['id']}:{doc['version']}" for doc in documents).encode()
+            ).hexdigest()
+            self.answer_cache.sync_corpus(fingerprint)
+        return self.answer_cache.lookup(embedding, filters or RetrievalFilters())
+
+    def _store_cached_answer(
+        self,
+        embedding: list[float],
+        answer: dict[str, Any],
+        filters: RetrievalFilters | None,
+    ) -> None:
+        if self.settings.rag_answer_cache_enabled:
+            self.answer_cache.store(embedding, answer, filters or RetrievalFilters())
+
+    def _record_tokens(self, prompt: str, content: str, usage: dict[str, int] | None) -> None:
+        """Count prompt/completion tokens, from the reported usage when OpenAI sent it."""
+        usage = usage or {}
+        model = self.settings.openai_chat_model
+        record_tokens(model, "prompt", usage.get("input_tokens") or self.context_builder.count_tokens(prompt))
+        record_tokens(model, "completion", usage.get("output_tokens") or self.context_builder.count_tokens(content))
+
+    def _estimate_tokens(self, prompt: str) -> int:
+        """Tokens a completion is charged against the governor's budget before it runs."""
+        return self.context_builder.count_tokens(prompt) + self.settings.openai_completion_tokens_estimate
+
+    @staticmethod
+    def _flight_key(question: str, filters: RetrievalFilters | None) -> tuple[str, RetrievalFilters]:
+        return normalize_question(question), filters or RetrievalFilters()
+
+    @staticmethod
+    def _format_chunk(doc: Document) -> str:
+        heading = StatuteChunker.heading(doc.metadata)
+        if not heading or doc.page_content.startswith(heading):
+            return doc.page_content
+        return f"[{heading}]\n{doc.page_content}"
+
+    def _build_answer(self, content: str, documents: list[Document]) -> dict[str, Any]:
+        return {
+            "content": content,
+            "sources": self._build_sources(documents),
+            "model": self.settings.openai_chat_model,
+        }
+
+    @staticmethod
+    def _build_sources(documents: list[Document]) -> list[dict[str, Any]]:
         sources = []
-        for doc in result.get("source_documents", []):
+        for doc in documents:
             metadata = doc.metadata
             sources.append(
                 {
                     "document_id": metadata.get("document_id"),
                     "chunk_index": metadata.get("chunk_index"),
+                    "law_name": metadata.get("law_name"),
+                    "article": metadata.get("article"),
+                    "citation": StatuteChunker.heading(metadata) or None,
                     "content": doc.page_content[:200],  # First 200 chars as preview
                     "metadata": metadata,
                 }
             )
+        return sources
 
-        return {
-            "content": result["result"],
-            "sources": sources,
-            "model": self.settings.openai_chat_model,
-        }
+    def _build_chunker(self, law_name: str | None) -> PageChunker:
+        if self.settings.rag_chunker == "statute":
+            return StatuteChunker(
+                default_law_name=law_name,
+                chunk_size=self.settings.rag_chunk_size,
+                chunk_overlap=self.settings.rag_statute_chunk_overlap,
+            )
+        return RecursivePageChunker(
+            chunk_size=self.settings.rag_chunk_size,
+            chunk_overlap=self.settings.rag_chunk_overlap,
+        )
 
-    async def ingest_pdf(self, pdf_path: str, document_id: str) -> int:
+    @timed("rag")
+    async def ingest_pdf(
+        self,
+        pdf_path: str,
+        document_id: str,
+        *,
+        mode: IngestMode = "full",
+        law_name: str | None = None,
+        on_progress: ProgressCallback | None = None,
+        stored_chunks: set[int] | None = None,
+    ) -> int:
         """
         Ingest a PDF document into the vector store.
 
+        Pages are parsed in a process pool and chunked as they arrive; chunks are embedded in
+        batches of ``rag_embedding_batch_size`` with at most ``rag_ingest_concurrency`` batches
+        in flight, and each batch is upserted into ``document_embeddings`` on
+        ``(document_id, chunk_index)``. Chunking is deterministic, so chunks listed in
+        ``stored_chunks`` (written by an interrupted run of the same job) are counted as done
+        and skipped.
+
+        In ``incremental`` mode the new chunks are diffed against the stored rows by content
+        hash: unchanged chunks keep their row and embedding, only new chunks are embedded
+        (into temporary negative indexes), and ``apply_document_chunk_diff`` then deletes the
+        removed rows and moves everything into its final position in one transaction.
+
         Args:
             pdf_path: Path to the PDF file
             document_id: UUID of the document in the database
+            mode: ``full`` rewrites every chunk, ``incremental`` only the changed ones
+            law_name: Statute name used when the text has no title line before its first article
+            on_progress: Called with the running counters after every page and stored batch
+            stored_chunks: Chunk indexes the same job already stored (full mode)
 
         Returns:
             Number of chunks created
         """
-        # Load PDF
-        loader = PyPDFLoader(pdf_path)
-        pages = loader.load()
+        progress = IngestProgress()
+        report = on_progress or (lambda _: None)
+        stored_chunks = stored_chunks or set()
+        chunker = self._build_chunker(law_name)
 
-        # Split text into chunks
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=self.settings.rag_chunk_size,
-            chunk_overlap=self.settings.rag_chunk_overlap,
-            length_function=len,
-        )
-        chunks = text_splitter.split_documents(pages)
+        diff: ChunkDiff | None = None
+        if mode == "incremental":
+            await self.supabase_service.delete_temporary_document_chunks(document_id)
+            diff = ChunkDiff(await self.supabase_service.fetch_document_chunk_hashes(document_id))
+
+        pending: set[asyncio.Task[None]] = set()
+        batch: list[tuple[int, Document]] = []
+
+        async def flush(chunks: list[tuple[int, Document]]) -> None:
+            vectors = await self.embeddings.aembed_documents([chunk.page_content for _, chunk in chunks])
+            progress.chunks_embedded += len(chunks)
+            await self.supabase_service.upsert_document_chunks(
+                [
+                    {
+                        "document_id": document_id,
+                        "chunk_index": stored_index,
+                        "content": chunk.page_content,
+                        "content_hash": chunk.metadata["content_hash"],
+                        "embedding": vector,
+                        "metadata": chunk.metadata,
+                    }
+                    for (stored_index, chunk), vector in zip(chunks, vectors)
+                ]
+            )
+            progress.chunks_stored += len(chunks)
+            report(progress)
 
-        # Add metadata
-        for index, chunk in enumerate(chunks):
-            chunk.metadata["document_id"] = document_id
-            chunk.metadata["chunk_index"] = index
+        async def submit(chunks: list[tuple[int, Document]]) -> None:
+            if len(pending) >= self.settings.rag_ingest_concurrency:
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                pending.difference_update(done)
+                for task in done:
+                    task.result()  # surface failures early
+            pending.add(asyncio.create_task(flush(chunks)))
 
-        # Store in vector database
-        await self.vector_store.aadd_documents(chunks)
+        async def add(chunk: TextChunk) -> None:
+            nonlocal batch
+            chunk_index = progress.chunks_created
+            progress.chunks_created += 1
+            digest = content_hash(chunk.content)
+            reused = diff.claim(chunk_index, digest) if diff else chunk_index in stored_chunks
+            if reused:
+                progress.chunks_reused += 1
+                progress.chunks_embedded += 1
+                progress.chunks_stored += 1
+                return
+            metadata = {
+                **chunk.metadata,
+                "document_id": document_id,
+                "chunk_index": chunk_index,
+                "content_hash": digest,
+            }
+            stored_index = temporary_chunk_index(chunk_index) if diff else chunk_index
+            batch.append((stored_index, Document(page_content=chunk.content, metadata=metadata)))
+            if len(batch) >= self.settings.rag_embedding_batch_size:
+                await submit(batch)
+                batch = []
+
+        try:
+            async for page_number, text in iter_pdf_pages(
+                pdf_path,
+                self.ingest_executor,
+                batch_size=self.settings.rag_ingest_page_batch_size,
+                prefetch=self.settings.rag_ingest_parse_workers * 2,
+                progress=progress,
+            ):
+                for chunk in chunker.feed(page_number, text):
+                    await add(chunk)
+                report(progress)
+            for chunk in chunker.finish():
+                await add(chunk)
+
+            if batch:
+                await submit(batch)
+            if pending:
+                await asyncio.gather(*pending)
+        finally:
+            for task in pending:
+                task.cancel()
+
+        if diff is not None:
+            removed_ids = diff.removed_ids
+            await self.supabase_service.rpc(
+                "apply_document_chunk_diff",
+                {"p_document_id": document_id, "p_delete_ids": removed_ids, "p_moves": diff.moves},
+            )
+            progress.chunks_deleted = len(removed_ids)
+            report(progress)
 
-        return len(chunks)
+        self.answer_cache.invalidate()
+        if isinstance(self._retriever, InMemoryChunkRetriever):
+            self._retriever.mark_stale()
+        return progress.chunks_created
@@ -0,0 +1,180 @@
+"""Retrievers that return the document chunks most relevant to a query."""
+
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass, field
+from typing import Any, Protocol
+
+from langchain_core.documents import Document
+
+from app.core.config import Settings
+from app.services.supabase import JsonDict, SupabaseService
+
+# Article references ("제3조의2") are kept whole; other tokens are runs of letters/digits
+KEYWORD_RE = re.compile(r"제\s*\d+\s*조(?:\s*의\s*\d+)?|[\w]+")
+# Trailing particles and question endings stripped from Korean tokens ("보증금을" -> "보증금",
+# "신청하나요" -> "신청"), longest first. A token made only of one of them carries no content.
+PARTICLES = sorted(
+    (
+        "에서는", "으로는", "에게는", "이라도", "부터", "까지", "에서", "에게", "으로", "라도",
+        "이나", "하는", "인가요", "인지", "을", "를", "이", "가", "은", "는", "의", "에", "로",
+        "와", "과", "도", "만", "나",
+        "하나요", "하는지", "하려면", "합니까", "합니다", "할까요", "되나요", "되는지", "받으면",
+        "받나요", "하면", "해야", "하지", "해도", "되면", "으면", "나요", "할",
+    ),
+    key=len,
+    reverse=True,
+)
+SUFFIXES = frozenset(PARTICLES)
+STOPWORDS = frozenset(
+    {
+        "어떻게", "무엇", "무엇인가요", "있나요", "있는지", "없나요", "되나요", "궁금합니다", "경우",
+        "관련", "알려주세요", "수", "때", "것", "하나요", "하면", "받으면", "해야", "해야하나요",
+        "생기", "생기면", "못하", "못하면", "있으면", "없으면", "어떤", "규정",
+    }
+)
+
+
+@dataclass(slots=True, frozen=True)
+class RetrievalFilters:
+    """Restricts retrieval to some documents; empty fields do not filter."""
+
+    document_ids: tuple[str, ...] = ()
+    categories: tuple[str, ...] = ()
+    law_names: tuple[str, ...] = ()
+
+    @classmethod
+    def for_category(cls, category: str | None) -> RetrievalFilters | None:
+        """Scope of a question's answer: the documents of its category (``None`` without one)."""
+        return cls(categories=(category,)) if category else None
+
+    def __bool__(self) -> bool:
+        return bool(self.document_ids or self.categories or self.law_names)
+
+    def as_params(self) -> dict[str, Any]:
+        return {
+            "filter_document_ids": list(self.document_ids) or None,
+            "filter_categories": list(self.categories) or None,
+            "filter_law_names": list(self.law_names) or None,
+        }
+
+
+@dataclass(slots=True)
+class RetrievalQuery:
+    text: str
+    embedding: list[float]
+    k: int
+    filters: RetrievalFilters = field(default_factory=RetrievalFilters)
+
+
+class ChunkRetriever(Protocol):
+    async def search(self, query: RetrievalQuery) -> list[Document]: ...
+
+
+class SupabaseChunkRetriever:
+    """
+    Vector search through the ``match_document_chunks`` Postgres function.
+
+    Only active document versions are searched, and ``query.filters`` are applied inside the
+    function so filtered-out chunks never take one of the ``k`` slots. With
+    ``rag_quantized_search`` the function walks the binary-quantized index and re-scores the
+    shortlist exactly.
+    """
+
+    def __init__(self, settings: Settings, supabase: SupabaseService):
+        self.settings = settings
+        self._supabase = supabase
+
+    async def search(self, query: RetrievalQuery) -> list[Document]:
+        rows = await self._supabase.rpc(
+            self.settings.supabase_vector_query_name,
+            {
+                "query_embedding": query.embedding,
+                "match_threshold": self.settings.rag_match_threshold,
+                "match_count": query.k,
+                "ef_search": self.settings.rag_hnsw_ef_search,
+                "probes": self.settings.rag_ivfflat_probes,
+                "quantized": self.settings.rag_quantized_search,
+                "oversample": self.settings.rag_quantized_oversample,
+                **query.filters.as_params(),
+            },
+        )
+        return [to_document(row) for row in rows]
+
+
+class HybridChunkRetriever:
+    """
+    Vector plus keyword search through ``hybrid_search_document_chunks``, fused by rank.
+
+    Both candidate lists come back in one round trip; :func:`reciprocal_rank_fusion` merges
+    them so exact legal terms (확정일자, 임차권등기명령, 제3조의2) that embeddings rank poorly
+    still reach the top ``k``.
+    """
+
+    def __init__(self, settings: Settings, supabase: SupabaseService):
+        self.settings = settings
+        self._supabase = supabase
+
+    async def search(self, query: RetrievalQuery) -> list[Document]:
+        rows = await self._supabase.rpc(
+            "hybrid_search_document_chunks",
+            {
+                "query_embedding": query.embedding,
+                "keywords": extract_keywords(query.text),
+                "match_threshold": self.settings.rag_match_threshold,
+                "candidate_count": max(self.settings.rag_hybrid_candidates, query.k),
+                "ef_search": self.settings.rag_hnsw_ef_search,
+                "probes": self.settings.rag_ivfflat_probes,
+                "quantized": self.settings.rag_quantized_search,
+                "oversample": self.settings.rag_quantized_oversample,
+                **query.filters.as_params(),
+            },
+        )
+        fused = reciprocal_rank_fusion(rows, k=self.settings.rag_rrf_k)
+        return [to_document(row) for row in fused[: query.k]]
+
+
+def extract_keywords(text: str, *, limit: int = 8) -> list[str]:
+    """Content words of a question with Korean particles and endings stripped, in order of appearance."""
+    keywords: list[str] = []
+    for match in KEYWORD_RE.finditer(text):
+        token = re.sub(r"\s+", "", match.group())
+        if not token.startswith("제"):
+            for particle in PARTICLES:
+                if token.endswith(particle) and len(token) - len(particle) >= 2:
+                    token = token[: -len(particle)]
+                    break
+        if len(token) < 2 or token in SUFFIXES or token in STOPWORDS or token.isdigit() or token in keywords:
+            continue
+        keywords.append(token)
+        if len(keywords) == limit:
+            break
+    return keywords
+
+
+def reciprocal_rank_fusion(rows: list[JsonDict], *, k: int) -> list[JsonDict]:
+    """
+    Order rows by ``sum(1 / (k + rank))`` over the rank columns they appear in.
+
+    ``k`` dampens the advantage of top ranks (60 in the original RRF paper). The fused score
+    is added to each row as ``rrf_score``.
+    """
+    for row in rows:
+        row["rrf_score"] = sum(
+            1.0 / (k + rank) for rank in (row.get("vector_rank"), row.get("keyword_rank")) if rank is not None
+        )
+    return sorted(rows, key=lambda row: row["rrf_score"], reverse=True)
+
+
+def to_document(row: JsonDict) -> Document:
+    metadata = {
+        **(row.get("metadata") or {}),
+        "id": row.get("id"),
+        "document_id": row.get("document_id"),
+        "chunk_index": row.get("chunk_index"),
+        "similarity": row.get("similarity"),
+    }
+    if "rrf_score" in row:
+        metadata["rrf_score"] = row["rrf_score"]
+    return Document(page_content=row["content"], metadata=metadata)
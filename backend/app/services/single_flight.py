@@ -0,0 +1,114 @@
+"""Coalescing of identical AI answer computations that are in flight at the same time."""
+
+from __future__ import annotations
+
+import asyncio
+import unicodedata
+from collections.abc import AsyncIterator, Callable, Hashable
+from dataclasses import dataclass, field
+from typing import Any, TypeVar
+
+T = TypeVar("T")
+
+# Dropped from the end of a question before comparing, so "…인가요?" and "…인가요" coalesce
+_TRAILING_PUNCTUATION = "?!.。？！ "
+
+
+def normalize_question(text: str) -> str:
+    """Comparison form of a question: NFKC, case-folded, whitespace collapsed."""
+    text = unicodedata.normalize("NFKC", text).casefold()
+    return " ".join(text.split()).rstrip(_TRAILING_PUNCTUATION)
+
+
+@dataclass(slots=True)
+class SingleFlightStats:
+    leaders: int = 0
+    coalesced: int = 0
+    bypassed: int = 0
+
+    def as_dict(self) -> dict[str, int | float]:
+        calls = self.leaders + self.coalesced + self.bypassed
+        return {
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+            "bypassed": self.bypassed,
+            "coalesced_rate": self.coalesced / calls if calls else 0.0,
+        }
+
+
+@dataclass(slots=True)
+class _SharedStream:
+    """Events of one in-flight stream, replayed to every caller that joins it."""
+
+    events: list[Any] = field(default_factory=list)
+    updated: asyncio.Condition = field(default_factory=asyncio.Condition)
+    done: bool = False
+    error: BaseException | None = None
+
+
+class SingleFlight:
+    """
+    Runs at most one event stream per key at a time; concurrent callers share its events.
+
+    The first caller for a key (the leader) starts the stream as a task, and callers arriving
+    before it finishes replay the same events from its start (:meth:`stream`). Keys are
+    forgotten as soon as the stream ends, so nothing is cached beyond the flight. At most
+    ``max_keys`` flights are tracked; beyond that, callers run their own stream uncoalesced. A
+    leader's cancellation does not cancel the shared task, so the callers that joined it still
+    get every event.
+    """
+
+    def __init__(self, *, max_keys: int):
+        self.max_keys = max_keys
+        self.stats = SingleFlightStats()
+        self._streams: dict[Hashable, _SharedStream] = {}
+        self._pumps: set[asyncio.Task[None]] = set()
+
+    def __len__(self) -> int:
+        return len(self._streams)
+
+    async def stream(self, key: Hashable, factory: Callable[[], AsyncIterator[T]]) -> AsyncIterator[T]:
+        shared = self._streams.get(key)
+        if shared is not None:
+            self.stats.coalesced += 1
+        elif len(self) >= self.max_keys:
+            self.stats.bypassed += 1
+            async for event in factory():
+                yield event
+            return
+        else:
+            self.stats.leaders += 1
+            shared = self._streams[key] = _SharedStream()
+            pump = asyncio.create_task(self._pump(key, shared, factory()))
+            self._pumps.add(pump)
+            pump.add_done_callback(self._pumps.discard)
+
+        index = 0
+        while True:
+            async with shared.updated:
+                await shared.updated.wait_for(lambda: shared.done or len(shared.events) > index)
+            while index < len(shared.events):
+                yield shared.events[index]
+                index += 1
+            if shared.done and index == len(shared.events):
+                if shared.error is not None:
+                    raise shared.error
+                return
+
+    async def _pump(self, key: Hashable, shared: _SharedStream, events: AsyncIterator[Any]) -> None:
+        try:
+            async for event in events:
+                async with shared.updated:
+                    shared.events.append(event)
+                    shared.updated.notify_all()
+        except BaseException as exc:  # noqa: BLE001 re-raised in every caller of the stream
+            shared.error = exc
+            if not isinstance(exc, Exception):
+                raise
+        finally:
+            if self._streams.get(key) is shared:
+                del self._streams[key]
+            async with shared.updated:
+                shared.done = True
+                shared.updated.notify_all()
+
@@ -1,25 +1,97 @@
 ﻿from __future__ import annotations
 
-from typing import Any, Literal
+import asyncio
+import json
+import os
+import socket
+from collections.abc import AsyncIterator, Awaitable, Sequence
+from datetime import datetime, timezone
+from typing import Any, Literal, TypeVar
 
 import httpx
 from fastapi import HTTPException, status
 
 from app.core.config import Settings
+from app.core.observability import HTTP_SPAN_HOOKS
+from app.services.question_cache import CachedQuestion, QuestionCache, question_etag
 
 JsonDict = dict[str, Any]
+Returning = Literal["representation", "minimal"]
+T = TypeVar("T")
 
+# Credits a lawyer pays per answer
+ANSWER_PRICE = 1000
 
-class SupabaseService:
-    def __init__(self, settings: Settings):
-        self._rest_url = settings.supabase_url.rstrip("/") + "/rest/v1"
-        self._service_key = settings.supabase_service_role_key
-        self._headers = {
-            "apikey": self._service_key,
-            "Authorization": f"Bearer {self._service_key}",
+# Keys per ``in.(...)`` filter of a bulk PATCH; keeps the URL well below proxy limits
+BULK_FILTER_KEYS = 200
+
+# Columns served by ``GET /questions/{id}`` (QuestionResponse). The cached record and its ETag
+# cover only these, so lease bookkeeping such as ``ai_answer_claimed_by`` never changes the ETag.
+QUESTION_ENTRY_SELECT = (
+    "id,user_id,title,body,category,ai_answer,created_at,"
+    "answers(id,question_id,lawyer_id,content,created_at)"
+)
+
+
+def worker_id() -> str:
+    """Identifies this process in job leases (``claim_ai_answer`` / ``claim_ingest_job``)."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def create_http_client(settings: Settings) -> httpx.AsyncClient:
+    """
+    Build the long-lived PostgREST connection pool shared by every SupabaseService.
+
+    Every request is timed as a ``supabase`` stage labelled with its method and table or RPC.
+    """
+    service_key = settings.supabase_service_role_key
+    return httpx.AsyncClient(
+        base_url=settings.supabase_url.rstrip("/") + "/rest/v1",
+        headers={
+            "apikey": service_key,
+            "Authorization": f"Bearer {service_key}",
             "Content-Type": "application/json",
             "Accept": "application/json",
-        }
+        },
+        http2=settings.supabase_http2,
+        limits=httpx.Limits(
+            max_connections=settings.supabase_pool_max_connections,
+            max_keepalive_connections=settings.supabase_pool_max_keepalive,
+            keepalive_expiry=settings.supabase_pool_keepalive_expiry,
+        ),
+        timeout=settings.supabase_timeout,
+        event_hooks=HTTP_SPAN_HOOKS,
+    )
+
+
+class SupabaseService:
+    def __init__(
+        self,
+        settings: Settings,
+        client: httpx.AsyncClient | None = None,
+        question_cache: QuestionCache | None = None,
+    ):
+        self._client = client or create_http_client(settings)
+        self._question_cache = question_cache
+        self._owns_client = client is None
+        self._pipeline = settings.supabase_pipeline_requests
+        self._bulk_chunk_size = settings.supabase_bulk_chunk_size
+
+    async def aclose(self) -> None:
+        """Close the connection pool if this instance created it."""
+        if self._owns_client:
+            await self._client.aclose()
+
+    async def gather(self, *calls: Awaitable[T]) -> list[T]:
+        """
+        Run independent calls, pipelining them over the shared pool when enabled.
+
+        With ``supabase_pipeline_requests`` off the calls are awaited one after another,
+        which keeps request ordering deterministic for debugging.
+        """
+        if self._pipeline:
+            return list(await asyncio.gather(*calls))
+        return [await call for call in calls]
 
     async def create_question(self, user_id: str, payload: JsonDict) -> JsonDict:
         body = {**payload, "user_id": user_id}
@@ -27,24 +99,145 @@ class SupabaseService:
         return data[0]
 
     async def fetch_question(self, question_id: str) -> JsonDict:
+        return (await self.fetch_question_entry(question_id)).record
+
+    async def list_questions(
+        self,
+        *,
+        select: str,
+        limit: int,
+        after: tuple[str, str] | None = None,
+        category: str | None = None,
+        user_id: str | None = None,
+    ) -> list[JsonDict]:
+        """
+        One page of questions, newest first, ordered by ``(created_at, id)``.
+
+        ``after`` is the ``(created_at, id)`` of the last row of the previous page. Postgres
+        cannot start an index scan from the ``or`` of the keyset filter alone, so the redundant
+        ``created_at <= X`` bound is sent with it; it gives the ``(created_at desc, id desc)``
+        index scan its starting point and keeps every page a range scan regardless of depth.
+        """
+        params: dict[str, str] = {
+            "select": select,
+            "order": "created_at.desc,id.desc",
+            "limit": str(limit),
+        }
+        if category is not None:
+            params["category"] = f"eq.{category}"
+        if user_id is not None:
+            params["user_id"] = f"eq.{user_id}"
+        if after is not None:
+            created_at, last_id = after
+            params["created_at"] = f"lte.{created_at}"
+            params["or"] = f'(created_at.lt."{created_at}",and(created_at.eq."{created_at}",id.lt.{last_id}))'
+        return await self._get("/questions", params=params)
+
+    async def fetch_question_entry(self, question_id: str) -> CachedQuestion:
+        """Question with its answers and ETag, read through the question cache when configured."""
+        if self._question_cache is not None:
+            cached = await self._question_cache.get(question_id)
+            if cached is not None:
+                return cached
+
         params = {
             "id": f"eq.{question_id}",
-            "select": "*,answers(*)",
+            "select": QUESTION_ENTRY_SELECT,
         }
         data = await self._get("/questions", params=params)
         if not data:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Question not found")
         record = data[0]
         record.setdefault("answers", [])
-        return record
+        if self._question_cache is not None:
+            return await self._question_cache.put(question_id, record)
+        return CachedQuestion(record, question_etag(record))
 
-    async def create_answer(self, question_id: str, user_id: str, content: str) -> JsonDict:
-        body = {
-            "question_id": question_id,
-            "lawyer_id": user_id,
-            "content": content,
+    async def fetch_pending_ai_questions(self) -> list[JsonDict]:
+        """Questions whose AI answer is still queued, oldest first."""
+        params = {
+            "select": "id,title,category",
+            "ai_answer->>status": "eq.pending",
+            "order": "created_at.asc",
         }
-        data = await self._post("/answers", body)
+        return await self._get("/questions", params=params)
+
+    async def claim_ai_answer(self, question_id: str, *, lease_seconds: float) -> tuple[bool, JsonDict | None]:
+        """
+        Take or renew this process's lease on generating a pending AI answer.
+
+        Returns whether the lease is held and the question's current ``ai_answer`` (``None``
+        for an unknown question).
+        """
+        data = await self.rpc(
+            "claim_ai_answer",
+            {"p_question_id": question_id, "p_worker": worker_id(), "p_lease_seconds": lease_seconds},
+        )
+        if not data:
+            return False, None
+        return bool(data[0]["claimed"]), data[0]["current_ai_answer"]
+
+    async def release_ai_answer_claims(self) -> None:
+        """Drop this process's AI answer leases so other processes can pick the questions up."""
+        await self._patch(
+            "/questions",
+            {"ai_answer_claimed_by": None, "ai_answer_claimed_until": None},
+            params={"ai_answer_claimed_by": f"eq.{worker_id()}", "select": "id"},
+        )
+
+    async def fetch_question_titles(self, question_ids: list[str]) -> list[JsonDict]:
+        """``id``, ``title`` and ``category`` of the given questions (missing ids are left out)."""
+        params = {
+            "select": "id,title,category",
+            "id": f"in.({','.join(question_ids)})",
+        }
+        return await self._get("/questions", params=params)
+
+    async def iter_question_ids(self, *, page_size: int = 1000) -> AsyncIterator[str]:
+        """Every question id in ``id`` order, paged by keyset so deep pages stay cheap."""
+        last_id: str | None = None
+        while True:
+            params = {"select": "id", "order": "id.asc", "limit": str(page_size)}
+            if last_id is not None:
+                params["id"] = f"gt.{last_id}"
+            page = await self._get("/questions", params=params)
+            for row in page:
+                yield str(row["id"])
+            if len(page) < page_size:
+                return
+            last_id = str(page[-1]["id"])
+
+    async def update_questions_ai_answers(self, ai_answers: dict[str, JsonDict]) -> None:
+        """
+        Store many AI answers (``set_questions_ai_answers``, one statement per chunk).
+
+        An upsert on ``questions`` would have to carry every not-null column, hence the RPC.
+        """
+        await self._send_bulk(
+            "POST",
+            "/rpc/set_questions_ai_answers",
+            [{"id": question_id, "ai_answer": answer} for question_id, answer in ai_answers.items()],
+            wrap="p_answers",
+        )
+        await self._invalidate_questions(*ai_answers)
+
+    async def create_answer(self, question_id: str, user_id: str, content: str) -> JsonDict:
+        """
+        Charge the lawyer ``ANSWER_PRICE`` and insert the answer atomically (``create_paid_answer``).
+
+        Raises 403 when the lawyer has no approved profile, 402 when the balance is too low and
+        404 for an unknown question.
+        """
+        data = await self.rpc(
+            "create_paid_answer",
+            {
+                "p_question_id": question_id,
+                "p_lawyer_id": user_id,
+                "p_content": content,
+                "p_price": ANSWER_PRICE,
+            },
+        )
+        await self._invalidate_questions(question_id)
         return data[0]
 
     async def get_lawyer_profile(self, user_id: str) -> JsonDict | None:
@@ -79,59 +272,283 @@ class SupabaseService:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Lawyer profile not found")
         return data[0]
 
-    async def deduct_lawyer_balance(self, user_id: str, new_balance: int) -> JsonDict:
-        data = await self._patch(
-            "/lawyer_profiles",
-            {"balance": new_balance},
-            params={"user_id": f"eq.{user_id}"},
+    async def update_lawyer_statuses(
+        self,
+        user_ids: Sequence[str],
+        *,
+        status_value: Literal["approved", "pending", "rejected"],
+        balance_override: int | None = None,
+    ) -> list[JsonDict]:
+        """Apply the same review decision to many lawyers; returns the updated profiles."""
+        update_payload: JsonDict = {"verification_status": status_value}
+        if balance_override is not None:
+            update_payload["balance"] = balance_override
+        return await self.bulk_update("/lawyer_profiles", update_payload, column="user_id", keys=user_ids)
+
+    async def create_document(self, payload: JsonDict) -> JsonDict:
+        data = await self._post("/documents", payload)
+        return data[0]
+
+    async def fetch_active_document_versions(self) -> list[JsonDict]:
+        params = {
+            "select": "id,version",
+            "is_active": "is.true",
+            "order": "id.asc",
+        }
+        return await self._get("/documents", params=params)
+
+    async def upsert_document_chunks(self, rows: list[JsonDict]) -> None:
+        """Insert or replace embedded chunks, keyed by the unique (document_id, chunk_index)."""
+        await self.bulk_upsert("/document_embeddings", rows, on_conflict="document_id,chunk_index")
+
+    async def fetch_document_chunk_indexes(self, document_id: str) -> set[int]:
+        """Chunk indexes already stored for a document; a resumed full-mode job's checkpoints."""
+        return {int(row["chunk_index"]) async for row in self._iter_document_chunks(document_id, "chunk_index")}
+
+    async def fetch_document_chunk_embeddings(self, document_id: str, *, page_size: int = 500) -> AsyncIterator[JsonDict]:
+        """Searchable chunks of a document with their embeddings, paged by ``chunk_index``."""
+        async for row in self._iter_document_chunks(
+            document_id,
+            "id,document_id,chunk_index,content,metadata,embedding",
+            page_size=page_size,
+        ):
+            yield row
+
+    async def fetch_document_chunk_hashes(self, document_id: str) -> list[JsonDict]:
+        return [row async for row in self._iter_document_chunks(document_id, "id,chunk_index,content_hash")]
+
+    async def _iter_document_chunks(self, document_id: str, select: str, *, page_size: int = 500) -> AsyncIterator[JsonDict]:
+        """
+        Rows of a document at ``chunk_index >= 0``, paged by ``chunk_index``.
+
+        PostgREST caps every response at ``max-rows``, so a single unpaged read of a large
+        statute silently drops its last chunks.
+        """
+        last_index = -1
+        while True:
+            params = {
+                "select": select,
+                "document_id": f"eq.{document_id}",
+                "chunk_index": f"gt.{last_index}",
+                "order": "chunk_index.asc",
+                "limit": str(page_size),
+            }
+            page = await self._get("/document_embeddings", params=params)
+            for row in page:
+                yield row
+            if len(page) < page_size:
+                return
+            last_index = int(page[-1]["chunk_index"])
+
+    async def delete_document_chunks(self, document_id: str) -> None:
+        """Remove every stored chunk of a document before it is ingested again from scratch."""
+        await self._delete("/document_embeddings", params={"document_id": f"eq.{document_id}"})
+
+    async def delete_temporary_document_chunks(self, document_id: str) -> None:
+        """Remove rows left at temporary negative indexes by an interrupted incremental ingest."""
+        await self._delete(
+            "/document_embeddings",
+            params={"document_id": f"eq.{document_id}", "chunk_index": "lt.0"},
         )
+
+    async def create_ingest_job(self, payload: JsonDict) -> JsonDict:
+        data = await self._post("/ingest_jobs", payload)
+        return data[0]
+
+    async def fetch_ingest_job(self, job_id: str) -> JsonDict:
+        params = {
+            "select": "*",
+            "id": f"eq.{job_id}",
+        }
+        data = await self._get("/ingest_jobs", params=params)
         if not data:
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Lawyer profile not found")
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Ingest job not found")
         return data[0]
 
-    async def create_document(self, payload: JsonDict) -> JsonDict:
-        data = await self._post("/documents", payload)
+    async def fetch_unfinished_ingest_jobs(self) -> list[JsonDict]:
+        params = {
+            "select": "*",
+            "status": "in.(queued,running)",
+            "order": "created_at.asc",
+        }
+        return await self._get("/ingest_jobs", params=params)
+
+    async def claim_ingest_job(self, job_id: str, *, lease_seconds: float) -> JsonDict | None:
+        """Take or renew this process's lease on an unfinished job; ``None`` when another process holds it."""
+        data = await self.rpc(
+            "claim_ingest_job",
+            {"p_job_id": job_id, "p_worker": worker_id(), "p_lease_seconds": lease_seconds},
+        )
+        return data[0] if data else None
+
+    async def release_ingest_job_claims(self) -> None:
+        """Drop this process's ingest job leases so other processes can resume the jobs."""
+        await self._patch(
+            "/ingest_jobs",
+            {"claimed_by": None, "claimed_until": None},
+            params={"claimed_by": f"eq.{worker_id()}", "select": "id"},
+        )
+
+    async def update_ingest_job(self, job_id: str, payload: JsonDict) -> JsonDict:
+        data = await self._patch(
+            "/ingest_jobs",
+            {**payload, "updated_at": datetime.now(timezone.utc).isoformat()},
+            params={"id": f"eq.{job_id}"},
+        )
+        if not data:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Ingest job not found")
         return data[0]
 
     async def update_question_ai_answer(self, question_id: str, ai_answer: JsonDict) -> JsonDict:
+        """Store the AI answer and return the updated question with its embedded answers."""
         data = await self._patch(
             "/questions",
             {"ai_answer": ai_answer},
-            params={"id": f"eq.{question_id}"},
+            params={"id": f"eq.{question_id}", "select": "*,answers(*)"},
         )
         if not data:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Question not found")
-        return data[0]
+        record = data[0]
+        record.setdefault("answers", [])
+        await self._invalidate_questions(question_id)
+        return record
+
+    async def _invalidate_questions(self, *question_ids: str) -> None:
+        if self._question_cache is not None:
+            await self._question_cache.invalidate(*question_ids)
+
+    async def count_rows(self, path: str, *, params: dict[str, str] | None = None) -> int:
+        """Exact row count of a table (or filtered view) read from PostgREST's ``Content-Range``."""
+        response = await self._client.head(path, params=params, headers={"Prefer": "count=exact"})
+        if response.status_code >= 400:
+            raise HTTPException(status_code=response.status_code, detail=response.reason_phrase)
+        return int(response.headers.get("content-range", "*/0").rsplit("/", 1)[1])
+
+    async def bulk_insert(self, path: str, rows: Sequence[JsonDict], *, returning: Returning = "minimal") -> list[JsonDict]:
+        """Insert ``rows`` with array bodies of at most ``supabase_bulk_chunk_size`` rows."""
+        return await self._send_bulk("POST", path, rows, prefer=f"return={returning}")
+
+    async def bulk_upsert(
+        self,
+        path: str,
+        rows: Sequence[JsonDict],
+        *,
+        on_conflict: str,
+        returning: Returning = "minimal",
+    ) -> list[JsonDict]:
+        """Insert or merge ``rows`` on the ``on_conflict`` columns, chunked like :meth:`bulk_insert`."""
+        return await self._send_bulk(
+            "POST",
+            path,
+            rows,
+            params={"on_conflict": on_conflict},
+            prefer=f"return={returning},resolution=merge-duplicates",
+        )
+
+    async def bulk_update(
+        self,
+        path: str,
+        values: JsonDict,
+        *,
+        column: str,
+        keys: Sequence[str],
+        returning: Returning = "representation",
+    ) -> list[JsonDict]:
+        """Set ``values`` on every row whose ``column`` is in ``keys`` (one PATCH per key chunk)."""
+        chunks = [
+            ",".join(str(key) for key in keys[start : start + BULK_FILTER_KEYS])
+            for start in range(0, len(keys), BULK_FILTER_KEYS)
+        ]
+        results = await self.gather(
+            *(
+                self._patch(path, values, params={column: f"in.({chunk})"}, returning=returning)
+                for chunk in chunks
+            )
+        )
+        return [row for rows in results for row in rows]
+
+    async def _send_bulk(
+        self,
+        method: str,
+        path: str,
+        rows: Sequence[JsonDict],
+        *,
+        params: dict[str, str] | None = None,
+        prefer: str = "return=minimal",
+        wrap: str | None = None,
+    ) -> list[JsonDict]:
+        """
+        Send ``rows`` as JSON arrays of at most ``supabase_bulk_chunk_size`` rows.
+
+        Each chunk is encoded row by row while it is being sent, so a large payload is never
+        held in memory as one JSON document. ``wrap`` nests the array under that key, which is
+        how RPCs receive it.
+        """
+        results: list[JsonDict] = []
+        for start in range(0, len(rows), self._bulk_chunk_size):
+            chunk = rows[start : start + self._bulk_chunk_size]
+            response = await self._client.request(
+                method,
+                path,
+                params=params,
+                content=_encode_rows(chunk, wrap=wrap),
+                headers={"Prefer": prefer},
+            )
+            results += self._handle_response(response)
+        return results
 
     async def _get(self, path: str, *, params: dict[str, str] | None = None) -> list[JsonDict]:
-        async with httpx.AsyncClient(base_url=self._rest_url, headers=self._headers, timeout=10.0) as client:
-            response = await client.get(path, params=params)
+        response = await self._client.get(path, params=params)
         return self._handle_response(response)
 
     async def _post(self, path: str, body: JsonDict) -> list[JsonDict]:
-        headers = {**self._headers, "Prefer": "return=representation"}
-        async with httpx.AsyncClient(base_url=self._rest_url, headers=headers, timeout=10.0) as client:
-            response = await client.post(path, json=body)
+        headers = {"Prefer": "return=representation"}
+        response = await self._client.post(path, json=body, headers=headers)
+        return self._handle_response(response)
+
+    async def _upsert(
+        self,
+        path: str,
+        body: JsonDict | list[JsonDict],
+        *,
+        params: dict[str, str] | None = None,
+        returning: Literal["representation", "minimal"] = "representation",
+    ) -> list[JsonDict]:
+        headers = {"Prefer": f"return={returning},resolution=merge-duplicates"}
+        response = await self._client.post(path, params=params, json=body, headers=headers)
         return self._handle_response(response)
 
-    async def _upsert(self, path: str, body: JsonDict, *, params: dict[str, str] | None = None) -> list[JsonDict]:
-        headers = {**self._headers, "Prefer": "return=representation,resolution=merge-duplicates"}
-        async with httpx.AsyncClient(base_url=self._rest_url, headers=headers, timeout=10.0) as client:
-            response = await client.post(path, params=params, json=body)
+    async def _patch(
+        self,
+        path: str,
+        body: JsonDict,
+        *,
+        params: dict[str, str],
+        returning: Returning = "representation",
+    ) -> list[JsonDict]:
+        headers = {"Prefer": f"return={returning}"}
+        response = await self._client.patch(path, params=params, json=body, headers=headers)
         return self._handle_response(response)
 
-    async def _patch(self, path: str, body: JsonDict, *, params: dict[str, str]) -> list[JsonDict]:
-        headers = {**self._headers, "Prefer": "return=representation"}
-        async with httpx.AsyncClient(base_url=self._rest_url, headers=headers, timeout=10.0) as client:
-            response = await client.patch(path, params=params, json=body)
+    async def rpc(self, function: str, params: JsonDict) -> list[JsonDict]:
+        """Call a Postgres function exposed by PostgREST."""
+        response = await self._client.post(f"/rpc/{function}", json=params)
         return self._handle_response(response)
 
+    async def _delete(self, path: str, *, params: dict[str, str]) -> None:
+        response = await self._client.delete(path, params=params, headers={"Prefer": "return=minimal"})
+        self._handle_response(response)
+
     @staticmethod
     def _handle_response(response: httpx.Response) -> list[JsonDict]:
         if response.status_code >= 400:
             detail = response.json() if response.headers.get("content-type", "").startswith("application/json") else response.text
+            # Errors raised by our own functions with SQLSTATE PTxyz carry the HTTP status xyz
+            # and a message meant for the client
+            if isinstance(detail, dict) and str(detail.get("code", "")).startswith("PT"):
+                detail = detail.get("message") or detail
             raise HTTPException(status_code=response.status_code, detail=detail)
-        if response.status_code == status.HTTP_204_NO_CONTENT:
+        if response.status_code == status.HTTP_204_NO_CONTENT or not response.content:
             return []
         payload = response.json()
         if isinstance(payload, list):
@@ -139,3 +556,16 @@ class SupabaseService:
         if isinstance(payload, dict):
             return [payload]
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Unexpected Supabase response format")
+
+
+async def _encode_rows(rows: Sequence[JsonDict], *, wrap: str | None = None) -> AsyncIterator[bytes]:
+    if wrap is not None:
+        yield b"{" + json.dumps(wrap).encode() + b":"
+    yield b"["
+    for index, row in enumerate(rows):
+        if index:
+            yield b","
+        yield json.dumps(row, separators=(",", ":"), default=str).encode()
+    yield b"]"
+    if wrap is not None:
+        yield b"}"
@@ -0,0 +1,211 @@
+"""In-process exact vector search over the active ``document_embeddings`` rows."""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import os
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+from langchain_core.documents import Document
+
+from app.core.config import Settings
+from app.services.retrieval import RetrievalFilters, RetrievalQuery, to_document
+from app.services.supabase import JsonDict, SupabaseService
+
+# Changed documents downloaded concurrently during a refresh
+REFRESH_DOWNLOADS = 8
+
+
+@dataclass(slots=True)
+class DocumentBlock:
+    """The chunks of one active document: unit-normalised embeddings plus their rows."""
+
+    fingerprint: str
+    category: str | None
+    vectors: np.ndarray
+    rows: list[JsonDict]
+
+
+def parse_embedding(value: Any) -> np.ndarray:
+    """pgvector columns arrive from PostgREST as ``"[0.1,0.2,...]"`` strings."""
+    if isinstance(value, str):
+        value = json.loads(value)
+    return np.asarray(value, dtype=np.float32)
+
+
+class InMemoryChunkRetriever:
+    """
+    Exact cosine top-k over a contiguous float32 matrix of every searchable chunk.
+
+    The matrix is loaded on first use and refreshed at most every
+    ``rag_memory_index_refresh_seconds``: ``document_chunk_fingerprints`` reports each active
+    document's version and chunk fingerprint, and only documents whose fingerprint changed are
+    re-downloaded; deactivated documents are dropped. With ``rag_memory_index_path`` the matrix
+    is published as an ``.npy`` file named after the corpus it holds and memory-mapped read-only
+    (see :meth:`_share`), so worker processes on the host that loaded the same corpus map the
+    same file and share its pages.
+
+    Rows are unit-normalised, so similarity is a single matrix-vector product; filters are
+    boolean masks over the same rows, matching ``match_document_chunks``.
+    """
+
+    def __init__(self, settings: Settings, supabase: SupabaseService):
+        self.settings = settings
+        self._supabase = supabase
+        self._blocks: dict[str, DocumentBlock] = {}
+        self._matrix = np.empty((0, 0), dtype=np.float32)
+        self._rows: list[JsonDict] = []
+        self._document_ids = np.empty(0, dtype=object)
+        self._categories = np.empty(0, dtype=object)
+        self._law_names = np.empty(0, dtype=object)
+        self._checked_at = float("-inf")
+        self._lock = asyncio.Lock()
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    async def search(self, query: RetrievalQuery) -> list[Document]:
+        return (await self.search_many([query]))[0]
+
+    async def search_many(self, queries: list[RetrievalQuery]) -> list[list[Document]]:
+        """Top-k for many queries with one matrix product."""
+        await self.refresh()
+        if not self._rows or not queries:
+            return [[] for _ in queries]
+
+        vectors = np.asarray([query.embedding for query in queries], dtype=np.float32)
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        scores = vectors @ self._matrix.T
+        return [self._top_k(row_scores, query) for row_scores, query in zip(scores, queries)]
+
+    def mark_stale(self) -> None:
+        """Check the fingerprints again on the next search (e.g. after a local ingest)."""
+        self._checked_at = float("-inf")
+
+    async def refresh(self, *, force: bool = False) -> None:
+        now = time.monotonic()
+        if not force and now - self._checked_at < self.settings.rag_memory_index_refresh_seconds:
+            return
+        async with self._lock:
+            if not force and time.monotonic() - self._checked_at < self.settings.rag_memory_index_refresh_seconds:
+                return
+            documents = await self._supabase.rpc("document_chunk_fingerprints", {})
+            active = {str(doc["document_id"]): doc for doc in documents}
+            changed = [
+                document_id
+                for document_id, doc in active.items()
+                if document_id not in self._blocks
+                or self._blocks[document_id].fingerprint != f"{doc['version']}:{doc['fingerprint']}"
+            ]
+            removed = [document_id for document_id in self._blocks if document_id not in active]
+            for document_id in removed:
+                del self._blocks[document_id]
+            for start in range(0, len(changed), REFRESH_DOWNLOADS):
+                group = changed[start : start + REFRESH_DOWNLOADS]
+                blocks = await self._supabase.gather(*(self._load_block(active[document_id]) for document_id in group))
+                self._blocks.update(zip(group, blocks))
+            if changed or removed:
+                (
+                    self._matrix,
+                    self._rows,
+                    self._document_ids,
+                    self._categories,
+                    self._law_names,
+                ) = await asyncio.to_thread(self._build_index)
+            self._checked_at = time.monotonic()
+
+    async def _load_block(self, doc: JsonDict) -> DocumentBlock:
+        rows: list[JsonDict] = []
+        vectors: list[np.ndarray] = []
+        async for row in self._supabase.fetch_document_chunk_embeddings(str(doc["document_id"])):
+            vectors.append(parse_embedding(row.pop("embedding")))
+            rows.append(row)
+        matrix = np.vstack(vectors) if vectors else np.empty((0, 0), dtype=np.float32)
+        if len(matrix):
+            matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+        return DocumentBlock(f"{doc['version']}:{doc['fingerprint']}", doc.get("category"), matrix, rows)
+
+    def _build_index(self) -> tuple[np.ndarray, list[JsonDict], np.ndarray, np.ndarray, np.ndarray]:
+        """Concatenate the blocks; runs in a thread and is swapped in by the caller at once."""
+        # Sorted so every process lays out the same corpus identically
+        blocks = [(document_id, self._blocks[document_id]) for document_id in sorted(self._blocks)]
+        blocks = [(document_id, block) for document_id, block in blocks if block.rows]
+        rows = [row for _, block in blocks for row in block.rows]
+        matrix = np.ascontiguousarray(
+            np.vstack([block.vectors for _, block in blocks]) if blocks else np.empty((0, 0)),
+            dtype=np.float32,
+        )
+        document_ids = np.asarray([str(row["document_id"]) for row in rows], dtype=object)
+        categories = np.asarray([block.category for _, block in blocks for _ in block.rows], dtype=object)
+        law_names = np.asarray([(row.get("metadata") or {}).get("law_name") for row in rows], dtype=object)
+
+        if self.settings.rag_memory_index_path and len(matrix):
+            corpus = [f"{document_id}:{block.fingerprint}" for document_id, block in blocks]
+            matrix = self._share(matrix, corpus)
+        return matrix, rows, document_ids, categories, law_names
+
+    def _share(self, matrix: np.ndarray, corpus: list[str]) -> np.ndarray:
+        """
+        Memory-map the copy of ``matrix`` published for ``corpus`` by the first process to build it.
+
+        The file name is derived from the corpus and the matrix shape, so every process that
+        loaded the same documents arrives at the same file. It is created with ``os.link``, which
+        never replaces an existing file: when another process published it first, this copy is
+        discarded and the existing file is mapped. Files of older corpora are removed by the
+        process that publishes a newer one; processes still mapping them keep their pages until
+        their next refresh.
+        """
+        base = Path(self.settings.rag_memory_index_path)
+        key = hashlib.sha256("\n".join([str(matrix.shape), *corpus]).encode()).hexdigest()[:16]
+        target = base.with_name(f"{base.stem}.{key}.npy")
+        if not target.exists():
+            target.parent.mkdir(parents=True, exist_ok=True)
+            temporary = target.with_name(f"{target.name}.{os.getpid()}.tmp")
+            with open(temporary, "wb") as file:
+                np.save(file, matrix)
+            try:
+                os.link(temporary, target)
+            except FileExistsError:
+                pass
+            else:
+                for stale in target.parent.glob(f"{base.stem}.*.npy"):
+                    if stale == target:
+                        continue
+                    try:
+                        stale.unlink(missing_ok=True)
+                    except OSError:  # still mapped on platforms that lock mapped files
+                        pass
+            finally:
+                temporary.unlink()
+        try:
+            return np.load(target, mmap_mode="r")
+        except FileNotFoundError:
+            # Removed by a process that already moved on to a newer corpus; serve this copy
+            return matrix
+
+    def _top_k(self, scores: np.ndarray, query: RetrievalQuery) -> list[Document]:
+        mask = scores > self.settings.rag_match_threshold
+        mask &= self._filter_mask(query.filters)
+        candidates = np.flatnonzero(mask)
+        if not len(candidates):
+            return []
+        k = min(query.k, len(candidates))
+        top = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+        top = top[np.argsort(-scores[top])]
+        return [to_document({**self._rows[index], "similarity": float(scores[index])}) for index in top]
+
+    def _filter_mask(self, filters: RetrievalFilters) -> np.ndarray:
+        mask = np.ones(len(self._rows), dtype=bool)
+        if filters.document_ids:
+            mask &= np.isin(self._document_ids, list(filters.document_ids))
+        if filters.categories:
+            mask &= np.isin(self._categories, list(filters.categories))
+        if filters.law_names:
+            mask &= np.isin(self._law_names, list(filters.law_names))
+        return mask
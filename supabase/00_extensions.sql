@@ -1,5 +1,6 @@
 -- Extensions required by the project
 create extension if not exists pgcrypto;
 create extension if not exists vector;
+create extension if not exists pg_trgm;
 
 
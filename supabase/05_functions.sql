@@ -27,8 +27,24 @@ as $$
 $$;
 
 
+-- Type of a RAG table's embedding column, e.g. 'vector(1536)' or 'halfvec(512)'.
+-- Search functions build their queries for it so the vector index matches after
+-- migrate_embedding_storage() changed the storage type or dimension.
+create or replace function public.embedding_column_type(p_table regclass)
+returns text
+language sql
+stable
+as $$
+  select format_type(a.atttypid, a.atttypmod)
+  from pg_attribute a
+  where a.attrelid = p_table
+    and a.attname = 'embedding'
+    and not a.attisdropped;
+$$;
+
+
 create or replace function public.match_legal_documents(
-  query_embedding vector(1536),
+  query_embedding vector,
   match_count integer default 5,
   metadata_filter jsonb default '{}'::jsonb
 )
@@ -41,17 +57,126 @@ returns table (
 language plpgsql
 stable
 as $$
+declare
+  column_type text := public.embedding_column_type('public.legal_documents');
+begin
+  return query execute format(
+    'select ld.id, ld.content, ld.metadata, 1 - (ld.embedding <=> $1::%1$s) as similarity
+     from public.legal_documents ld
+     where $3 = ''{}''::jsonb or ld.metadata @> $3
+     order by ld.embedding <=> $1::%1$s
+     limit $2',
+    column_type
+  ) using query_embedding, match_count, metadata_filter;
+end;
+$$;
+
+
+-- Bulk AI answer write used by the answer backfill: p_answers = [{"id": ..., "ai_answer": {...}}]
+create or replace function public.set_questions_ai_answers(p_answers jsonb)
+returns void
+language plpgsql
+as $$
+begin
+  update public.questions q
+  set ai_answer = a.ai_answer
+  from jsonb_to_recordset(p_answers) as a(id uuid, ai_answer jsonb)
+  where q.id = a.id;
+end;
+$$;
+
+revoke all on function public.set_questions_ai_answers(jsonb) from public, anon, authenticated;
+
+
+-- Lease on generating a pending AI answer, so a question is answered by one backend process
+-- even when every worker re-scans the pending questions. p_worker may take a question nobody
+-- holds, renew its own lease, or take over a lease that expired because its holder died.
+-- Returns whether p_worker holds the lease, with the current ai_answer so a process that lost
+-- can tell when the holder has settled it. Concurrent claims serialize on the row lock and
+-- re-check the condition, so exactly one wins.
+create or replace function public.claim_ai_answer(
+  p_question_id uuid,
+  p_worker text,
+  p_lease_seconds double precision
+)
+returns table (claimed boolean, current_ai_answer jsonb)
+language plpgsql
+as $$
 begin
   return query
-  select
-    ld.id,
-    ld.content,
-    ld.metadata,
-    1 - (ld.embedding <=> query_embedding) as similarity
-  from public.legal_documents ld
-  where metadata_filter = '{}'::jsonb or ld.metadata @> metadata_filter
-  order by ld.embedding <=> query_embedding
-  limit match_count;
+  with won as (
+    update public.questions q
+    set ai_answer_claimed_by = p_worker,
+        ai_answer_claimed_until = now() + make_interval(secs => p_lease_seconds)
+    where q.id = p_question_id
+      and q.ai_answer->>'status' = 'pending'
+      and (
+        q.ai_answer_claimed_by is null
+        or q.ai_answer_claimed_by = p_worker
+        or q.ai_answer_claimed_until < now()
+      )
+    returning q.ai_answer
+  )
+  select true, won.ai_answer from won;
+
+  if not found then
+    return query
+    select false, q.ai_answer
+    from public.questions q
+    where q.id = p_question_id;
+  end if;
+end;
+$$;
+
+revoke all on function public.claim_ai_answer(uuid, text, double precision) from public, anon, authenticated;
+
+
+-- Lawyer answer: check approval, debit the answer price and insert the answer in one
+-- transaction. The profile row is locked so concurrent answers cannot both spend the same
+-- balance. Errors use SQLSTATE PTxyz, which PostgREST returns as HTTP status xyz.
+-- Returns jsonb and declares its rows as record rather than public.answers or
+-- public.lawyer_profiles%rowtype because this file runs before the tables exist.
+create or replace function public.create_paid_answer(
+  p_question_id uuid,
+  p_lawyer_id uuid,
+  p_content text,
+  p_price integer default 1000
+)
+returns jsonb
+language plpgsql
+as $$
+declare
+  profile record;
+  answer record;
+begin
+  select * into profile
+  from public.lawyer_profiles
+  where user_id = p_lawyer_id
+  for update;
+
+  if not found then
+    raise exception 'Lawyer profile not found' using errcode = 'PT403';
+  end if;
+  if profile.verification_status <> 'approved' then
+    raise exception 'Lawyer is not approved' using errcode = 'PT403';
+  end if;
+  if profile.balance < p_price then
+    raise exception 'Insufficient balance (% required)', p_price using errcode = 'PT402';
+  end if;
+  if not exists (select 1 from public.questions where id = p_question_id) then
+    raise exception 'Question not found' using errcode = 'PT404';
+  end if;
+
+  update public.lawyer_profiles
+  set balance = balance - p_price
+  where id = profile.id;
+
+  insert into public.answers (question_id, lawyer_id, content)
+  values (p_question_id, p_lawyer_id, p_content)
+  returning * into answer;
+
+  return to_jsonb(answer);
 end;
 $$;
 
+revoke all on function public.create_paid_answer(uuid, uuid, text, integer) from public, anon, authenticated;
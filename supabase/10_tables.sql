@@ -32,6 +32,16 @@ create table if not exists public.questions (
 );
 
 create index if not exists idx_questions_user_created_at on public.questions (user_id, created_at desc);
+-- Keyset pagination of GET /questions on (created_at, id), optionally within a category
+create index if not exists idx_questions_created_at_id on public.questions (created_at desc, id desc);
+create index if not exists idx_questions_category_created_at_id on public.questions (category, created_at desc, id desc);
+-- Background AI answer jobs re-enqueue questions still marked pending on startup
+create index if not exists idx_questions_ai_answer_pending on public.questions (created_at)
+  where ai_answer->>'status' = 'pending';
+-- Lease on generating a pending AI answer (see claim_ai_answer), so only one backend process
+-- works on each question
+alter table public.questions add column if not exists ai_answer_claimed_by text;
+alter table public.questions add column if not exists ai_answer_claimed_until timestamptz;
 
 -- Answers (lawyer answers)
 create table if not exists public.answers (
@@ -55,6 +65,11 @@ create table if not exists public.documents (
   created_at timestamptz not null default now()
 );
 
+-- Optional grouping used to scope RAG retrieval (e.g. 임대차, 매매)
+alter table public.documents add column if not exists category text;
+-- Retrieval only searches active versions
+create index if not exists idx_documents_active_category on public.documents (category) where is_active;
+
 
 -- Vector store for LangChain RAG
 create table if not exists public.legal_documents (
@@ -64,5 +79,7 @@ create table if not exists public.legal_documents (
   embedding vector(1536) not null
 );
 
-create index if not exists idx_legal_documents_embedding on public.legal_documents using ivfflat (embedding vector_cosine_ops) with (lists = 100);
+drop index if exists public.idx_legal_documents_embedding;
+create index if not exists idx_legal_documents_embedding_hnsw on public.legal_documents
+  using hnsw (embedding vector_cosine_ops) with (m = 16, ef_construction = 64);
 
@@ -6,28 +6,212 @@ create table if not exists document_embeddings (
   document_id uuid references documents(id) on delete cascade,
   chunk_index integer not null,
   content text not null,
-  embedding vector(1536), -- OpenAI ada-002 embedding dimension
+  embedding vector(1536), -- OpenAI ada-002 embedding dimension; see migrate_embedding_storage()
   metadata jsonb default '{}',
   created_at timestamptz default now(),
   
   constraint unique_document_chunk unique (document_id, chunk_index)
 );
 
--- Index for faster vector similarity search
-create index if not exists idx_document_embeddings_vector 
-  on document_embeddings 
-  using ivfflat (embedding vector_cosine_ops)
-  with (lists = 100);
+-- sha256 of content, used by incremental re-ingestion to keep unchanged chunks
+alter table document_embeddings add column if not exists content_hash text;
+
+-- HNSW index for vector similarity search. Unlike the previous ivfflat index (lists = 100,
+-- built on an empty table) it needs no training data and keeps recall as rows are added.
+-- Query-time recall/latency is tuned with hnsw.ef_search (see match_document_chunks);
+-- use rebuild_vector_index() to rebuild with parameters sized for the current row count.
+drop index if exists idx_document_embeddings_vector;
+create index if not exists idx_document_embeddings_embedding_hnsw
+  on document_embeddings
+  using hnsw (embedding vector_cosine_ops)
+  with (m = 16, ef_construction = 64);
 
 -- Index for document lookup
 create index if not exists idx_document_embeddings_document_id 
   on document_embeddings(document_id);
 
+-- Trigram index for the keyword half of hybrid_search_document_chunks. Trigrams match
+-- inside Korean words, so 확정일자 also finds 확정일자를 / 확정일자부.
+create index if not exists idx_document_embeddings_content_trgm
+  on document_embeddings
+  using gin (content gin_trgm_ops);
+
+-- Supports the law-name filter of match_document_chunks
+create index if not exists idx_document_embeddings_law_name
+  on document_embeddings ((metadata->>'law_name'));
+
+-- Background ingestion jobs (progress + resumability)
+-- After a full-mode job has cleared the document (chunks_cleared), chunks present in
+-- document_embeddings for (document_id, chunk_index) act as its checkpoints, so a resumed job
+-- only embeds what is missing.
+create table if not exists ingest_jobs (
+  id uuid primary key default gen_random_uuid(),
+  document_id uuid not null references documents(id) on delete cascade,
+  status text not null default 'queued' check (status in ('queued','running','succeeded','failed')),
+  mode text not null default 'full' check (mode in ('full','incremental')),
+  file_name text,
+  spool_path text,
+  pages_total integer not null default 0,
+  pages_parsed integer not null default 0,
+  chunks_created integer not null default 0,
+  chunks_embedded integer not null default 0,
+  chunks_stored integer not null default 0,
+  chunks_reused integer not null default 0,
+  chunks_deleted integer not null default 0,
+  attempts integer not null default 0,
+  error text,
+  created_by uuid references users(id) on delete set null,
+  created_at timestamptz not null default now(),
+  updated_at timestamptz not null default now()
+);
+
+-- Set once a full-mode job has deleted the document's previous chunks. Only from then on are
+-- stored chunks this job's own checkpoints; before it, they belong to the previous upload.
+alter table ingest_jobs add column if not exists chunks_cleared boolean not null default false;
+
+create index if not exists idx_ingest_jobs_unfinished
+  on ingest_jobs (created_at)
+  where status in ('queued','running');
+
+-- Lease on running an ingest job (see claim_ingest_job). The holder renews it while the job
+-- runs; a lease left by a process that died expires and the job is picked up elsewhere.
+alter table ingest_jobs add column if not exists claimed_by text;
+alter table ingest_jobs add column if not exists claimed_until timestamptz;
+
+-- Take or renew the lease on an unfinished ingest job. Returns the job when p_worker holds the
+-- lease and nothing when another live process does, so only one process runs each job.
+create or replace function claim_ingest_job(
+  p_job_id uuid,
+  p_worker text,
+  p_lease_seconds double precision
+)
+returns setof ingest_jobs
+language sql
+as $$
+  update ingest_jobs
+  set claimed_by = p_worker,
+      claimed_until = now() + make_interval(secs => p_lease_seconds)
+  where id = p_job_id
+    and status in ('queued', 'running')
+    and (claimed_by is null or claimed_by = p_worker or claimed_until < now())
+  returning *;
+$$;
+
+revoke all on function claim_ingest_job(uuid, text, double precision) from public, anon, authenticated;
+
+-- Incremental re-ingestion: delete chunks that disappeared from the new version and move
+-- reused/new chunks into their final chunk_index in one transaction. New chunks are written
+-- beforehand at the temporary index -(chunk_index + 1) so they never collide with live rows.
+create or replace function apply_document_chunk_diff(
+  p_document_id uuid,
+  p_delete_ids uuid[] default '{}',
+  p_moves jsonb default '[]'::jsonb
+)
+returns void
+language plpgsql
+as $$
+begin
+  delete from document_embeddings
+  where document_id = p_document_id
+    and id = any(p_delete_ids);
+
+  update document_embeddings de
+  set chunk_index = -m.chunk_index - 1
+  from jsonb_to_recordset(p_moves) as m(id uuid, chunk_index integer)
+  where de.id = m.id
+    and de.document_id = p_document_id;
+
+  update document_embeddings
+  set chunk_index = -chunk_index - 1,
+      metadata = jsonb_set(coalesce(metadata, '{}'::jsonb), '{chunk_index}', to_jsonb(-chunk_index - 1))
+  where document_id = p_document_id
+    and chunk_index < 0;
+end;
+$$;
+
+revoke all on function apply_document_chunk_diff(uuid, uuid[], jsonb) from public, anon, authenticated;
+
+-- Nearest chunks of active documents by cosine distance, shared by the search functions below.
+-- The query is built for the column's current type (see migrate_embedding_storage), so the
+-- HNSW/ivfflat index is used whether embeddings are stored as vector or halfvec. With
+-- quantized = true the binary-quantized index (rebuild_vector_index(..., 'binary')) returns a
+-- Hamming-distance shortlist of candidate_count * oversample rows, which is re-scored with the
+-- exact cosine distance. The filters are applied while walking the index, so they never eat
+-- into candidate_count. query_embedding must have the column's dimension.
+create or replace function document_chunk_candidates(
+  query_embedding vector,
+  candidate_count int,
+  filter_document_ids uuid[] default null,
+  filter_categories text[] default null,
+  filter_law_names text[] default null,
+  quantized boolean default false,
+  oversample int default 4
+)
+returns table (
+  id uuid,
+  distance float
+)
+language plpgsql
+stable
+as $$
+declare
+  column_type text := embedding_column_type('document_embeddings');
+  filters text := '
+      d.is_active
+      and e.chunk_index >= 0
+      and ($2 is null or e.document_id = any($2))
+      and ($3 is null or d.category = any($3))
+      and ($4 is null or e.metadata->>''law_name'' = any($4))';
+begin
+  if quantized then
+    return query execute format(
+      'select s.id, (s.embedding <=> $1::%1$s)::float as distance
+       from (
+         select e.id, e.embedding
+         from document_embeddings e
+         join documents d on d.id = e.document_id
+         where %2$s
+         order by binary_quantize(e.embedding)::bit(%3$s) <~> binary_quantize($1::%1$s)
+         limit $5 * $6
+       ) s
+       order by distance
+       limit $5',
+      column_type, filters, vector_dims(query_embedding)
+    ) using query_embedding, filter_document_ids, filter_categories, filter_law_names,
+            candidate_count, oversample;
+  else
+    return query execute format(
+      'select e.id, (e.embedding <=> $1::%1$s)::float as distance
+       from document_embeddings e
+       join documents d on d.id = e.document_id
+       where %2$s
+       order by e.embedding <=> $1::%1$s
+       limit $5',
+      column_type, filters
+    ) using query_embedding, filter_document_ids, filter_categories, filter_law_names,
+            candidate_count;
+  end if;
+end;
+$$;
+
 -- Function to search similar document chunks
+-- Only chunks of active documents are searched; the optional filters narrow the search further
+-- (null = no filter). ef_search applies to HNSW indexes, probes to ivfflat; both only for
+-- this transaction.
+drop function if exists match_document_chunks(vector, float, int);
+drop function if exists match_document_chunks(vector, float, int, int, int);
+drop function if exists match_document_chunks(vector, float, int, int, int, uuid[], text[], text[]);
 create or replace function match_document_chunks(
-  query_embedding vector(1536),
+  query_embedding vector,
   match_threshold float default 0.7,
-  match_count int default 5
+  match_count int default 5,
+  ef_search int default 40,
+  probes int default 10,
+  filter_document_ids uuid[] default null,
+  filter_categories text[] default null,
+  filter_law_names text[] default null,
+  quantized boolean default false,
+  oversample int default 4
 )
 returns table (
   id uuid,
@@ -40,17 +224,302 @@ returns table (
 language plpgsql
 as $$
 begin
+  -- The quantized shortlist is oversample times longer than the final result
+  perform set_config(
+    'hnsw.ef_search',
+    greatest(ef_search, match_count * case when quantized then oversample else 1 end)::text,
+    true
+  );
+  perform set_config('ivfflat.probes', probes::text, true);
+  -- pgvector >= 0.8 keeps scanning the index until enough rows pass the filters
+  begin
+    perform set_config('hnsw.iterative_scan', 'relaxed_order', true);
+    perform set_config('ivfflat.iterative_scan', 'relaxed_order', true);
+  exception when others then
+    null;
+  end;
+
+  return query
+  select
+    e.id,
+    e.document_id,
+    e.chunk_index,
+    e.content,
+    e.metadata,
+    1 - c.distance as similarity
+  from document_chunk_candidates(
+    query_embedding, match_count, filter_document_ids, filter_categories, filter_law_names,
+    quantized, oversample
+  ) c
+  join document_embeddings e on e.id = c.id
+  where 1 - c.distance > match_threshold
+  order by c.distance;
+end;
+$$;
+
+-- Hybrid search: vector and keyword candidates of the same chunk set in one round trip.
+-- Each row carries its rank in either list (null when absent) so the caller can fuse them,
+-- e.g. with reciprocal-rank fusion. Keyword candidates contain at least one of the keywords
+-- and are ranked by how many they contain, then by trigram word similarity. similarity is
+-- null for chunks that only matched the keywords. Only keywords of three or more characters
+-- can be served by the trigram index, so they select candidates from the whole corpus; shorter
+-- ones (전세, 신청) are matched with strpos on those candidates and on the vector hits, which
+-- keeps every keyword query on the index instead of scanning all chunks.
+drop function if exists hybrid_search_document_chunks(vector, text[], float, int, int, int, uuid[], text[], text[]);
+create or replace function hybrid_search_document_chunks(
+  query_embedding vector,
+  keywords text[],
+  match_threshold float default 0.7,
+  candidate_count int default 20,
+  ef_search int default 40,
+  probes int default 10,
+  filter_document_ids uuid[] default null,
+  filter_categories text[] default null,
+  filter_law_names text[] default null,
+  quantized boolean default false,
+  oversample int default 4
+)
+returns table (
+  id uuid,
+  document_id uuid,
+  chunk_index integer,
+  content text,
+  metadata jsonb,
+  similarity float,
+  vector_rank integer,
+  keyword_rank integer
+)
+language plpgsql
+as $$
+declare
+  keyword_pattern text;
+  keyword_text text := array_to_string(keywords, ' ');
+begin
+  perform set_config(
+    'hnsw.ef_search',
+    greatest(ef_search, candidate_count * case when quantized then oversample else 1 end)::text,
+    true
+  );
+  perform set_config('ivfflat.probes', probes::text, true);
+  begin
+    perform set_config('hnsw.iterative_scan', 'relaxed_order', true);
+    perform set_config('ivfflat.iterative_scan', 'relaxed_order', true);
+  exception when others then
+    null;
+  end;
+
+  -- Alternation of the escaped keywords the trigram index can serve (at least one trigram)
+  select string_agg(regexp_replace(k, '([.^$*+?()\[\]{}|\\])', '\\\1', 'g'), '|')
+    into keyword_pattern
+    from unnest(keywords) k
+    where length(k) >= 3;
+
   return query
+  with vector_hits as (
+    select
+      c.id,
+      1 - c.distance as similarity,
+      (row_number() over (order by c.distance))::integer as rank
+    from document_chunk_candidates(
+      query_embedding, candidate_count, filter_document_ids, filter_categories, filter_law_names,
+      quantized, oversample
+    ) c
+    where 1 - c.distance > match_threshold
+  ),
+  keyword_candidates as (
+    select e.id
+    from document_embeddings e
+    where keyword_pattern is not null
+      and e.content ~ keyword_pattern
+    union
+    select v.id
+    from vector_hits v
+  ),
+  keyword_hits as (
+    select
+      ranked.id,
+      (row_number() over (order by ranked.matched desc, ranked.score desc))::integer as rank
+    from (
+      select scored.id, scored.matched, scored.score
+      from (
+        select
+          e.id,
+          (
+            select count(*) from unnest(keywords) k where length(k) > 0 and strpos(e.content, k) > 0
+          ) as matched,
+          word_similarity(keyword_text, e.content) as score
+        from keyword_candidates kc
+        join document_embeddings e on e.id = kc.id
+        join documents d on d.id = e.document_id
+        where d.is_active
+          and e.chunk_index >= 0
+          and (filter_document_ids is null or e.document_id = any(filter_document_ids))
+          and (filter_categories is null or d.category = any(filter_categories))
+          and (filter_law_names is null or e.metadata->>'law_name' = any(filter_law_names))
+      ) scored
+      where scored.matched > 0
+      order by scored.matched desc, scored.score desc
+      limit candidate_count
+    ) ranked
+  )
   select
-    document_embeddings.id,
-    document_embeddings.document_id,
-    document_embeddings.chunk_index,
-    document_embeddings.content,
-    document_embeddings.metadata,
-    1 - (document_embeddings.embedding <=> query_embedding) as similarity
-  from document_embeddings
-  where 1 - (document_embeddings.embedding <=> query_embedding) > match_threshold
-  order by document_embeddings.embedding <=> query_embedding
-  limit match_count;
+    e.id,
+    e.document_id,
+    e.chunk_index,
+    e.content,
+    e.metadata,
+    v.similarity,
+    v.rank as vector_rank,
+    k.rank as keyword_rank
+  from vector_hits v
+  full outer join keyword_hits k on k.id = v.id
+  join document_embeddings e on e.id = coalesce(v.id, k.id);
 end;
 $$;
+
+-- Per-document fingerprint of the searchable chunks, used by the in-process retriever to
+-- reload only documents whose version or chunks changed since its last refresh.
+create or replace function document_chunk_fingerprints()
+returns table (
+  document_id uuid,
+  version integer,
+  category text,
+  chunk_count integer,
+  fingerprint text
+)
+language sql
+stable
+as $$
+  select
+    d.id,
+    d.version,
+    d.category,
+    count(e.id)::integer,
+    md5(coalesce(string_agg(e.id::text || ':' || e.chunk_index, ',' order by e.id), ''))
+  from documents d
+  left join document_embeddings e on e.document_id = d.id and e.chunk_index >= 0
+  where d.is_active
+  group by d.id, d.version, d.category;
+$$;
+
+-- Rebuild the vector index of a RAG table with explicit parameters.
+-- Called by `python -m app.cli reindex`, which sizes the parameters from the row count. The
+-- operator class follows the column type (vector or halfvec). 'binary' builds the Hamming
+-- HNSW index over binary_quantize(embedding) used by quantized search; it is kept next to
+-- the exact index rather than replacing it, since the shortlist is re-scored from the column.
+create or replace function rebuild_vector_index(
+  p_table text,
+  p_method text default 'hnsw',
+  p_m int default 16,
+  p_ef_construction int default 64,
+  p_lists int default 100
+)
+returns table (index_name text)
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+  new_index text := format('idx_%s_embedding_%s', p_table, p_method);
+  column_type text;
+  options text;
+begin
+  if p_table not in ('document_embeddings', 'legal_documents') then
+    raise exception 'unsupported table %', p_table;
+  end if;
+  column_type := embedding_column_type(p_table::regclass);
+
+  if p_method in ('hnsw', 'binary') then
+    options := format('m = %s, ef_construction = %s', p_m, p_ef_construction);
+  elsif p_method = 'ivfflat' then
+    options := format('lists = %s', p_lists);
+  else
+    raise exception 'unsupported index method %', p_method;
+  end if;
+
+  perform set_config('maintenance_work_mem', '512MB', true);
+  if p_method = 'binary' then
+    execute format('drop index if exists %I', new_index);
+    execute format(
+      'create index %I on %I using hnsw ((binary_quantize(embedding)::bit(%s)) bit_hamming_ops) with (%s)',
+      new_index, p_table, substring(column_type from '\((\d+)\)'), options
+    );
+  else
+    execute format('drop index if exists %I', format('idx_%s_embedding_hnsw', p_table));
+    execute format('drop index if exists %I', format('idx_%s_embedding_ivfflat', p_table));
+    execute format(
+      'create index %I on %I using %s (embedding %s) with (%s)',
+      new_index, p_table, p_method,
+      case when column_type like 'halfvec%' then 'halfvec_cosine_ops' else 'vector_cosine_ops' end,
+      options
+    );
+  end if;
+  return query select new_index;
+end;
+$$;
+
+revoke all on function rebuild_vector_index(text, text, int, int, int) from public, anon, authenticated;
+
+-- Change the storage type and/or dimension of a RAG table's embedding column in place.
+-- 'halfvec' stores 16-bit floats, halving rows and index. A smaller p_dimensions keeps the
+-- leading components and re-normalises them, which preserves ranking only for
+-- text-embedding-3 embeddings; ada-002 embeddings have to be re-ingested with the new model
+-- instead. Vector indexes depend on the column type, so they are dropped and the HNSW index
+-- is rebuilt with default parameters (run `reindex` afterwards to size it, and
+-- `reindex --method binary` to restore quantized search). Called by
+-- `python -m app.cli migrate-embeddings`.
+create or replace function migrate_embedding_storage(
+  p_table text,
+  p_storage text default 'halfvec',
+  p_dimensions int default null
+)
+returns table (column_type text)
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+  current_type text;
+  current_dimensions int;
+  target_dimensions int;
+  target_type text;
+  conversion text;
+  method text;
+begin
+  if p_table not in ('document_embeddings', 'legal_documents') then
+    raise exception 'unsupported table %', p_table;
+  end if;
+  if p_storage not in ('vector', 'halfvec') then
+    raise exception 'unsupported storage %', p_storage;
+  end if;
+
+  current_type := embedding_column_type(p_table::regclass);
+  current_dimensions := substring(current_type from '\((\d+)\)')::int;
+  target_dimensions := coalesce(p_dimensions, current_dimensions);
+  if target_dimensions > current_dimensions then
+    raise exception 'cannot grow % embeddings from % to % dimensions; re-ingest instead',
+      p_table, current_dimensions, target_dimensions;
+  end if;
+  target_type := format('%s(%s)', p_storage, target_dimensions);
+  if target_type = current_type then
+    return query select current_type;
+    return;
+  end if;
+
+  if target_dimensions < current_dimensions then
+    conversion := format('l2_normalize(subvector(embedding::vector, 1, %s))::%s', target_dimensions, target_type);
+  else
+    conversion := format('embedding::vector::%s', target_type);
+  end if;
+
+  perform set_config('maintenance_work_mem', '512MB', true);
+  foreach method in array array['hnsw', 'ivfflat', 'binary'] loop
+    execute format('drop index if exists %I', format('idx_%s_embedding_%s', p_table, method));
+  end loop;
+  execute format('alter table %I alter column embedding type %s using %s', p_table, target_type, conversion);
+  perform rebuild_vector_index(p_table);
+  return query select target_type;
+end;
+$$;
+
+revoke all on function migrate_embedding_storage(text, text, int) from public, anon, authenticated;
@@ -139,3 +139,11 @@ create policy documents_delete on public.documents
   for delete using (public.is_admin());
 
 
+-- ingest_jobs (admin only; the backend uses the service role)
+alter table if exists public.ingest_jobs enable row level security;
+alter table if exists public.ingest_jobs force row level security;
+
+drop policy if exists ingest_jobs_admin on public.ingest_jobs;
+create policy ingest_jobs_admin on public.ingest_jobs
+  for all using (public.is_admin()) with check (public.is_admin());
+